@@ -1,4 +1,5 @@
 import asyncio
+import re
 from logging.config import fileConfig
 
 from alembic import context
@@ -28,6 +29,18 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = models.BaseModel.metadata
 
+# Monthly posts partitions are created at runtime, see migration 0007
+POSTS_PARTITION_NAME = re.compile(r"^posts_(\d{4}_\d{2}|default)$")
+
+
+def include_object(object_, name, type_, reflected, compare_to):
+    if type_ == "table" and reflected and compare_to is None and POSTS_PARTITION_NAME.match(name):
+        return False
+    if type_ == "index" and reflected and compare_to is None and POSTS_PARTITION_NAME.match(object_.table.name):
+        return False
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -50,6 +63,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -59,7 +73,7 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
 
     with context.begin_transaction():
         context.run_migrations()
@@ -0,0 +1,43 @@
+"""posts_changes
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 10:12:41.380112
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "posts",
+        sa.Column("updated_at", sa.TIMESTAMP(timezone=True), server_default=sa.text("now()"), nullable=True),
+    )
+    op.execute("UPDATE posts SET updated_at = created_at")
+    op.create_index("posts_avatar_id_updated_at_idx", "posts", ["avatar_id", "updated_at"], unique=False)
+    op.create_table(
+        "post_tombstones",
+        sa.Column("uuid", sa.UUID(), nullable=False),
+        sa.Column("avatar_id", sa.Integer(), nullable=False),
+        sa.Column("deleted_at", sa.TIMESTAMP(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("uuid"),
+    )
+    op.create_index(
+        "post_tombstones_avatar_id_deleted_at_idx", "post_tombstones", ["avatar_id", "deleted_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("post_tombstones_avatar_id_deleted_at_idx", table_name="post_tombstones")
+    op.drop_table("post_tombstones")
+    op.drop_index("posts_avatar_id_updated_at_idx", table_name="posts")
+    op.drop_column("posts", "updated_at")
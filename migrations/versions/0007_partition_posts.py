@@ -0,0 +1,119 @@
+"""partition_posts
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 11:05:17.902341
+
+Turn `posts` into a table range-partitioned by `created_at` month.
+Existing rows are copied into the new table, so the migration takes time proportional to the posts count.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions are named posts_YYYY_MM, serialized by an advisory lock as every app worker calls it on startup
+CREATE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION posts_create_partitions(from_month date, months integer) RETURNS integer AS $$
+DECLARE
+    month_start timestamptz;
+    partition_name text;
+    created integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('posts_create_partitions'));
+    FOR i IN 0..months - 1 LOOP
+        month_start := (date_trunc('month', from_month) + make_interval(months => i))::timestamp AT TIME ZONE 'UTC';
+        partition_name := 'posts_' || to_char(month_start AT TIME ZONE 'UTC', 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF posts FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_start + interval '1 month'
+            );
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE posts RENAME TO posts_heap")
+    op.execute("ALTER TABLE posts_heap RENAME CONSTRAINT posts_pkey TO posts_heap_pkey")
+    op.execute("ALTER TABLE posts_heap RENAME CONSTRAINT posts_avatar_id_fkey TO posts_heap_avatar_id_fkey")
+    op.execute("ALTER INDEX posts_avatar_id_updated_at_idx RENAME TO posts_heap_avatar_id_updated_at_idx")
+
+    op.execute(
+        """
+        CREATE TABLE posts (
+            uuid UUID NOT NULL DEFAULT uuid_generate_v4(),
+            avatar_id INTEGER,
+            post_text TEXT,
+            images VARCHAR[],
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            CONSTRAINT posts_pkey PRIMARY KEY (uuid, created_at),
+            CONSTRAINT posts_avatar_id_fkey FOREIGN KEY (avatar_id) REFERENCES avatars (id) ON DELETE CASCADE
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("CREATE INDEX posts_avatar_id_updated_at_idx ON posts (avatar_id, updated_at)")
+    # Catches rows outside of premade partitions, e.g. imported posts from the distant past
+    op.execute("CREATE TABLE posts_default PARTITION OF posts DEFAULT")
+    op.execute(CREATE_PARTITIONS_FUNCTION)
+
+    # Partitions for every month since the oldest post and 3 months ahead
+    op.execute(
+        """
+        SELECT posts_create_partitions(
+            oldest.month::date,
+            (
+                EXTRACT(YEAR FROM age(date_trunc('month', now()), oldest.month)) * 12
+                + EXTRACT(MONTH FROM age(date_trunc('month', now()), oldest.month))
+            )::integer + 4
+        )
+        FROM (SELECT date_trunc('month', COALESCE(min(created_at), now())) AS month FROM posts_heap) AS oldest
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO posts (uuid, avatar_id, post_text, images, created_at, updated_at)
+        SELECT uuid, avatar_id, post_text, images, COALESCE(created_at, now()), updated_at FROM posts_heap
+        """
+    )
+    op.execute("DROP TABLE posts_heap")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE posts RENAME TO posts_partitioned")
+    op.execute("ALTER TABLE posts_partitioned RENAME CONSTRAINT posts_pkey TO posts_partitioned_pkey")
+    op.execute("ALTER INDEX posts_avatar_id_updated_at_idx RENAME TO posts_partitioned_avatar_id_updated_at_idx")
+    op.execute(
+        """
+        CREATE TABLE posts (
+            uuid UUID NOT NULL DEFAULT uuid_generate_v4(),
+            avatar_id INTEGER,
+            post_text TEXT,
+            images VARCHAR[],
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            CONSTRAINT posts_pkey PRIMARY KEY (uuid),
+            CONSTRAINT posts_avatar_id_fkey FOREIGN KEY (avatar_id) REFERENCES avatars (id) ON DELETE CASCADE
+        )
+        """
+    )
+    op.execute("CREATE INDEX posts_avatar_id_updated_at_idx ON posts (avatar_id, updated_at)")
+    op.execute(
+        """
+        INSERT INTO posts (uuid, avatar_id, post_text, images, created_at, updated_at)
+        SELECT uuid, avatar_id, post_text, images, created_at, updated_at FROM posts_partitioned
+        """
+    )
+    op.execute("DROP TABLE posts_partitioned CASCADE")
+    op.execute("DROP FUNCTION posts_create_partitions(date, integer)")
@@ -0,0 +1,83 @@
+"""posts_partitions_from_default
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-19 14:12:40.318227
+
+Posts of a month may already be in `posts_default`, e.g. imported ones dated ahead of the premade partitions.
+Postgres refuses to create a partition which would leave rows in the default one, so `posts_create_partitions`
+creates the partition standalone, moves the rows of the month into it and then attaches it.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0014"
+down_revision: Union[str, None] = "0013"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CREATE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION posts_create_partitions(from_month date, months integer) RETURNS integer AS $$
+DECLARE
+    month_start timestamptz;
+    month_end timestamptz;
+    partition_name text;
+    created integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('posts_create_partitions'));
+    FOR i IN 0..months - 1 LOOP
+        month_start := (date_trunc('month', from_month) + make_interval(months => i))::timestamp AT TIME ZONE 'UTC';
+        month_end := month_start + interval '1 month';
+        partition_name := 'posts_' || to_char(month_start AT TIME ZONE 'UTC', 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE posts INCLUDING DEFAULTS)', partition_name);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM posts_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved',
+                month_start, month_end, partition_name
+            );
+            EXECUTE format(
+                'ALTER TABLE posts ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_end
+            );
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+PREVIOUS_CREATE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION posts_create_partitions(from_month date, months integer) RETURNS integer AS $$
+DECLARE
+    month_start timestamptz;
+    partition_name text;
+    created integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('posts_create_partitions'));
+    FOR i IN 0..months - 1 LOOP
+        month_start := (date_trunc('month', from_month) + make_interval(months => i))::timestamp AT TIME ZONE 'UTC';
+        partition_name := 'posts_' || to_char(month_start AT TIME ZONE 'UTC', 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF posts FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_start + interval '1 month'
+            );
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    op.execute(CREATE_PARTITIONS_FUNCTION)
+
+
+def downgrade() -> None:
+    op.execute(PREVIOUS_CREATE_PARTITIONS_FUNCTION)
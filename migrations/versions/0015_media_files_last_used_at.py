@@ -0,0 +1,30 @@
+"""media_files_last_used_at
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-19 14:48:03.671952
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0015"
+down_revision: Union[str, None] = "0014"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "media_files",
+        sa.Column("last_used_at", sa.TIMESTAMP(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+    # Existing files were last used when uploaded
+    op.execute("UPDATE media_files SET last_used_at = created_at WHERE created_at IS NOT NULL")
+
+
+def downgrade() -> None:
+    op.drop_column("media_files", "last_used_at")
@@ -0,0 +1,36 @@
+"""posts_xact_id
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-19 16:12:40.318275
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0016"
+down_revision: Union[str, None] = "0015"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CURRENT_XACT_ID = "pg_current_xact_id()::text::bigint"
+
+
+def upgrade() -> None:
+    # Existing rows are stamped with the migration transaction, clients sync them all once again
+    for table in ("posts", "post_tombstones"):
+        op.add_column(
+            table, sa.Column("xact_id", sa.BigInteger(), server_default=sa.text(CURRENT_XACT_ID), nullable=False)
+        )
+    op.create_index("posts_avatar_id_xact_id_idx", "posts", ["avatar_id", "xact_id"], unique=False)
+    op.create_index("post_tombstones_avatar_id_xact_id_idx", "post_tombstones", ["avatar_id", "xact_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("post_tombstones_avatar_id_xact_id_idx", table_name="post_tombstones")
+    op.drop_index("posts_avatar_id_xact_id_idx", table_name="posts")
+    op.drop_column("post_tombstones", "xact_id")
+    op.drop_column("posts", "xact_id")
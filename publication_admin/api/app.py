@@ -1,20 +1,24 @@
 from fastapi import APIRouter, FastAPI, Request, status
 from fastapi.exceptions import RequestValidationError, StarletteHTTPException
-from fastapi.responses import JSONResponse
 from starlette.middleware.cors import CORSMiddleware
 
 from publication_admin.settings import settings
 
+from .compression import CompressionMiddleware
 from .errors import APIException, ErrorCode, ErrorResponse
+from .lifespan import lifespan
+from .metrics import MetricsMiddleware, ServerTimingMiddleware
+from .responses import PydanticJSONResponse
 from .routers.auth import auth_router
 from .routers.avatars import avatars_router
 from .routers.files import files_router
+from .routers.media import media_router
 from .routers.meta import meta_router
 from .routers.posts import posts_router
 from .routers.topics import topics_router
 from .routers.users import users_router
 
-app = FastAPI(title="publication_admin API")
+app = FastAPI(title="publication_admin API", lifespan=lifespan, default_response_class=PydanticJSONResponse)
 api_router = APIRouter(prefix="/api")
 api_router.include_router(auth_router, prefix="/auth")
 api_router.include_router(users_router, prefix="/users")
@@ -23,6 +27,7 @@ api_router.include_router(avatars_router, prefix="/avatars")
 api_router.include_router(topics_router, prefix="/topics")
 api_router.include_router(files_router, prefix="/files")
 api_router.include_router(posts_router, prefix="/posts")
+api_router.include_router(media_router, prefix="/media")
 app.include_router(api_router)
 
 origins = ["*"]
@@ -34,18 +39,28 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_minimum_size,
+    gzip_level=settings.compression_gzip_level,
+    brotli_quality=settings.compression_brotli_quality,
+    zstd_level=settings.compression_zstd_level,
+)
+app.add_middleware(ServerTimingMiddleware)
+# Added last to be the outermost, so the time of the other middlewares is measured as well
+app.add_middleware(MetricsMiddleware)
 
 
 @app.exception_handler(APIException)
 async def api_exception_handler(_: Request, exc: APIException):
-    return JSONResponse(
+    return PydanticJSONResponse(
         status_code=exc.status_code,
         headers=exc.headers,
         content=ErrorResponse(
             error_code=exc.error_code,
             message=exc.message,
             details=exc.detail,
-        ).model_dump(),
+        ),
     )
 
 
@@ -61,14 +76,14 @@ async def http_exception_handler(_: Request, exc: StarletteHTTPException):
     elif exc.status_code == status.HTTP_403_FORBIDDEN:
         error_code = ErrorCode.auth_forbidden
 
-    return JSONResponse(
+    return PydanticJSONResponse(
         status_code=exc.status_code,
         headers=exc.headers,
         content=ErrorResponse(
             error_code=error_code,
             message=exc.detail if isinstance(exc.detail, str) else "Unknown error",
             details=exc.detail,
-        ).model_dump(),
+        ),
     )
 
 
@@ -79,23 +94,23 @@ async def request_validation_exception_handler(_: Request, exc: RequestValidatio
     if exc.errors():
         message = "".join(error["msg"] for error in exc.errors())
 
-    return JSONResponse(
+    return PydanticJSONResponse(
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         content=ErrorResponse(
             error_code=ErrorCode.common_validation_error,
             message=message,
             details=exc.errors(),
-        ).model_dump(),
+        ),
     )
 
 
 @app.exception_handler(Exception)
 async def base_exception_handler(_: Request, exc: Exception):
-    return JSONResponse(
+    return PydanticJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content=ErrorResponse(
             error_code=ErrorCode.common_internal_error,
             message="Unknown error",
             details=f"{exc}" if settings.is_local_env() else None,
-        ).model_dump(),
+        ),
     )
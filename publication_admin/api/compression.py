@@ -0,0 +1,198 @@
+import zlib
+from typing import Callable, Protocol
+
+import brotli
+import zstandard
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Media types worth compressing, images, archives and other binary formats are compressed by themselves
+COMPRESSIBLE_MEDIA_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+COMPRESSIBLE_MEDIA_TYPE_SUFFIXES = ("+json", "+xml")
+
+
+class Encoder(Protocol):
+    def encode(self, data: bytes, final: bool) -> bytes:
+        """Compress the next portion of the body, everything given so far is flushed to the output"""
+        ...
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        output = self._compressor.process(data)
+        return output + (self._compressor.finish() if final else self._compressor.flush())
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def encode(self, data: bytes, final: bool) -> bytes:
+        mode = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+def negotiate_encoding(accept_encoding: str, encodings: list[str]) -> str | None:
+    """
+    Encoding of the response by the Accept-Encoding header. The one with the highest q-value wins,
+    ties are resolved by the order of `encodings`. None if the client accepts none of them
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        name, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            qualities[name.strip().lower()] = quality
+
+    default_quality = qualities.get("*", 0.0)
+    best = max(
+        ((qualities.get(encoding, default_quality), -index, encoding) for index, encoding in enumerate(encodings)),
+        default=None,
+    )
+    if best is None or best[0] <= 0:
+        return None
+    return best[2]
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with gzip, brotli or zstd, as the client accepts. Bodies sent in one piece are compressed
+    only when they are at least `minimum_size`, streamed bodies are compressed on the fly, chunk by chunk.
+    Only textual media types are compressed, responses with byte ranges are left as is:
+    ranges would refer to the compressed bytes
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        # Preferred first when the client accepts several equally
+        self.encoders: dict[str, Callable[[], Encoder]] = {
+            "zstd": lambda: ZstdEncoder(zstd_level),
+            "br": lambda: BrotliEncoder(brotli_quality),
+            "gzip": lambda: GzipEncoder(gzip_level),
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), list(self.encoders))
+        responder = _CompressionResponder(send, encoding, self.encoders.get(encoding), self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: str | None, make_encoder: Callable[[], Encoder] | None, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.make_encoder = make_encoder
+        self.minimum_size = minimum_size
+        self.start_message: Message | None = None
+        self.encoder: Encoder | None = None
+        self.started = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Held back until the first part of the body shows whether it is worth compressing
+            self.start_message = message
+            return
+
+        if not self.started:
+            self.started = True
+            await self._start(message)
+            return
+
+        if self.encoder is None:
+            await self._send(message)
+            return
+
+        more_body = message.get("more_body", False)
+        body = self.encoder.encode(message.get("body", b""), final=not more_body)
+        if body or not more_body:
+            await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    async def _start(self, message: Message) -> None:
+        start_message = self.start_message
+        headers = MutableHeaders(raw=start_message["headers"])
+        if start_message["status"] == 304 and _is_encodable(headers):
+            # No body to look at, the 304 carries the validators the 200 would have sent
+            headers.add_vary_header("Accept-Encoding")
+            if self.make_encoder is not None:
+                _weaken_etag(headers)
+        if message["type"] != "http.response.body" or not _is_compressible(start_message["status"], headers):
+            await self._send(start_message)
+            await self._send(message)
+            return
+
+        headers.add_vary_header("Accept-Encoding")
+        # Weakened for every negotiated encoding, even when the body turns out too small to compress,
+        # so that the 304s, which can't know the body size, carry the same ETag
+        if self.make_encoder is not None:
+            _weaken_etag(headers)
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.make_encoder is None or (not more_body and len(body) < self.minimum_size):
+            await self._send(start_message)
+            await self._send(message)
+            return
+
+        self.encoder = self.make_encoder()
+        body = self.encoder.encode(body, final=not more_body)
+        headers["content-encoding"] = self.encoding
+        if "content-length" in headers:
+            del headers["content-length"]
+        if not more_body:
+            headers["content-length"] = str(len(body))
+
+        await self._send(start_message)
+        await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+
+def _weaken_etag(headers: MutableHeaders) -> None:
+    # Compressed bytes differ from the identity ones, so the entity tag can't stay strong
+    if (etag := headers.get("etag")) and not etag.startswith("W/"):
+        headers["etag"] = f"W/{etag}"
+
+
+def _is_encodable(headers: Headers) -> bool:
+    return "content-encoding" not in headers and headers.get("accept-ranges", "none") == "none"
+
+
+def _is_compressible(status_code: int, headers: Headers) -> bool:
+    if status_code < 200 or status_code in (204, 206, 304) or not _is_encodable(headers):
+        return False
+    media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return media_type.startswith(COMPRESSIBLE_MEDIA_TYPES) or media_type.endswith(COMPRESSIBLE_MEDIA_TYPE_SUFFIXES)
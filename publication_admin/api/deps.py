@@ -8,9 +8,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from publication_admin.auth.jwt import JWTError, JWTManager
 from publication_admin.db.engine import AsyncSessionFactory
 from publication_admin.db.models import User
-from publication_admin.media_storage.s3 import S3MediaStorage
+from publication_admin.media_storage.backends import get_media_storage
+from publication_admin.media_storage.base import AsyncMediaStorage
+from publication_admin.metrics import EMAILS_FAILED, EMAILS_PENDING
 from publication_admin.services.avatars_ai import MLImages, MLText
 from publication_admin.settings import settings
+from publication_admin.timing import current_server_timing, timed
 
 from .errors import APIUnauthorizedException
 
@@ -29,15 +32,19 @@ async def get_current_user(
     if not token:
         raise APIUnauthorizedException("No credentials")
 
-    try:
-        jwt = JWTManager(secret_key=settings.secret_key)
-        user_id = jwt.get_user_id(token.credentials)
-    except JWTError as e:
-        raise APIUnauthorizedException(f"Could not validate credentials: {e}") from e
+    with timed("auth"):
+        try:
+            jwt = JWTManager(secret_key=settings.secret_key)
+            user_id = jwt.get_user_id(token.credentials)
+        except JWTError as e:
+            raise APIUnauthorizedException(f"Could not validate credentials: {e}") from e
 
-    user = await session.get(User, user_id)
+        user = await session.get(User, user_id)
     if not user:
         raise APIUnauthorizedException("User is invalid or deleted")
+
+    if server_timing := current_server_timing():
+        server_timing.user_id = user.id
     return user
 
 
@@ -48,14 +55,24 @@ async def require_auth(current_user: User = Depends(get_current_user)):
 async def send_email(background_tasks: BackgroundTasks):
     def send(message: MessageSchema):
         if not settings.is_local_env():
-            mail_service = FastMail(settings.mail)
-            background_tasks.add_task(mail_service.send_message, message)
+            EMAILS_PENDING.inc()
+            background_tasks.add_task(_send_message, FastMail(settings.mail), message)
 
     return send
 
 
-async def media_storage() -> S3MediaStorage:
-    return S3MediaStorage()
+async def _send_message(mail_service: FastMail, message: MessageSchema) -> None:
+    try:
+        await mail_service.send_message(message)
+    except Exception:
+        EMAILS_FAILED.inc()
+        raise
+    finally:
+        EMAILS_PENDING.dec()
+
+
+async def media_storage() -> AsyncMediaStorage:
+    return get_media_storage()
 
 
 async def get_ml_text_service() -> MLText:
@@ -70,6 +87,6 @@ BearerToken = Annotated[HTTPAuthorizationCredentials, Depends(bearer_token_schem
 DBSession = Annotated[AsyncSession, Depends(get_db)]
 CurrentUser = Annotated[User, Depends(get_current_user)]
 SendEmail = Annotated[Callable[[MessageSchema], None], Depends(send_email)]
-MediaStorage = Annotated[S3MediaStorage, Depends(media_storage)]
+MediaStorage = Annotated[AsyncMediaStorage, Depends(media_storage)]
 MLImagesService = Annotated[MLImages, Depends(get_ml_images_service)]
 MLTextService = Annotated[MLText, Depends(get_ml_text_service)]
@@ -16,6 +16,11 @@ class ErrorCode(StrEnum):
     auth_invalid_credentials = "auth.invalid_credentials"
     auth_unauthorized = "auth.unauthorized"
 
+    files_upload_offset_mismatch = "files.upload_offset_mismatch"
+    files_presigned_upload_unsupported = "files.presigned_upload_unsupported"
+
+    media_range_not_satisfiable = "media.range_not_satisfiable"
+
 
 class APIException(HTTPException):
     def __init__(
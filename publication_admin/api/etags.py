@@ -0,0 +1,30 @@
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*versions: Any) -> str:
+    """Strong ETag of a resource from what versions it: row versions, update moments and counts"""
+    digest = hashlib.blake2b(repr(versions).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_headers(etag: str) -> dict[str, str]:
+    # Clients may keep the response, but have to revalidate it on every use
+    return {"etag": etag, "cache-control": "private, no-cache"}
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Weak comparison, as If-None-Match requires
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def not_modified(request: Request, etag: str) -> Response | None:
+    """Empty 304 response if the client has the current version already, so the body is not even built"""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+    return None
@@ -0,0 +1,160 @@
+import time
+
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from publication_admin.api.errors import APIValidationException
+from publication_admin.db.engine import AsyncSessionFactory
+from publication_admin.db.storages import AvatarsStorage, MediaFilesStorage, PostStorage
+from publication_admin.media_storage.base import AsyncMediaStorage, FileInfo
+from publication_admin.media_storage.derivatives import ImageDerivative, create_derivatives
+from publication_admin.media_storage.keys import derivative_key, is_user_content_key
+from publication_admin.media_storage.metadata import get_file_info_cache
+from publication_admin.media_storage.presigned import get_presigned_urls
+from publication_admin.media_storage.similarity import find_near_duplicates, hash_images
+from publication_admin.settings import settings
+
+ALLOWED_IMAGE_CONTENT_TYPE = "image/jpeg"
+# Objects uploaded without a content type, their content was checked by the upload endpoints
+UNKNOWN_CONTENT_TYPES = (None, "binary/octet-stream", "application/octet-stream")
+
+
+def media_url(key: str) -> str:
+    """
+    URL the client can fetch the file from: via the media proxy, presigned or straight from the public bucket.
+    The proxy serves uploaded images only, other objects like generated profile images are fetched from the bucket
+    """
+    media_storage_settings = settings.media_storage
+    if media_storage_settings.media_storage_proxy_url and is_user_content_key(key):
+        return f"{media_storage_settings.media_storage_proxy_url.rstrip('/')}/{key}"
+    if media_storage_settings.media_storage_backend == "local":
+        return f"/api/media/{key}"
+    if media_storage_settings.media_storage_presigned_urls:
+        return get_presigned_urls().get(key)
+    return f"{media_storage_settings.media_storage_url}/{media_storage_settings.media_storage_bucket}/{key}"
+
+
+def media_urls_epoch() -> int:
+    """
+    Changes when the URLs given by `media_url` may change by themselves. Presigned URLs are renewed before they expire,
+    so the ETag of a response with them changes in time and clients never keep the URLs past the renewal
+    """
+    media_storage_settings = settings.media_storage
+    if (
+        media_storage_settings.media_storage_proxy_url
+        or media_storage_settings.media_storage_backend == "local"
+        or not media_storage_settings.media_storage_presigned_urls
+    ):
+        return 0
+    return int(time.time()) // media_storage_settings.media_storage_presigned_url_renew_before
+
+
+async def ensure_images_confirmed(db: AsyncSession, images: list[str]) -> None:
+    """Reject references to direct-to-bucket uploads which were not confirmed yet"""
+    user_content_keys = [key for key in images if is_user_content_key(key)]
+    if not user_content_keys:
+        return
+
+    pending_keys = await MediaFilesStorage(db).get_pending_keys(user_content_keys)
+    if pending_keys:
+        raise APIValidationException(message="Some images are not confirmed yet", detail=pending_keys)
+
+
+async def ensure_images_exist(
+    media_storage: AsyncMediaStorage, images: list[str], loc: tuple[str, ...] = ("body", "images")
+) -> None:
+    """
+    Check the files behind the images before they get to the ML service,
+    where a missing or broken file would only fail the training minutes later
+    """
+    file_infos = await get_file_info_cache().head_files(
+        media_storage, images, concurrency=settings.image_keys_check_concurrency
+    )
+
+    errors = []
+    for index, key in enumerate(images):
+        if error := _image_file_error(file_infos[key]):
+            error_type, message = error
+            errors.append({"type": error_type, "loc": [*loc, index], "msg": message, "input": key})
+    if errors:
+        raise APIValidationException(message="Some images are missing or invalid", detail=errors)
+
+
+async def find_image_errors(db: AsyncSession, media_storage: AsyncMediaStorage, images: list[str]) -> dict[str, str]:
+    """
+    Errors of the images by key, for callers rejecting what refers to them one by one, like the posts import.
+    Uploads are checked as `ensure_images_confirmed` and `ensure_images_exist` do, other images are left as is
+    """
+    user_content_keys = list(dict.fromkeys(key for key in images if is_user_content_key(key)))
+    if not user_content_keys:
+        return {}
+
+    pending_keys = await MediaFilesStorage(db).get_pending_keys(user_content_keys)
+    errors = {key: "Image is not confirmed yet" for key in pending_keys}
+    file_infos = await get_file_info_cache().head_files(
+        media_storage,
+        [key for key in user_content_keys if key not in errors],
+        concurrency=settings.image_keys_check_concurrency,
+    )
+    for key, file_info in file_infos.items():
+        if error := _image_file_error(file_info):
+            errors[key] = error[1]
+    return errors
+
+
+def _image_file_error(file_info: FileInfo | None) -> tuple[str, str] | None:
+    if file_info is None:
+        return "image_not_found", "File not found"
+    if file_info.content_type not in (ALLOWED_IMAGE_CONTENT_TYPE, *UNKNOWN_CONTENT_TYPES):
+        return "image_content_type", f"Invalid content type, only {ALLOWED_IMAGE_CONTENT_TYPE} is allowed"
+    if file_info.size == 0:
+        return "image_empty", "File is empty"
+    if file_info.size > settings.image_size_limit:
+        return "image_too_large", f"Too large file, limit is {settings.image_size_limit}"
+    return None
+
+
+async def generate_derivatives(media_storage: AsyncMediaStorage, key: str) -> None:
+    """Background task creating downscaled copies of the just uploaded image"""
+    try:
+        derivatives = await create_derivatives(media_storage, key)
+    except Exception as e:
+        logger.exception(f"Failed to create derivatives of {key}: {e}")
+        return
+
+    async with AsyncSessionFactory() as session:
+        await MediaFilesStorage(session).set_derivatives(key, derivatives)
+        # Avatars and posts list the thumbnails of their images, so clients have to see them changed
+        await AvatarsStorage(session).touch_by_image(key)
+        await PostStorage(session).touch_by_image(key)
+        await session.commit()
+
+
+async def get_derivative_keys(db: AsyncSession, images: list[str], derivative: ImageDerivative) -> dict[str, str]:
+    """Map images to keys of their derivatives, images without the derivative are skipped"""
+    user_content_keys = [key for key in images if is_user_content_key(key)]
+    if not user_content_keys:
+        return {}
+
+    keys = await MediaFilesStorage(db).get_keys_with_derivative(user_content_keys, derivative)
+    return {key: derivative_key(key, derivative) for key in keys}
+
+
+async def find_duplicate_images(
+    media_storage: AsyncMediaStorage, images: list[str], keys: list[str] | None = None
+) -> dict[int, int]:
+    """
+    Map indexes of near-duplicate images to indexes of the earlier images they repeat.
+    Files under `keys` are hashed instead of the images when given, smaller copies are faster to fetch
+    """
+    if len(images) < 2:
+        return {}
+
+    try:
+        hashes = await hash_images(media_storage, keys or images)
+    except Exception as e:
+        # Duplicates only cost training time, not worth failing the request
+        logger.exception(f"Failed to check images for duplicates: {e}")
+        return {}
+
+    return find_near_duplicates(hashes, max_distance=settings.image_duplicates_max_distance)
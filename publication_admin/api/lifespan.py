@@ -0,0 +1,98 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from fastapi import FastAPI
+from loguru import logger
+from prometheus_client import multiprocess
+
+from publication_admin.db.engine import AsyncSessionFactory
+from publication_admin.db.storages import MediaFilesStorage, PostStorage, UploadSessionsStorage
+from publication_admin.media_storage.backends import get_media_storage
+from publication_admin.media_storage.cache import get_media_cache
+from publication_admin.media_storage.keys import derivative_key
+from publication_admin.metrics import is_multiprocess
+from publication_admin.settings import settings
+
+POSTS_PARTITIONS_INTERVAL = 12 * 60 * 60
+UPLOAD_SESSIONS_CLEANUP_INTERVAL = 60 * 60
+MEDIA_GC_INTERVAL = 6 * 60 * 60
+
+
+async def create_posts_partitions() -> None:
+    """Premake monthly posts partitions, so inserts never fall into the default partition"""
+    async with AsyncSessionFactory() as session:
+        created = await PostStorage(session).create_partitions(months_ahead=settings.posts_partitions_premake_months)
+        await session.commit()
+
+    if created:
+        logger.info(f"Created {created} posts partitions")
+
+
+async def cleanup_upload_sessions() -> None:
+    """Drop expired resumable uploads along with their uploaded parts"""
+    media_storage = get_media_storage()
+    while True:
+        async with AsyncSessionFactory() as session:
+            upload_sessions = await UploadSessionsStorage(session).delete_expired()
+            await session.commit()
+
+        for upload_session in upload_sessions:
+            await media_storage.discard_multipart_upload(upload_session.key, upload_session.s3_upload_id)
+        if upload_sessions:
+            logger.info(f"Dropped {len(upload_sessions)} expired upload sessions")
+        else:
+            break
+
+
+async def collect_orphaned_media() -> None:
+    """Delete uploads which are no longer referenced, along with their derivatives"""
+    media_storage = get_media_storage()
+    while True:
+        older_than = datetime.now(timezone.utc) - timedelta(seconds=settings.media_gc_grace_period)
+        async with AsyncSessionFactory() as session:
+            media_files = await MediaFilesStorage(session).delete_orphaned(older_than=older_than)
+            if not media_files:
+                break
+
+            keys = [media_file.key for media_file in media_files]
+            keys += [
+                derivative_key(media_file.key, name) for media_file in media_files for name in media_file.derivatives
+            ]
+            # Rows are deleted only when the objects are, a failed batch is retried by the next run
+            await media_storage.delete_files(keys)
+            await session.commit()
+
+        logger.info(f"Deleted {len(media_files)} orphaned media files")
+
+
+async def run_periodically(interval: float, job: Callable[[], Awaitable[None]]) -> None:
+    while True:
+        try:
+            await job()
+        except Exception as e:
+            logger.exception(f"Periodic job {job.__name__} failed: {e}")
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Build the shared S3 client before the first upload comes
+    get_media_storage()
+    # Restore the media cache index before the first media request comes
+    get_media_cache()
+
+    tasks = [
+        asyncio.create_task(run_periodically(POSTS_PARTITIONS_INTERVAL, create_posts_partitions)),
+        asyncio.create_task(run_periodically(UPLOAD_SESSIONS_CLEANUP_INTERVAL, cleanup_upload_sessions)),
+        asyncio.create_task(run_periodically(MEDIA_GC_INTERVAL, collect_orphaned_media)),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Values of live gauges, like requests in progress, are dropped with the worker
+    if is_multiprocess():
+        multiprocess.mark_process_dead(os.getpid())
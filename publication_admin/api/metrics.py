@@ -0,0 +1,68 @@
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from publication_admin.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_PROGRESS
+from publication_admin.settings import settings
+from publication_admin.timing import collect_server_timing
+
+# Label of requests matching no route, their paths are not used to keep the number of series bounded
+UNMATCHED_ROUTE = "unmatched"
+
+
+class MetricsMiddleware:
+    """Count requests in progress and observe their latency by route template and response status"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            # Router puts the matched route into the scope
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(method, route.path if route else UNMATCHED_ROUTE, str(status_code)).observe(
+                time.perf_counter() - started_at
+            )
+
+
+class ServerTimingMiddleware:
+    """Tell the client where the request time went in the Server-Timing header, see `timing`"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not (settings.server_timing or settings.server_timing_user_ids):
+            await self.app(scope, receive, send)
+            return
+
+        with collect_server_timing() as server_timing:
+
+            async def send_with_timing(message: Message) -> None:
+                if message["type"] == "http.response.start" and (
+                    settings.server_timing or server_timing.user_id in settings.server_timing_user_ids
+                ):
+                    MutableHeaders(scope=message).append("server-timing", server_timing.header())
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
@@ -0,0 +1,60 @@
+import functools
+import inspect
+from typing import Any, Callable
+
+import orjson
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter
+
+
+@functools.cache
+def _type_adapter(type_: Any) -> TypeAdapter:
+    # Building an adapter compiles a serializer, so it's done once per type
+    return TypeAdapter(type_)
+
+
+def _is_model_list(content: Any) -> bool:
+    return isinstance(content, list) and bool(content) and isinstance(content[0], BaseModel)
+
+
+class PydanticJSONResponse(JSONResponse):
+    """
+    JSON response serialized in one pass: Pydantic models and lists of them are dumped straight
+    to bytes by pydantic-core, anything else goes through orjson.
+    Endpoints returning it directly skip FastAPI's dump, validation and re-serialization of the response model
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return _type_adapter(type(content)).dump_json(content)
+        if _is_model_list(content):
+            return _type_adapter(list[type(content[0])]).dump_json(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class PydanticJSONRoute(APIRoute):
+    """
+    Route sending the models returned by its endpoint as PydanticJSONResponse, so every endpoint
+    is serialized the same way whether it builds the response itself or returns a model
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        super().__init__(path, _pydantic_json_endpoint(endpoint, kwargs.get("status_code")), **kwargs)
+        # Routers copy included routes from the endpoint, keep the original to not wrap it again
+        self.endpoint = endpoint
+
+
+def _pydantic_json_endpoint(endpoint: Callable[..., Any], status_code: int | None) -> Callable[..., Any]:
+    if not inspect.iscoroutinefunction(endpoint):
+        return endpoint
+
+    # Signature and return annotation are taken through __wrapped__ for dependencies and response_model
+    @functools.wraps(endpoint)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        content = await endpoint(*args, **kwargs)
+        if isinstance(content, BaseModel) or _is_model_list(content):
+            return PydanticJSONResponse(content, status_code=status_code or 200)
+        return content
+
+    return wrapper
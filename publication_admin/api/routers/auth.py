@@ -12,6 +12,7 @@ from publication_admin.api.errors import (
     ErrorResponse,
     ValidationErrorResponse,
 )
+from publication_admin.api.responses import PydanticJSONRoute
 from publication_admin.auth.email_auth import (
     AuthenticationError,
     EmailAuthenticator,
@@ -20,7 +21,7 @@ from publication_admin.auth.email_auth import (
 from publication_admin.auth.jwt import JWTManager
 from publication_admin.settings import settings
 
-auth_router = APIRouter(tags=["auth"])
+auth_router = APIRouter(route_class=PydanticJSONRoute, tags=["auth"])
 
 
 class GetCodeRequest(BaseModel):
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, status
-from pydantic import BaseModel, ConfigDict, constr
+import posixpath
+from typing import AsyncIterator
+
+from fastapi import APIRouter, Depends, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, computed_field, constr
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from publication_admin.api.deps import (
     CurrentUser,
     DBSession,
+    MediaStorage,
     MLImagesService,
     MLTextService,
     get_current_user,
@@ -19,12 +24,25 @@ from publication_admin.api.errors import (
     UnauthorizedErrorResponse,
     ValidationErrorResponse,
 )
-from publication_admin.db.models import InitStatus
+from publication_admin.api.etags import etag_headers, make_etag, not_modified
+from publication_admin.api.images import (
+    ensure_images_confirmed,
+    ensure_images_exist,
+    find_duplicate_images,
+    get_derivative_keys,
+    media_url,
+    media_urls_epoch,
+)
+from publication_admin.api.responses import PydanticJSONResponse, PydanticJSONRoute
+from publication_admin.api.streaming import ZIP_MEDIA_TYPE, zip_stream
+from publication_admin.db.models import Avatar, InitStatus
 from publication_admin.db.storages import AvatarsStorage, TopicsStorage
+from publication_admin.media_storage.derivatives import ImageDerivative
 from publication_admin.services.avatars_ai.ml_images.dto import TaskStatus
 from publication_admin.services.avatars_ai.service import ServiceError
+from publication_admin.settings import settings
 
-avatars_router = APIRouter(dependencies=[Depends(get_current_user)], tags=["avatar"])
+avatars_router = APIRouter(route_class=PydanticJSONRoute, dependencies=[Depends(get_current_user)], tags=["avatar"])
 
 ml_service_unavailable = APIException(
     error_code=ErrorCode.common_error,
@@ -38,8 +56,18 @@ class AvatarResponse(BaseModel):
     text: str
     topics: list[constr(strip_whitespace=True)]
     images: list[str]
+    thumbnails: dict[str, str] = Field(default={}, description="Thumbnail keys of the images which have them")
     profile_picture: str | None
 
+    @computed_field
+    def image_urls(self) -> list[str]:
+        return [media_url(key) for key in self.images]
+
+    @computed_field
+    def thumbnail_urls(self) -> dict[str, str]:
+        """Thumbnail URLs of the images which have them"""
+        return {image: media_url(key) for image, key in self.thumbnails.items()}
+
 
 class CreateAvatarRequest(BaseModel):
     name: str
@@ -70,6 +98,9 @@ class GeneratedBioResponse(BaseModel):
 
 class AvatarInitResponse(BaseModel):
     status: InitStatus
+    duplicate_images: dict[str, str] = Field(
+        default={}, description="Near-duplicate images mapped to the images they repeat"
+    )
 
 
 class GenerateProfileImageRequest(BaseModel):
@@ -94,11 +125,13 @@ class DeletedAvatarResponse(BaseModel):
 @avatars_router.get(
     "/current/",
     status_code=status.HTTP_200_OK,
+    response_model=AvatarResponse,
     responses={
         status.HTTP_401_UNAUTHORIZED: {
             "model": UnauthorizedErrorResponse,
             "description": "Invalid or expired JWT",
         },
+        status.HTTP_304_NOT_MODIFIED: {"description": "Avatar matches the If-None-Match ETag"},
         status.HTTP_404_NOT_FOUND: {
             "model": NotFoundErrorResponse,
             "description": "User do not have any avatar",
@@ -106,22 +139,20 @@ class DeletedAvatarResponse(BaseModel):
     },
 )
 async def get_current_avatar(
+    request: Request,
     current_user: CurrentUser,
     db: AsyncSession = Depends(get_db),
-) -> AvatarResponse:
+) -> Response:
     avatar_storage = AvatarsStorage(db)
     current_avatar = await avatar_storage.get_by_user_id(current_user.id)
 
     if not current_avatar:
         raise APINotFoundException()
 
-    return AvatarResponse(
-        name=current_avatar.name,
-        text=current_avatar.text,
-        topics=current_avatar.topics,
-        images=current_avatar.images,
-        profile_picture=None,
-    )
+    etag = make_etag(current_avatar.id, current_avatar.version, media_urls_epoch())
+    if response := not_modified(request, etag):
+        return response
+    return PydanticJSONResponse(await _avatar_response(db, current_avatar), headers=etag_headers(etag))
 
 
 @avatars_router.post(
@@ -146,6 +177,7 @@ async def get_current_avatar(
 async def create_avatar(
     dto: CreateAvatarRequest,
     current_user: CurrentUser,
+    media_storage: MediaStorage,
     db: AsyncSession = Depends(get_db),
 ) -> AvatarResponse:
     avatar_storage = AvatarsStorage(db)
@@ -156,6 +188,8 @@ async def create_avatar(
             message="Multiple avatars not supported at the moment",
             status_code=status.HTTP_501_NOT_IMPLEMENTED,
         )
+    await ensure_images_confirmed(db, dto.images)
+    await ensure_images_exist(media_storage, dto.images)
 
     avatar = await avatar_storage.create(
         user_id=current_user.id,
@@ -166,13 +200,7 @@ async def create_avatar(
     )
     await db.commit()
 
-    return AvatarResponse(
-        name=avatar.name,
-        text=avatar.text,
-        topics=avatar.topics,
-        images=avatar.images,
-        profile_picture=None,
-    )
+    return await _avatar_response(db, avatar)
 
 
 @avatars_router.patch(
@@ -201,19 +229,11 @@ async def patch_avatar(
     if not avatar:
         raise APINotFoundException()
 
-    avatar.name = dto.name.strip()
-    avatar.text = dto.text.strip()
-    avatar.topics = dto.topics
+    await avatar_storage.update(avatar, name=dto.name.strip(), text=dto.text.strip(), topics=dto.topics)
     await TopicsStorage(db).add_new_topics(dto.topics)
     await db.commit()
 
-    return AvatarResponse(
-        name=avatar.name,
-        text=avatar.text,
-        topics=avatar.topics,
-        images=avatar.images,
-        profile_picture=None,
-    )
+    return await _avatar_response(db, avatar)
 
 
 @avatars_router.delete(
@@ -284,6 +304,10 @@ async def generate_bio(
             "model": CommonErrorResponse,
             "description": "Avatar init was already triggered",
         },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {
+            "model": ValidationErrorResponse,
+            "description": "Some avatar images are missing or invalid",
+        },
         status.HTTP_503_SERVICE_UNAVAILABLE: {
             "model": CommonErrorResponse,
             "description": "ML service unavailable",
@@ -291,7 +315,10 @@ async def generate_bio(
     },
 )
 async def init_avatar(
-    current_user: CurrentUser, ml_images_service: MLImagesService, db_session: DBSession
+    current_user: CurrentUser,
+    ml_images_service: MLImagesService,
+    media_storage: MediaStorage,
+    db_session: DBSession,
 ) -> AvatarInitResponse:
     avatar_storage = AvatarsStorage(db_session)
     avatar = await avatar_storage.get_by_user_id(current_user.id)
@@ -306,19 +333,32 @@ async def init_avatar(
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
+    # Images could have been deleted since the avatar was created
+    await ensure_images_exist(media_storage, avatar.images, loc=("images",))
+
+    # The ML service trains on the normalized copies when they are ready, originals otherwise
+    training_keys = await get_derivative_keys(db_session, avatar.images, ImageDerivative.TRAINING)
+    s3_paths = [training_keys.get(image, image) for image in avatar.images]
+
+    duplicates = await find_duplicate_images(media_storage, avatar.images, s3_paths)
+    if settings.drop_duplicate_training_images:
+        s3_paths = [path for index, path in enumerate(s3_paths) if index not in duplicates]
+
     avatar.set_random_lora_name()
     try:
-        response = await ml_images_service.post_init_persona_task(
-            lora_name=avatar.lora_name,
-            s3_paths=avatar.images,
-        )
+        response = await ml_images_service.post_init_persona_task(lora_name=avatar.lora_name, s3_paths=s3_paths)
     except ServiceError as e:
         raise ml_service_unavailable from e
 
-    avatar.init_persona_task_id = response.task_id
-    avatar.init_status = InitStatus.PENDING
+    await avatar_storage.update(avatar, init_persona_task_id=response.task_id, init_status=InitStatus.PENDING)
     await db_session.commit()
-    return AvatarInitResponse(status=avatar.init_status)
+    # The same image listed twice is dropped from training as well, but is not a duplicate of another image
+    duplicate_images = {
+        avatar.images[duplicate]: avatar.images[original]
+        for duplicate, original in duplicates.items()
+        if avatar.images[duplicate] != avatar.images[original]
+    }
+    return AvatarInitResponse(status=avatar.init_status, duplicate_images=duplicate_images)
 
 
 @avatars_router.get(
@@ -356,8 +396,7 @@ async def init_status(
             raise ml_service_unavailable from e
 
         if response.status.is_success() and response.lora_s3_path:
-            avatar.lora_path = response.lora_s3_path
-            avatar.init_status = InitStatus.SUCCESS
+            await avatar_storage.update(avatar, lora_path=response.lora_s3_path, init_status=InitStatus.SUCCESS)
             await db_session.commit()
 
     return AvatarInitResponse(status=avatar.init_status)
@@ -443,5 +482,69 @@ async def profile_images_status(
         task_id=response.task_id,
         status=response.status,
         image_path=response.image_path,
-        image_url="",
+        image_url=media_url(response.image_path) if response.image_path else None,
+    )
+
+
+@avatars_router.get(
+    "/current/images/archive/",
+    description="Download avatar images as a zip archive, generated profile image is added on request",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {"content": {ZIP_MEDIA_TYPE: {}}},
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": UnauthorizedErrorResponse,
+            "description": "Invalid or expired JWT",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": NotFoundErrorResponse,
+            "description": "User do not have any avatar",
+        },
+    },
+)
+async def download_avatar_images(
+    current_user: CurrentUser,
+    db_session: DBSession,
+    media_storage: MediaStorage,
+    include_profile_image: bool = False,
+) -> StreamingResponse:
+    avatar = await AvatarsStorage(db_session).get_by_user_id(current_user.id)
+    if not avatar:
+        raise APINotFoundException()
+
+    # Numbered, as images uploaded from different devices may share a name. Keys may repeat,
+    # deduplicated uploads of the same image share one, still every image gets its own entry
+    entries = [(f"images/{number:02d}_{posixpath.basename(key)}", key) for number, key in enumerate(avatar.images, 1)]
+    if include_profile_image and avatar.profile_image:
+        entries.append((f"profile/{posixpath.basename(avatar.profile_image)}", avatar.profile_image))
+    # Nothing else is read from the database, the connection is not held idle in transaction for the whole download
+    await db_session.close()
+
+    async def files() -> AsyncIterator[tuple[str, int, AsyncIterator[bytes]]]:
+        # Files come in order of the keys with the missing ones skipped, so each is the next entry with its key
+        remaining_entries = iter(entries)
+        async for key, file_info, contents in media_storage.iter_files(
+            [key for _, key in entries],
+            concurrency=settings.avatar_archive_concurrency,
+            chunks_ahead=settings.avatar_archive_chunks_ahead,
+        ):
+            name = next(name for name, entry_key in remaining_entries if entry_key == key)
+            yield name, file_info.size, contents
+
+    return StreamingResponse(
+        zip_stream(files()),
+        media_type=ZIP_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="avatar-{avatar.id}.zip"'},
+    )
+
+
+async def _avatar_response(db: AsyncSession, avatar: Avatar) -> AvatarResponse:
+    return AvatarResponse(
+        name=avatar.name,
+        text=avatar.text,
+        topics=avatar.topics,
+        images=avatar.images,
+        thumbnails=await get_derivative_keys(db, avatar.images, ImageDerivative.THUMBNAIL),
+        profile_picture=None,
     )
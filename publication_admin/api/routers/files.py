@@ -1,36 +1,154 @@
-import uuid
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from enum import StrEnum
+from typing import AsyncIterable, AsyncIterator, Literal
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, UploadFile, status
-from pydantic import BaseModel, computed_field
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request, Response, UploadFile, status
+from pydantic import BaseModel, Field, computed_field
+from starlette.concurrency import run_in_threadpool
 
-from publication_admin.api.deps import MediaStorage, require_auth
+from publication_admin.api.deps import CurrentUser, DBSession, MediaStorage, require_auth
 from publication_admin.api.errors import (
     APIException,
+    APINotFoundException,
     APIValidationException,
     ErrorCode,
+    ErrorResponse,
+    NotFoundErrorResponse,
     UnauthorizedErrorResponse,
     ValidationErrorResponse,
 )
-from publication_admin.media_storage.s3 import UploadError
+from publication_admin.api.images import ALLOWED_IMAGE_CONTENT_TYPE, generate_derivatives, media_url
+from publication_admin.api.responses import PydanticJSONRoute
+from publication_admin.db.models import MediaFile, MediaFileStatus, UploadSession
+from publication_admin.db.storages import MediaFilesStorage, UploadSessionsStorage
+from publication_admin.media_storage.base import AsyncMediaStorage, MediaStorageError, UploadError
+from publication_admin.media_storage.derivatives import ImageDerivative
+from publication_admin.media_storage.keys import (
+    derivative_key,
+    file_sha256,
+    hashed_stream,
+    new_content_key,
+    new_user_content_key,
+    stream_sha256,
+)
 from publication_admin.settings import settings
 
-ALLOWED_IMAGE_CONTENT_TYPE = "image/jpeg"
+JPEG_MAGIC_BYTES = b"\xff\xd8\xff"
 
-files_router = APIRouter(dependencies=[Depends(require_auth)], tags=["files"])
+files_router = APIRouter(route_class=PydanticJSONRoute, dependencies=[Depends(require_auth)], tags=["files"])
 
 
 class MediaStorageImage(BaseModel):
+    """
+    Uploaded image, its derivatives are generated in background right after the upload.
+    Their URLs are null until they are ready
+    """
+
     file_id: str
+    derivatives: list[str] = Field(default=[], exclude=True)
 
     @computed_field
     def url(self) -> str:
-        return (
-            f"{settings.media_storage.media_storage_url}/"
-            f"{settings.media_storage.media_storage_bucket}/"
-            f"{self.file_id}"
+        return media_url(self.file_id)
+
+    @computed_field
+    def thumbnail_url(self) -> str | None:
+        return self._derivative_url(ImageDerivative.THUMBNAIL)
+
+    @computed_field
+    def training_url(self) -> str | None:
+        return self._derivative_url(ImageDerivative.TRAINING)
+
+    def _derivative_url(self, derivative: ImageDerivative) -> str | None:
+        if derivative not in self.derivatives:
+            return None
+        return media_url(derivative_key(self.file_id, derivative))
+
+
+class PresignedUploadMethod(StrEnum):
+    POST: str = "POST"
+    PUT: str = "PUT"
+
+
+class PresignedUploadRequest(BaseModel):
+    method: PresignedUploadMethod = PresignedUploadMethod.POST
+    size: int | None = Field(
+        default=None,
+        gt=0,
+        le=settings.image_size_limit,
+        description="Exact file size in bytes, required for PUT uploads",
+    )
+
+
+class PresignedUploadResponse(BaseModel):
+    file_id: str
+    method: PresignedUploadMethod
+    url: str
+    fields: dict[str, str] = Field(default={}, description="Form fields to send along with the file (POST only)")
+    headers: dict[str, str] = Field(default={}, description="Headers to send with the file (PUT only)")
+    expires_in: int
+
+
+class ConfirmUploadRequest(BaseModel):
+    file_id: str
+
+
+class UploadResult(BaseModel):
+    filename: str | None
+    image: MediaStorageImage | None = None
+    error: str | None = None
+
+
+class BatchUploadResponse(BaseModel):
+    results: list[UploadResult] = Field(description="Upload results in the order of the files")
+
+
+class CreateUploadSessionRequest(BaseModel):
+    size: int = Field(gt=0, le=settings.image_size_limit, description="Exact file size in bytes")
+
+
+class UploadSessionResponse(BaseModel):
+    id: UUID
+    file_id: str
+    size: int
+    offset: int = Field(description="Bytes received so far, the next chunk must start there")
+    chunk_size: int = Field(description="Every chunk except the last one must be exactly of this size")
+    expires_at: datetime
+
+    @classmethod
+    def from_session(cls, upload_session: UploadSession, offset: int | None = None) -> "UploadSessionResponse":
+        return cls(
+            id=upload_session.id,
+            file_id=upload_session.key,
+            size=upload_session.size,
+            offset=upload_session.offset if offset is None else offset,
+            chunk_size=upload_session.chunk_size,
+            expires_at=upload_session.expires_at,
         )
 
 
+class UploadOffsetDetails(BaseModel):
+    offset: int
+
+
+UploadOffsetMismatchErrorResponse = ErrorResponse[Literal[ErrorCode.files_upload_offset_mismatch], UploadOffsetDetails]
+PresignedUploadUnsupportedErrorResponse = ErrorResponse[Literal[ErrorCode.files_presigned_upload_unsupported], None]
+
+UPLOAD_SESSION_RESPONSES = {
+    status.HTTP_401_UNAUTHORIZED: {
+        "model": UnauthorizedErrorResponse,
+        "description": "Invalid or expired JWT",
+    },
+    status.HTTP_404_NOT_FOUND: {
+        "model": NotFoundErrorResponse,
+        "description": "Upload session not found or expired",
+    },
+}
+
+
 @files_router.post(
     "/image/upload/",
     status_code=status.HTTP_200_OK,
@@ -46,23 +164,585 @@ class MediaStorageImage(BaseModel):
         },
     },
 )
-async def upload(file: UploadFile, media_storage: MediaStorage) -> MediaStorageImage:
-    if file.content_type != ALLOWED_IMAGE_CONTENT_TYPE:
+async def upload(
+    file: UploadFile,
+    current_user: CurrentUser,
+    media_storage: MediaStorage,
+    db: DBSession,
+    background_tasks: BackgroundTasks,
+) -> MediaStorageImage:
+    if error := _validate_upload_file(file):
+        raise APIValidationException(message=error)
+
+    sha256 = await run_in_threadpool(file_sha256, file.file)
+    media_files_storage = MediaFilesStorage(db)
+    if media_file := (await media_files_storage.use_by_sha256([sha256])).get(sha256):
+        # The same file is already stored, nothing to transfer
+        await db.commit()
+        return _uploaded_image(media_file, media_file.key, media_storage, background_tasks)
+
+    file_id = new_content_key(sha256)
+    try:
+        await media_storage.upload_file(file_id, content=file.file, content_type=file.content_type)
+    except UploadError as e:
+        raise APIException(
+            status_code=500,
+            message=f"File upload error, details: {e}",
+            error_code=ErrorCode.common_internal_error,
+        ) from e
+
+    media_file = await media_files_storage.add_content(
+        key=file_id,
+        sha256=sha256,
+        user_id=current_user.id,
+        size=file.size,
+        content_type=file.content_type,
+    )
+    await db.commit()
+    return _uploaded_image(media_file, file_id, media_storage, background_tasks)
+
+
+@files_router.post(
+    "/image/upload/batch/",
+    status_code=status.HTTP_200_OK,
+    description=(
+        f"Uploading up to {settings.upload_batch_size_limit} files to media storage at once. "
+        "Files are validated and uploaded independently, failed files are reported in the results"
+    ),
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": UnauthorizedErrorResponse,
+            "description": "Invalid or expired JWT",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {
+            "model": ValidationErrorResponse,
+            "description": "Files are missing or there are too many of them",
+        },
+    },
+)
+async def upload_batch(
+    files: list[UploadFile],
+    current_user: CurrentUser,
+    media_storage: MediaStorage,
+    db: DBSession,
+    background_tasks: BackgroundTasks,
+) -> BatchUploadResponse:
+    if len(files) > settings.upload_batch_size_limit:
+        raise APIValidationException(message=f"Too many files, limit is {settings.upload_batch_size_limit}")
+
+    errors = {file: error for file in files if (error := _validate_upload_file(file))}
+    valid_files = [file for file in files if file not in errors]
+    hashes = dict(
+        zip(valid_files, await asyncio.gather(*[run_in_threadpool(file_sha256, file.file) for file in valid_files]))
+    )
+
+    media_files_storage = MediaFilesStorage(db)
+    stored = await media_files_storage.use_by_sha256(set(hashes.values())) if hashes else {}
+    images = {
+        sha256: _uploaded_image(media_file, media_file.key, media_storage, background_tasks)
+        for sha256, media_file in stored.items()
+    }
+    # Files repeated within the batch are uploaded once
+    new_files = {sha256: file for file, sha256 in hashes.items() if sha256 not in images}
+
+    semaphore = asyncio.Semaphore(settings.upload_batch_concurrency)
+
+    async def upload_one(sha256: str, file: UploadFile) -> str | None:
+        async with semaphore:
+            try:
+                await media_storage.upload_file(
+                    new_content_key(sha256), content=file.file, content_type=file.content_type
+                )
+            except UploadError as e:
+                return f"File upload error, details: {e}"
+        return None
+
+    upload_errors = await asyncio.gather(*[upload_one(sha256, file) for sha256, file in new_files.items()])
+    for (sha256, file), error in zip(new_files.items(), upload_errors):
+        if error:
+            errors.update({same_file: error for same_file, same_sha256 in hashes.items() if same_sha256 == sha256})
+            continue
+
+        media_file = await media_files_storage.add_content(
+            key=new_content_key(sha256),
+            sha256=sha256,
+            user_id=current_user.id,
+            size=file.size,
+            content_type=file.content_type,
+        )
+        images[sha256] = _uploaded_image(media_file, new_content_key(sha256), media_storage, background_tasks)
+    await db.commit()
+
+    return BatchUploadResponse(
+        results=[
+            UploadResult(filename=file.filename, error=errors[file])
+            if file in errors
+            else UploadResult(filename=file.filename, image=images[hashes[file]])
+            for file in files
+        ]
+    )
+
+
+@files_router.post(
+    "/image/upload/stream/",
+    status_code=status.HTTP_200_OK,
+    description=(
+        f"Uploading raw {ALLOWED_IMAGE_CONTENT_TYPE} request body to media storage. "
+        "The body is streamed to the storage as it comes, invalid or too large files are rejected early"
+    ),
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {ALLOWED_IMAGE_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}}},
+        }
+    },
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": UnauthorizedErrorResponse,
+            "description": "Invalid or expired JWT",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {
+            "model": ValidationErrorResponse,
+            "description": "Invalid content type or file size or file is missing",
+        },
+    },
+)
+async def upload_stream(
+    request: Request,
+    current_user: CurrentUser,
+    media_storage: MediaStorage,
+    db: DBSession,
+    background_tasks: BackgroundTasks,
+) -> MediaStorageImage:
+    if request.headers.get("content-type") != ALLOWED_IMAGE_CONTENT_TYPE:
         raise APIValidationException(
             message=f"Invalid content type, only {ALLOWED_IMAGE_CONTENT_TYPE} is allowed",
         )
-    if file.size > settings.image_size_limit:
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.image_size_limit:
         raise APIValidationException(
-            message=f"Too large file, limit is {settings.image_size_limit}, " f"actual size is {file.size}",
+            message=f"Too large file, limit is {settings.image_size_limit}, actual size is {content_length}",
         )
 
-    file_id = f"pubadmin/user-content/{uuid.uuid4()}.jpeg"
+    # The key is chosen before the content is seen, the content is hashed on the way to the storage
+    file_id = new_user_content_key()
+    digest = hashlib.sha256()
     try:
-        media_storage.upload_file(file_id, content=file.file)
+        size = await media_storage.upload_stream(
+            file_id,
+            hashed_stream(validate_image_stream(request.stream(), size_limit=settings.image_size_limit), digest),
+            content_type=ALLOWED_IMAGE_CONTENT_TYPE,
+        )
     except UploadError as e:
         raise APIException(
             status_code=500,
             message=f"File upload error, details: {e}",
             error_code=ErrorCode.common_internal_error,
         ) from e
-    return MediaStorageImage(file_id=file_id)
+
+    media_file = await MediaFilesStorage(db).add_content(
+        key=file_id,
+        sha256=digest.hexdigest(),
+        user_id=current_user.id,
+        size=size,
+        content_type=ALLOWED_IMAGE_CONTENT_TYPE,
+    )
+    await db.commit()
+    return _uploaded_image(media_file, file_id, media_storage, background_tasks)
+
+
+@files_router.post(
+    "/image/presigned-upload/",
+    status_code=status.HTTP_200_OK,
+    description=(
+        "Issue presigned URL to upload an image directly to the media storage. "
+        "The image must be confirmed with /image/confirm/ before it is used in avatars or posts"
+    ),
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": UnauthorizedErrorResponse,
+            "description": "Invalid or expired JWT",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {"model": ValidationErrorResponse},
+        status.HTTP_501_NOT_IMPLEMENTED: {
+            "model": PresignedUploadUnsupportedErrorResponse,
+            "description": "Media storage does not support presigned uploads",
+        },
+    },
+)
+async def presigned_upload(
+    dto: PresignedUploadRequest, current_user: CurrentUser, media_storage: MediaStorage, db: DBSession
+) -> PresignedUploadResponse:
+    file_id = new_user_content_key()
+    expires_in = settings.presigned_upload_expires_in
+
+    if dto.method == PresignedUploadMethod.PUT and dto.size is None:
+        raise APIValidationException(message="File size is required for PUT uploads")
+
+    try:
+        if dto.method == PresignedUploadMethod.PUT:
+            url = media_storage.generate_presigned_put(
+                file_id, content_type=ALLOWED_IMAGE_CONTENT_TYPE, size=dto.size, expires_in=expires_in
+            )
+            response = PresignedUploadResponse(
+                file_id=file_id,
+                method=dto.method,
+                url=url,
+                headers={"Content-Type": ALLOWED_IMAGE_CONTENT_TYPE, "Content-Length": str(dto.size)},
+                expires_in=expires_in,
+            )
+        else:
+            presigned_post = media_storage.generate_presigned_post(
+                file_id,
+                content_type=ALLOWED_IMAGE_CONTENT_TYPE,
+                max_size=settings.image_size_limit,
+                expires_in=expires_in,
+            )
+            response = PresignedUploadResponse(
+                file_id=file_id,
+                method=dto.method,
+                url=presigned_post["url"],
+                fields=presigned_post["fields"],
+                expires_in=expires_in,
+            )
+    except MediaStorageError as e:
+        # Local storage has no bucket to upload to, files are uploaded through the API instead
+        raise APIException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            message=f"Presigned uploads are not supported by the media storage, details: {e}",
+            error_code=ErrorCode.files_presigned_upload_unsupported,
+        ) from e
+
+    MediaFilesStorage(db).add(key=file_id, user_id=current_user.id, status=MediaFileStatus.PENDING)
+    await db.commit()
+    return response
+
+
+@files_router.post(
+    "/image/confirm/",
+    status_code=status.HTTP_200_OK,
+    description="Check the image uploaded with presigned URL and allow to use it",
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": UnauthorizedErrorResponse,
+            "description": "Invalid or expired JWT",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": NotFoundErrorResponse,
+            "description": "Upload was not issued for the user",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {
+            "model": ValidationErrorResponse,
+            "description": "File is not uploaded or has invalid content type or size",
+        },
+    },
+)
+async def confirm_upload(
+    dto: ConfirmUploadRequest,
+    current_user: CurrentUser,
+    media_storage: MediaStorage,
+    db: DBSession,
+    background_tasks: BackgroundTasks,
+) -> MediaStorageImage:
+    media_file = await MediaFilesStorage(db).get(dto.file_id)
+    if not media_file or media_file.user_id != current_user.id:
+        raise APINotFoundException("Upload not found")
+
+    if media_file.status == MediaFileStatus.CONFIRMED:
+        return MediaStorageImage(file_id=media_file.key, derivatives=media_file.derivatives)
+
+    try:
+        file_info = await media_storage.head_file(media_file.key)
+    except MediaStorageError as e:
+        raise APIException(
+            status_code=500,
+            message=f"Media storage error, details: {e}",
+            error_code=ErrorCode.common_internal_error,
+        ) from e
+
+    if not file_info:
+        raise APIValidationException(message="File is not uploaded yet")
+    if (
+        file_info.content_type != ALLOWED_IMAGE_CONTENT_TYPE
+        or not file_info.size
+        or file_info.size > settings.image_size_limit
+    ):
+        await media_storage.delete_file(media_file.key)
+        raise APIValidationException(
+            message=(
+                f"Invalid file, only {ALLOWED_IMAGE_CONTENT_TYPE} up to {settings.image_size_limit} bytes is allowed"
+            ),
+        )
+
+    # Uploaded straight to the bucket, the content is only seen now
+    sha256 = await _stored_file_sha256(media_storage, media_file.key, file_info.size)
+    stored_file = await MediaFilesStorage(db).add_content(
+        key=media_file.key,
+        sha256=sha256,
+        user_id=current_user.id,
+        size=file_info.size,
+        content_type=file_info.content_type,
+    )
+    await db.commit()
+    return _uploaded_image(stored_file, media_file.key, media_storage, background_tasks)
+
+
+@files_router.post(
+    "/image/uploads/",
+    status_code=status.HTTP_201_CREATED,
+    description=(
+        "Start resumable image upload. The file is sent with chunks of `chunk_size` bytes, "
+        "an interrupted upload is continued from the `offset` of the session"
+    ),
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": UnauthorizedErrorResponse,
+            "description": "Invalid or expired JWT",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {"model": ValidationErrorResponse},
+    },
+)
+async def create_upload_session(
+    dto: CreateUploadSessionRequest, current_user: CurrentUser, media_storage: MediaStorage, db: DBSession
+) -> UploadSessionResponse:
+    file_id = new_user_content_key()
+    try:
+        s3_upload_id = await media_storage.create_multipart_upload(file_id, content_type=ALLOWED_IMAGE_CONTENT_TYPE)
+    except UploadError as e:
+        raise APIException(
+            status_code=500,
+            message=f"File upload error, details: {e}",
+            error_code=ErrorCode.common_internal_error,
+        ) from e
+
+    MediaFilesStorage(db).add(key=file_id, user_id=current_user.id, status=MediaFileStatus.PENDING)
+    upload_session = UploadSessionsStorage(db).add(
+        user_id=current_user.id,
+        key=file_id,
+        s3_upload_id=s3_upload_id,
+        size=dto.size,
+        chunk_size=settings.upload_session_chunk_size,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=settings.upload_session_expires_in),
+    )
+    await db.commit()
+    return UploadSessionResponse.from_session(upload_session)
+
+
+@files_router.get(
+    "/image/uploads/{session_id}/",
+    status_code=status.HTTP_200_OK,
+    description="Get upload session state to resume the upload from its `offset`",
+    responses=UPLOAD_SESSION_RESPONSES,
+)
+async def get_upload_session(session_id: UUID, current_user: CurrentUser, db: DBSession) -> UploadSessionResponse:
+    upload_session = await _get_upload_session(db, session_id, current_user.id)
+    return UploadSessionResponse.from_session(upload_session)
+
+
+@files_router.put(
+    "/image/uploads/{session_id}/",
+    status_code=status.HTTP_200_OK,
+    description="Upload the chunk of the file starting at `offset`, the chunk is sent as raw request body",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}},
+        }
+    },
+    responses={
+        **UPLOAD_SESSION_RESPONSES,
+        status.HTTP_409_CONFLICT: {
+            "model": UploadOffsetMismatchErrorResponse,
+            "description": (
+                "Chunk does not start at the session offset, resume from the offset in details. "
+                "When the offset is the file size, all the chunks are uploaded and the upload is to be finalized"
+            ),
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {
+            "model": ValidationErrorResponse,
+            "description": "Invalid chunk size or file is not a JPEG image",
+        },
+    },
+)
+async def upload_chunk(
+    session_id: UUID,
+    request: Request,
+    current_user: CurrentUser,
+    media_storage: MediaStorage,
+    db: DBSession,
+    offset: int = Query(ge=0),
+) -> UploadSessionResponse:
+    upload_session = await _get_upload_session(db, session_id, current_user.id)
+    # A complete session takes no more chunks, an empty one past the end would turn the last part into a short one
+    if offset != upload_session.offset or upload_session.offset >= upload_session.size:
+        raise _offset_mismatch(upload_session.offset)
+
+    expected_length = min(upload_session.chunk_size, upload_session.size - offset)
+    chunks = _read_chunk(request.stream(), expected_length)
+    if offset == 0:
+        chunks = validate_image_stream(chunks, size_limit=expected_length)
+    chunk = b"".join([part async for part in chunks])
+    if len(chunk) != expected_length:
+        raise APIValidationException(message=f"Invalid chunk size, expected {expected_length} bytes")
+
+    # Chunks are aligned to parts, so a retried chunk overwrites its part instead of adding a new one
+    part_number = offset // upload_session.chunk_size + 1
+    try:
+        part_etag = await media_storage.upload_part(upload_session.key, upload_session.s3_upload_id, part_number, chunk)
+    except UploadError as e:
+        raise APIException(
+            status_code=500,
+            message=f"File upload error, details: {e}",
+            error_code=ErrorCode.common_internal_error,
+        ) from e
+
+    new_offset = await UploadSessionsStorage(db).advance(upload_session.id, offset, len(chunk), part_etag)
+    if new_offset is None:
+        await db.rollback()
+        raise _offset_mismatch((await _get_upload_session(db, session_id, current_user.id)).offset)
+    await db.commit()
+    return UploadSessionResponse.from_session(upload_session, offset=new_offset)
+
+
+@files_router.post(
+    "/image/uploads/{session_id}/finalize/",
+    status_code=status.HTTP_200_OK,
+    description="Assemble the uploaded chunks into the file, the file is ready to use in avatars or posts",
+    responses={
+        **UPLOAD_SESSION_RESPONSES,
+        status.HTTP_409_CONFLICT: {
+            "model": UploadOffsetMismatchErrorResponse,
+            "description": "Not all the chunks are uploaded yet, resume from the offset in details",
+        },
+    },
+)
+async def finalize_upload_session(
+    session_id: UUID,
+    current_user: CurrentUser,
+    media_storage: MediaStorage,
+    db: DBSession,
+    background_tasks: BackgroundTasks,
+) -> MediaStorageImage:
+    upload_session = await _get_upload_session(db, session_id, current_user.id)
+    if upload_session.offset != upload_session.size:
+        raise _offset_mismatch(upload_session.offset)
+
+    try:
+        await media_storage.complete_multipart_upload(
+            upload_session.key, upload_session.s3_upload_id, upload_session.part_etags
+        )
+    except UploadError as e:
+        raise APIException(
+            status_code=500,
+            message=f"File upload error, details: {e}",
+            error_code=ErrorCode.common_internal_error,
+        ) from e
+
+    # Chunks come in separate requests, so the content is hashed once it is assembled
+    sha256 = await _stored_file_sha256(media_storage, upload_session.key, upload_session.size)
+    await UploadSessionsStorage(db).delete(upload_session)
+    media_file = await MediaFilesStorage(db).add_content(
+        key=upload_session.key,
+        sha256=sha256,
+        user_id=current_user.id,
+        size=upload_session.size,
+        content_type=ALLOWED_IMAGE_CONTENT_TYPE,
+    )
+    await db.commit()
+    return _uploaded_image(media_file, upload_session.key, media_storage, background_tasks)
+
+
+@files_router.delete(
+    "/image/uploads/{session_id}/",
+    status_code=status.HTTP_204_NO_CONTENT,
+    response_class=Response,
+    description="Abort resumable upload and drop the uploaded chunks",
+    responses=UPLOAD_SESSION_RESPONSES,
+)
+async def abort_upload_session(
+    session_id: UUID, current_user: CurrentUser, media_storage: MediaStorage, db: DBSession
+) -> None:
+    upload_session = await _get_upload_session(db, session_id, current_user.id)
+    await media_storage.discard_multipart_upload(upload_session.key, upload_session.s3_upload_id)
+    await UploadSessionsStorage(db).delete(upload_session, with_media_file=True)
+    await db.commit()
+
+
+def _validate_upload_file(file: UploadFile) -> str | None:
+    if file.content_type != ALLOWED_IMAGE_CONTENT_TYPE:
+        return f"Invalid content type, only {ALLOWED_IMAGE_CONTENT_TYPE} is allowed"
+    if file.size > settings.image_size_limit:
+        return f"Too large file, limit is {settings.image_size_limit}, actual size is {file.size}"
+    return None
+
+
+def _uploaded_image(
+    media_file: MediaFile, uploaded_key: str, media_storage: AsyncMediaStorage, background_tasks: BackgroundTasks
+) -> MediaStorageImage:
+    """
+    Image of the file registered for the content uploaded under `uploaded_key`. When the same content was stored
+    before, the uploaded copy is deleted once the response is sent
+    """
+    if media_file.key != uploaded_key:
+        background_tasks.add_task(media_storage.delete_file, uploaded_key)
+    if not media_file.derivatives:
+        # Generation for a stored file may have failed or still be running, the latter is just repeated
+        background_tasks.add_task(generate_derivatives, media_storage, media_file.key)
+    return MediaStorageImage(file_id=media_file.key, derivatives=media_file.derivatives)
+
+
+async def _stored_file_sha256(media_storage: AsyncMediaStorage, key: str, size: int) -> str:
+    try:
+        return await stream_sha256(media_storage.stream_file(key, 0, size - 1))
+    except MediaStorageError as e:
+        raise APIException(
+            status_code=500,
+            message=f"Media storage error, details: {e}",
+            error_code=ErrorCode.common_internal_error,
+        ) from e
+
+
+async def _get_upload_session(db: DBSession, session_id: UUID, user_id: int) -> UploadSession:
+    upload_session = await UploadSessionsStorage(db).get(session_id)
+    if not upload_session or upload_session.user_id != user_id:
+        raise APINotFoundException("Upload session not found")
+    return upload_session
+
+
+def _offset_mismatch(offset: int) -> APIException:
+    return APIException(
+        status_code=status.HTTP_409_CONFLICT,
+        error_code=ErrorCode.files_upload_offset_mismatch,
+        message=f"Upload session is at offset {offset}",
+        detail=UploadOffsetDetails(offset=offset).model_dump(),
+    )
+
+
+async def _read_chunk(chunks: AsyncIterable[bytes], max_size: int) -> AsyncIterator[bytes]:
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_size:
+            raise APIValidationException(message=f"Invalid chunk size, expected {max_size} bytes")
+        yield chunk
+
+
+async def validate_image_stream(chunks: AsyncIterable[bytes], size_limit: int) -> AsyncIterator[bytes]:
+    """Pass the stream through, failing as soon as it turns out not to be a JPEG or exceeds the size limit"""
+    head = b""
+    size = 0
+
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > size_limit:
+            raise APIValidationException(message=f"Too large file, limit is {size_limit}")
+
+        if len(head) < len(JPEG_MAGIC_BYTES):
+            head += chunk[: len(JPEG_MAGIC_BYTES) - len(head)]
+            if not JPEG_MAGIC_BYTES.startswith(head):
+                raise APIValidationException(message="File is not a valid JPEG image")
+
+        yield chunk
+
+    if len(head) < len(JPEG_MAGIC_BYTES):
+        raise APIValidationException(message="File is not a valid JPEG image")
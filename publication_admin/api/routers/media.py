@@ -0,0 +1,115 @@
+from dataclasses import asdict
+from typing import Literal
+
+from fastapi import APIRouter, Request, Response, status
+from fastapi.responses import StreamingResponse
+
+from publication_admin.api.deps import MediaStorage
+from publication_admin.api.errors import (
+    APIException,
+    APINotFoundException,
+    ErrorCode,
+    ErrorResponse,
+    NotFoundErrorResponse,
+)
+from publication_admin.api.etags import etag_matches
+from publication_admin.api.responses import PydanticJSONRoute
+from publication_admin.api.streaming import FileRangeResponse, RangeNotSatisfiableError, parse_range
+from publication_admin.media_storage.cache import CachedFile, get_media_cache
+from publication_admin.media_storage.keys import is_user_content_key
+from publication_admin.settings import settings
+
+media_router = APIRouter(route_class=PydanticJSONRoute, tags=["media"])
+
+RangeNotSatisfiableErrorResponse = ErrorResponse[Literal[ErrorCode.media_range_not_satisfiable], None]
+
+
+@media_router.get(
+    "/{key:path}",
+    name="get_media",
+    status_code=status.HTTP_200_OK,
+    description=(
+        "Uploaded image or its derivative from the storage. Hot files are served from the local disk cache, "
+        "single byte ranges and conditional requests with ETag are supported. "
+        "Not served for private buckets, their files are only given out by presigned URLs"
+    ),
+    response_class=Response,
+    responses={
+        status.HTTP_200_OK: {"content": {"image/jpeg": {}}, "description": "Whole file"},
+        status.HTTP_206_PARTIAL_CONTENT: {"content": {"image/jpeg": {}}, "description": "Requested byte range"},
+        status.HTTP_304_NOT_MODIFIED: {"description": "File matches the If-None-Match ETag"},
+        status.HTTP_404_NOT_FOUND: {
+            "model": NotFoundErrorResponse,
+            "description": "File not found, is not an uploaded image or the bucket is private",
+        },
+        status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE: {
+            "model": RangeNotSatisfiableErrorResponse,
+            "description": "Range starts past the end of the file",
+        },
+    },
+)
+async def get_media(key: str, request: Request, media_storage: MediaStorage) -> Response:
+    media_storage_settings = settings.media_storage
+    if media_storage_settings.media_storage_presigned_urls and media_storage_settings.media_storage_backend == "s3":
+        # Objects of a private bucket are only given out by presigned URLs
+        raise APINotFoundException("File not found")
+    if not is_user_content_key(key):
+        # Only the uploaded images and their derivatives are media, other objects like LoRA weights are not served
+        raise APINotFoundException("File not found")
+    media_cache = get_media_cache()
+
+    file = media_cache.get(key)
+    if file is None and (path := media_storage.file_path(key)):
+        # Storage keeps files on the local disk already, they are sent from there
+        file_info = await media_storage.head_file(key)
+        if file_info is None:
+            raise APINotFoundException("File not found")
+        file = CachedFile(path=path, **asdict(file_info))
+    elif file is None:
+        file = await media_storage.head_file(key)
+        if file is None:
+            raise APINotFoundException("File not found")
+        if file.size <= media_storage_settings.media_storage_cache_max_file_size:
+            file = await media_cache.fetch(media_storage, key)
+            if file is None:
+                raise APINotFoundException("File not found")
+
+    headers = {
+        "accept-ranges": "bytes",
+        "cache-control": f"public, max-age={media_storage_settings.media_storage_cache_max_age}, immutable",
+        "etag": file.etag,
+    }
+    if etag_matches(request.headers.get("if-none-match"), file.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    # A range of a changed file would be glued to a stale prefix, so the whole file is sent instead
+    if range_header and request.headers.get("if-range", file.etag) == file.etag:
+        try:
+            byte_range = parse_range(range_header, file.size)
+        except RangeNotSatisfiableError as e:
+            raise APIException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                error_code=ErrorCode.media_range_not_satisfiable,
+                message="Requested range is not satisfiable",
+                headers={"content-range": f"bytes */{file.size}"},
+            ) from e
+
+    status_code = status.HTTP_200_OK
+    start, end = 0, file.size - 1
+    if byte_range is not None:
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{file.size}"
+    media_type = file.content_type or "application/octet-stream"
+
+    if isinstance(file, CachedFile):
+        return FileRangeResponse(
+            file.path, start, end - start + 1, status_code=status_code, headers=headers, media_type=media_type
+        )
+
+    headers["content-length"] = str(end - start + 1)
+    return StreamingResponse(
+        media_storage.stream_file(key, start, end), status_code=status_code, headers=headers, media_type=media_type
+    )
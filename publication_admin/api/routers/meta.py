@@ -1,9 +1,24 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from publication_admin.api.responses import PydanticJSONRoute
+from publication_admin.metrics import get_registry
 
 # Metrics, healthchecks, etc.
-meta_router = APIRouter(tags=["meta"])
+meta_router = APIRouter(route_class=PydanticJSONRoute, tags=["meta"])
 
 
 @meta_router.get("/ping/")
 async def ping():
     return "ok"
+
+
+@meta_router.get(
+    "/metrics",
+    description="Metrics in Prometheus text format, aggregated over all the workers",
+    response_class=Response,
+    responses={200: {"content": {CONTENT_TYPE_LATEST: {}}}},
+)
+def metrics() -> Response:
+    # Not async: in the multiprocess mode metrics are read from the files of every worker
+    return Response(generate_latest(get_registry()), media_type=CONTENT_TYPE_LATEST)
@@ -1,16 +1,50 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime
-from typing import List
+from enum import StrEnum
+from functools import partial
+from typing import AsyncIterator, List
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, status
-from pydantic import BaseModel, ConfigDict
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, computed_field
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from publication_admin.api.deps import CurrentUser, get_db
-from publication_admin.api.errors import APIException, ErrorCode, UnauthorizedErrorResponse
+from publication_admin.api.deps import CurrentUser, MediaStorage, get_db
+from publication_admin.api.errors import (
+    APIException,
+    APINotFoundException,
+    APIValidationException,
+    ErrorCode,
+    NotFoundErrorResponse,
+    UnauthorizedErrorResponse,
+    ValidationErrorResponse,
+)
+from publication_admin.api.etags import etag_headers, make_etag, not_modified
+from publication_admin.api.images import (
+    ensure_images_confirmed,
+    find_image_errors,
+    get_derivative_keys,
+    media_url,
+    media_urls_epoch,
+)
+from publication_admin.api.responses import PydanticJSONResponse, PydanticJSONRoute
+from publication_admin.api.streaming import (
+    CSV_MEDIA_TYPE,
+    GZIP_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    buffered_stream,
+    csv_stream,
+    gzip_stream,
+    ndjson_stream,
+)
+from publication_admin.db.models import Post
+from publication_admin.db.posts_import import ImportedPost, PostsImporter
 from publication_admin.db.storages import AvatarsStorage, PostStorage
+from publication_admin.media_storage.derivatives import ImageDerivative
+from publication_admin.settings import settings
 
-posts_router = APIRouter(tags=["post"])
+posts_router = APIRouter(route_class=PydanticJSONRoute, tags=["post"])
 
 
 class DeletedPostResponse(BaseModel):
@@ -30,29 +64,218 @@ class PostResponse(BaseModel):
     post_text: str = ""
     images: list[str] = []
     created_at: datetime
+    updated_at: datetime | None = None
+
+    @computed_field
+    def image_urls(self) -> list[str]:
+        return [media_url(key) for key in self.images]
+
+
+class PostWithThumbnailsResponse(PostResponse):
+    thumbnails: dict[str, str] = Field(default={}, description="Thumbnail keys of the images which have them")
+
+    @computed_field
+    def thumbnail_urls(self) -> dict[str, str]:
+        """Thumbnail URLs of the images which have them"""
+        return {image: media_url(key) for image, key in self.thumbnails.items()}
+
+
+class PostChangesResponse(BaseModel):
+    upserts: list[PostResponse]
+    deletions: list[UUID]
+    cursor: str = Field(description="Pass as `cursor` to get the next changes")
+    has_more: bool = Field(description="More changes are ready, request them with the cursor right away")
+
+
+class RejectedLineResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    line: int
+    error: str
+
+
+class ImportPostsResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    imported: int
+    rejected: int
+    rejects: list[RejectedLineResponse]
+
+
+class ExportFormat(StrEnum):
+    NDJSON: str = "ndjson"
+    CSV: str = "csv"
+
+
+class BatchCreatePostsRequest(BaseModel):
+    posts: list[PostCreate] = Field(min_length=1, max_length=settings.posts_batch_size_limit)
+
+
+class BatchCreatePostsResponse(BaseModel):
+    posts: list[PostResponse]
+
+
+class BatchDeletePostsRequest(BaseModel):
+    post_uuids: list[UUID] = Field(min_length=1, max_length=settings.posts_batch_size_limit)
+
+
+class DeletePostResult(BaseModel):
+    post_uuid: UUID
+    deleted: bool
+
+
+class BatchDeletePostsResponse(BaseModel):
+    results: list[DeletePostResult]
 
 
 @posts_router.get(
     "/",
     description="Get posts for user",
+    response_model=List[PostWithThumbnailsResponse],
     responses={
+        status.HTTP_304_NOT_MODIFIED: {"description": "Posts match the If-None-Match ETag"},
         status.HTTP_401_UNAUTHORIZED: {
             "model": UnauthorizedErrorResponse,
             "description": "Invalid or expired JWT",
-        }
+        },
     },
 )
-async def get_posts(current_user: CurrentUser, db: AsyncSession = Depends(get_db)) -> List[PostResponse]:
+async def get_posts(request: Request, current_user: CurrentUser, db: AsyncSession = Depends(get_db)) -> Response:
     avatar_storage = AvatarsStorage(db)
     current_avatar = await avatar_storage.get_by_user_id(current_user.id)
     post_storage = PostStorage(db)
+
+    etag = make_etag(current_avatar.id, *await post_storage.get_version(current_avatar.id), media_urls_epoch())
+    if response := not_modified(request, etag):
+        return response
+
     posts = await post_storage.get_posts_by_avatar(avatar_id=current_avatar.id)
-    return [PostResponse.model_validate(post) for post in posts]
+
+    thumbnails = await get_derivative_keys(
+        db, [image for post in posts for image in post.images], ImageDerivative.THUMBNAIL
+    )
+    responses = []
+    for post in posts:
+        response = PostWithThumbnailsResponse.model_validate(post)
+        response.thumbnails = {image: thumbnails[image] for image in post.images if image in thumbnails}
+        responses.append(response)
+    return PydanticJSONResponse(responses, headers=etag_headers(etag))
+
+
+@posts_router.get(
+    "/export",
+    description="Stream all posts of the current avatar as NDJSON or CSV file, optionally gzipped",
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {"content": {NDJSON_MEDIA_TYPE: {}, CSV_MEDIA_TYPE: {}, GZIP_MEDIA_TYPE: {}}},
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": UnauthorizedErrorResponse,
+            "description": "Invalid or expired JWT",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": NotFoundErrorResponse,
+            "description": "User do not have any avatar",
+        },
+    },
+)
+async def export_posts(
+    current_user: CurrentUser,
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    gzip: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    avatar_storage = AvatarsStorage(db)
+    current_avatar = await avatar_storage.get_by_user_id(current_user.id)
+    if not current_avatar:
+        raise APINotFoundException()
+
+    posts = _post_responses(PostStorage(db).stream_posts_by_avatar(avatar_id=current_avatar.id))
+    if export_format == ExportFormat.CSV:
+        content, media_type = csv_stream(posts, fieldnames=PostResponse.model_fields), CSV_MEDIA_TYPE
+    else:
+        content, media_type = ndjson_stream(posts), NDJSON_MEDIA_TYPE
+    content = buffered_stream(content)
+
+    filename = f"posts.{export_format}"
+    if gzip:
+        content, media_type, filename = gzip_stream(content), GZIP_MEDIA_TYPE, f"{filename}.gz"
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@posts_router.get(
+    "/changes",
+    description=(
+        "Get posts created, updated or deleted since the cursor returned by the previous call, "
+        "oldest changes first. Without `cursor` all posts are returned"
+    ),
+    response_model=PostChangesResponse,
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": UnauthorizedErrorResponse,
+            "description": "Invalid or expired JWT",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": NotFoundErrorResponse,
+            "description": "User do not have any avatar",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {
+            "model": ValidationErrorResponse,
+            "description": "Invalid cursor or limit",
+        },
+    },
+)
+async def get_posts_changes(
+    current_user: CurrentUser,
+    cursor: str | None = None,
+    limit: int = Query(default=settings.posts_changes_limit, ge=1, le=settings.posts_changes_limit),
+    db: AsyncSession = Depends(get_db),
+) -> PydanticJSONResponse:
+    avatar_storage = AvatarsStorage(db)
+    current_avatar = await avatar_storage.get_by_user_id(current_user.id)
+    if not current_avatar:
+        raise APINotFoundException()
+
+    after = decode_changes_cursor(cursor) if cursor else None
+    post_storage = PostStorage(db)
+    # Transactions in progress may still commit changes stamped with lower IDs than the ones already committed,
+    # so only changes of the transactions before all of them are returned and the cursor never passes them
+    horizon = await post_storage.get_sync_horizon()
+    posts = await post_storage.get_changed_posts(
+        avatar_id=current_avatar.id, until=horizon, after=after, limit=limit + 1
+    )
+    tombstones = (
+        await post_storage.get_tombstones(avatar_id=current_avatar.id, until=horizon, after=after, limit=limit + 1)
+        if after
+        else []
+    )
+
+    changes = sorted(
+        [(post.xact_id, post.uuid, post) for post in posts]
+        + [(tombstone.xact_id, tombstone.uuid, tombstone) for tombstone in tombstones],
+        key=lambda change: change[:2],
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    next_after = changes[-1][:2] if has_more else (horizon, UUID(int=0))
+    return PydanticJSONResponse(
+        PostChangesResponse(
+            upserts=[PostResponse.model_validate(change) for *_, change in changes if isinstance(change, Post)],
+            deletions=[change_uuid for _, change_uuid, change in changes if not isinstance(change, Post)],
+            cursor=encode_changes_cursor(*next_after),
+            has_more=has_more,
+        )
+    )
 
 
 @posts_router.get(
     "/{post_uuid}",
     description="Get single post by ID",
+    response_model=PostResponse,
     responses={
         status.HTTP_401_UNAUTHORIZED: {
             "model": UnauthorizedErrorResponse,
@@ -65,7 +288,7 @@ async def get_posts(current_user: CurrentUser, db: AsyncSession = Depends(get_db
 )
 async def get_post_by_id(
     post_uuid: UUID, current_user: CurrentUser, db: AsyncSession = Depends(get_db)
-) -> PostResponse:
+) -> PydanticJSONResponse:
     avatar_storage = AvatarsStorage(db)
     current_avatar = await avatar_storage.get_by_user_id(current_user.id)
     post_storage = PostStorage(db)
@@ -76,7 +299,7 @@ async def get_post_by_id(
             error_code=ErrorCode.common_not_found,
             message="Post not found",
         )
-    return PostResponse.model_validate(post[0])
+    return PydanticJSONResponse(PostResponse.model_validate(post[0]))
 
 
 @posts_router.post(
@@ -93,6 +316,7 @@ async def get_post_by_id(
 async def create_post(dto: PostCreate, current_user: CurrentUser, db: AsyncSession = Depends(get_db)) -> PostResponse:
     avatar_storage = AvatarsStorage(db)
     current_avatar = await avatar_storage.get_by_user_id(current_user.id)
+    await ensure_images_confirmed(db, dto.images)
     post_storage = PostStorage(db)
     new_post = await post_storage.create(avatar_id=current_avatar.id, post_text=dto.post_text, images=dto.images)
     return PostResponse.model_validate(new_post)
@@ -126,3 +350,128 @@ async def delete_post(
             message="Post not found",
         )
     return DeletedPostResponse(deleted_post_uuid=deleted_post)
+
+
+@posts_router.post(
+    "/batch",
+    description=f"Create up to {settings.posts_batch_size_limit} posts in one request",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": UnauthorizedErrorResponse,
+            "description": "Invalid or expired JWT",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": NotFoundErrorResponse,
+            "description": "User do not have any avatar",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {"model": ValidationErrorResponse},
+    },
+)
+async def create_posts_batch(
+    dto: BatchCreatePostsRequest, current_user: CurrentUser, db: AsyncSession = Depends(get_db)
+) -> BatchCreatePostsResponse:
+    avatar_storage = AvatarsStorage(db)
+    current_avatar = await avatar_storage.get_by_user_id(current_user.id)
+    if not current_avatar:
+        raise APINotFoundException()
+    await ensure_images_confirmed(db, [image for post in dto.posts for image in post.images])
+
+    post_storage = PostStorage(db)
+    new_posts = await post_storage.create_many(
+        avatar_id=current_avatar.id,
+        posts=[(post.post_text, post.images) for post in dto.posts],
+    )
+    return BatchCreatePostsResponse(posts=[PostResponse.model_validate(post) for post in new_posts])
+
+
+@posts_router.post(
+    "/batch/delete",
+    description=f"Delete up to {settings.posts_batch_size_limit} posts in one request",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": UnauthorizedErrorResponse,
+            "description": "Invalid or expired JWT",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": NotFoundErrorResponse,
+            "description": "User do not have any avatar",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {"model": ValidationErrorResponse},
+    },
+)
+async def delete_posts_batch(
+    dto: BatchDeletePostsRequest, current_user: CurrentUser, db: AsyncSession = Depends(get_db)
+) -> BatchDeletePostsResponse:
+    avatar_storage = AvatarsStorage(db)
+    current_avatar = await avatar_storage.get_by_user_id(current_user.id)
+    if not current_avatar:
+        raise APINotFoundException()
+
+    post_storage = PostStorage(db)
+    deleted_post_uuids = await post_storage.delete_many(avatar_id=current_avatar.id, post_uuids=dto.post_uuids)
+    return BatchDeletePostsResponse(
+        results=[
+            DeletePostResult(post_uuid=post_uuid, deleted=post_uuid in deleted_post_uuids)
+            for post_uuid in dto.post_uuids
+        ]
+    )
+
+
+@posts_router.post(
+    "/import",
+    description=(
+        "Import posts of the current avatar from NDJSON request body, one post per line. "
+        "Valid lines are loaded in chunks, invalid ones are skipped and reported. "
+        "Lines referring to unconfirmed or missing uploads are invalid"
+    ),
+    status_code=status.HTTP_200_OK,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {NDJSON_MEDIA_TYPE: {"schema": ImportedPost.model_json_schema()}},
+        }
+    },
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": UnauthorizedErrorResponse,
+            "description": "Invalid or expired JWT",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": NotFoundErrorResponse,
+            "description": "User do not have any avatar",
+        },
+    },
+)
+async def import_posts(
+    request: Request, current_user: CurrentUser, media_storage: MediaStorage, db: AsyncSession = Depends(get_db)
+) -> ImportPostsResponse:
+    avatar_storage = AvatarsStorage(db)
+    current_avatar = await avatar_storage.get_by_user_id(current_user.id)
+    if not current_avatar:
+        raise APINotFoundException()
+
+    importer = PostsImporter(
+        db, avatar_id=current_avatar.id, check_images=partial(find_image_errors, db, media_storage)
+    )
+    result = await importer.run(request.stream())
+    return ImportPostsResponse.model_validate(result)
+
+
+async def _post_responses(posts: AsyncIterator[Post]) -> AsyncIterator[PostResponse]:
+    async for post in posts:
+        yield PostResponse.model_validate(post)
+
+
+def encode_changes_cursor(xact_id: int, uuid: UUID) -> str:
+    """Opaque cursor of the posts changes, changes after the (xact_id, uuid) pair come next"""
+    return urlsafe_b64encode(f"{xact_id}|{uuid}".encode()).decode()
+
+
+def decode_changes_cursor(cursor: str) -> tuple[int, UUID]:
+    try:
+        xact_id, uuid = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return int(xact_id), UUID(uuid)
+    except ValueError as e:
+        raise APIValidationException(message="Invalid cursor") from e
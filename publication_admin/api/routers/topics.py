@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, Response, status
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from publication_admin.api.deps import get_current_user, get_db
 from publication_admin.api.errors import UnauthorizedErrorResponse
+from publication_admin.api.etags import etag_headers, make_etag, not_modified
+from publication_admin.api.responses import PydanticJSONResponse, PydanticJSONRoute
 from publication_admin.db.storages import TopicsStorage
 
-topics_router = APIRouter(dependencies=[Depends(get_current_user)], tags=["topic"])
+topics_router = APIRouter(route_class=PydanticJSONRoute, dependencies=[Depends(get_current_user)], tags=["topic"])
 
 
 class TopicResponse(BaseModel):
@@ -16,13 +18,20 @@ class TopicResponse(BaseModel):
 @topics_router.get(
     "/",
     status_code=status.HTTP_200_OK,
+    response_model=list[TopicResponse],
     responses={
+        status.HTTP_304_NOT_MODIFIED: {"description": "Topics match the If-None-Match ETag"},
         status.HTTP_401_UNAUTHORIZED: {
             "model": UnauthorizedErrorResponse,
             "description": "Invalid or expired JWT",
         },
     },
 )
-async def get_all(db: AsyncSession = Depends(get_db)) -> list[TopicResponse]:
-    topics = await TopicsStorage(db).all()
-    return [TopicResponse(name=topic.name) for topic in topics]
+async def get_all(request: Request, db: AsyncSession = Depends(get_db)) -> Response:
+    topics_storage = TopicsStorage(db)
+    etag = make_etag(*await topics_storage.get_version())
+    if response := not_modified(request, etag):
+        return response
+
+    topics = await topics_storage.all()
+    return PydanticJSONResponse([TopicResponse(name=topic.name) for topic in topics], headers=etag_headers(etag))
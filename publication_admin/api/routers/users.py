@@ -3,8 +3,9 @@ from pydantic import BaseModel
 
 from publication_admin.api.deps import CurrentUser
 from publication_admin.api.errors import UnauthorizedErrorResponse
+from publication_admin.api.responses import PydanticJSONResponse, PydanticJSONRoute
 
-users_router = APIRouter(tags=["user"])
+users_router = APIRouter(route_class=PydanticJSONRoute, tags=["user"])
 
 
 class UserResponse(BaseModel):
@@ -14,6 +15,7 @@ class UserResponse(BaseModel):
 
 @users_router.get(
     "/me/",
+    response_model=UserResponse,
     responses={
         status.HTTP_401_UNAUTHORIZED: {
             "model": UnauthorizedErrorResponse,
@@ -21,5 +23,5 @@ class UserResponse(BaseModel):
         }
     },
 )
-async def get_user(current_user: CurrentUser) -> UserResponse:
-    return UserResponse(id=current_user.id, email=current_user.email)
+async def get_user(current_user: CurrentUser) -> PydanticJSONResponse:
+    return PydanticJSONResponse(UserResponse(id=current_user.id, email=current_user.email))
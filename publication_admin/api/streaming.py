@@ -0,0 +1,210 @@
+import csv
+import io
+import json
+import time
+import zipfile
+import zlib
+from typing import AsyncIterable, AsyncIterator, Iterable, Mapping
+
+import anyio
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv"
+GZIP_MEDIA_TYPE = "application/gzip"
+ZIP_MEDIA_TYPE = "application/zip"
+
+# Produced bytes are sent to the client in portions of at least this size
+STREAM_FLUSH_SIZE = 64 * 1024
+
+
+async def ndjson_stream(rows: AsyncIterable[BaseModel]) -> AsyncIterator[bytes]:
+    """Serialize every model into a separate JSON line"""
+    async for row in rows:
+        yield row.model_dump_json().encode() + b"\n"
+
+
+async def csv_stream(rows: AsyncIterable[BaseModel], fieldnames: Iterable[str]) -> AsyncIterator[bytes]:
+    """Serialize models as CSV rows with a header, nested values are written as JSON"""
+    fieldnames = list(fieldnames)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    writer.writeheader()
+
+    async for row in rows:
+        data = row.model_dump(mode="json", include=set(fieldnames))
+        writer.writerow(
+            {key: json.dumps(value) if isinstance(value, (list, dict)) else value for key, value in data.items()}
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def buffered_stream(chunks: AsyncIterable[bytes], flush_size: int = STREAM_FLUSH_SIZE) -> AsyncIterator[bytes]:
+    """Coalesce small chunks so the response is not written to the socket row by row"""
+    pending = bytearray()
+
+    async for chunk in chunks:
+        pending += chunk
+        if len(pending) >= flush_size:
+            yield bytes(pending)
+            pending.clear()
+
+    if pending:
+        yield bytes(pending)
+
+
+async def gzip_stream(chunks: AsyncIterable[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Compress the stream on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+class _ZipOutput:
+    """Write-only file the archive is written to, zipfile falls back to data descriptors as it can't seek"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+async def zip_stream(
+    files: AsyncIterable[tuple[str, int, AsyncIterable[bytes]]], flush_size: int = STREAM_FLUSH_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Zip archive of (name, size, contents) files built on the fly. Files are stored as is:
+    the archives are made of JPEGs, which do not compress
+    """
+    output = _ZipOutput()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as archive:
+        async for name, size, chunks in files:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            # Known size lets zipfile decide whether the entry needs ZIP64 extensions
+            info.file_size = size
+            with archive.open(info, "w") as entry:
+                async for chunk in chunks:
+                    entry.write(chunk)
+                    if len(output.buffer) >= flush_size:
+                        yield output.take()
+    yield output.take()
+
+
+class RangeNotSatisfiableError(Exception):
+    pass
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    First and last byte of a single `bytes=` range, None when the whole content should be sent:
+    other units and multiple ranges are allowed to be ignored by RFC 9110
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+
+    first, sep, last = ranges.strip().partition("-")
+    if not sep or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+
+    if not first:
+        # Suffix range, the last N bytes
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiableError
+        return max(size - int(last), 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise RangeNotSatisfiableError
+    if start > end:
+        return None
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """
+    Part of a file on the local disk. Sent with a single sendfile call when the server implements
+    the ASGI zero-copy send extension, read in chunks on a worker thread otherwise
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        offset: int,
+        length: int,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        media_type: str | None = None,
+        background: BackgroundTask | None = None,
+    ) -> None:
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = background
+        self.init_headers(headers)
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Opened before the response starts, a file evicted in between still reads fine on POSIX
+        file = await anyio.open_file(self.path, "rb")
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope["method"] == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            elif "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": file.wrapped.fileno(),
+                        "offset": self.offset,
+                        "count": self.length,
+                        "more_body": False,
+                    }
+                )
+            else:
+                await file.seek(self.offset)
+                remaining = self.length
+                finished = False
+                while remaining:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    finished = not remaining
+                    await send({"type": "http.response.body", "body": chunk, "more_body": not finished})
+                # Empty ranges and files truncated under us still need the closing message
+                if not finished:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await file.aclose()
+
+        if self.background is not None:
+            await self.background()
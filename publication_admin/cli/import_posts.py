@@ -0,0 +1,56 @@
+"""
+Import posts of an avatar from NDJSON file, one post per line:
+
+    python -m publication_admin.cli.import_posts --avatar-id 1 posts.ndjson
+"""
+import argparse
+import asyncio
+import sys
+from functools import partial
+from typing import AsyncIterator, BinaryIO
+
+from loguru import logger
+
+from publication_admin.api.images import find_image_errors
+from publication_admin.db.engine import AsyncSessionFactory
+from publication_admin.db.posts_import import PostsImporter
+from publication_admin.db.storages import AvatarsStorage
+from publication_admin.media_storage.backends import get_media_storage
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+async def read_chunks(file: BinaryIO) -> AsyncIterator[bytes]:
+    while chunk := await asyncio.to_thread(file.read, READ_CHUNK_SIZE):
+        yield chunk
+
+
+async def import_posts(avatar_id: int, file: BinaryIO) -> None:
+    async with AsyncSessionFactory() as session:
+        if await AvatarsStorage(session).get(avatar_id) is None:
+            logger.error(f"Avatar {avatar_id} not found")
+            raise SystemExit(1)
+
+        check_images = partial(find_image_errors, session, get_media_storage())
+        result = await PostsImporter(session, avatar_id=avatar_id, check_images=check_images).run(read_chunks(file))
+
+    for reject in result.rejects:
+        logger.warning(f"Line {reject.line} rejected: {reject.error}")
+    logger.info(f"Done: imported={result.imported} rejected={result.rejected}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import avatar posts from NDJSON file")
+    parser.add_argument("--avatar-id", type=int, required=True)
+    parser.add_argument("path", help="Path to NDJSON file, '-' to read from stdin")
+    args = parser.parse_args()
+
+    if args.path == "-":
+        asyncio.run(import_posts(args.avatar_id, sys.stdin.buffer))
+    else:
+        with open(args.path, "rb") as file:
+            asyncio.run(import_posts(args.avatar_id, file))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,51 @@
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from publication_admin.metrics import DB_POOL_CHECKED_OUT, DB_POOL_CHECKOUTS, DB_POOL_TIMEOUTS, DB_POOL_WAIT_DURATION
 from publication_admin.settings import settings
+from publication_admin.timing import current_server_timing
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Default pool of the async engine, observing how long connections are waited for"""
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_WAIT_DURATION.observe(time.perf_counter() - started_at)
 
-engine = create_async_engine(settings.database.db_connection)
+
+engine = create_async_engine(settings.database.db_connection, poolclass=InstrumentedPool)
 AsyncSessionFactory = async_sessionmaker(engine, expire_on_commit=False)
+
+
+@event.listens_for(engine.sync_engine.pool, "checkout")
+def _on_checkout(*_) -> None:
+    DB_POOL_CHECKOUTS.inc()
+    DB_POOL_CHECKED_OUT.inc()
+
+
+@event.listens_for(engine.sync_engine.pool, "checkin")
+def _on_checkin(*_) -> None:
+    DB_POOL_CHECKED_OUT.dec()
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, *_) -> None:
+    if current_server_timing():
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, *_) -> None:
+    if (server_timing := current_server_timing()) and conn.info.get("query_started_at"):
+        server_timing.add("db", time.perf_counter() - conn.info["query_started_at"].pop())
@@ -1,14 +1,19 @@
 import secrets
+import uuid
 from enum import StrEnum
 from string import ascii_letters
 
-from sqlalchemy import JSON, TIMESTAMP, Column, DateTime, Enum, ForeignKey, Integer, String, Text
+from sqlalchemy import JSON, TIMESTAMP, BigInteger, Column, DateTime, Enum, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.sql import func
 from sqlalchemy.sql import text as sql_text
 
+from .utils import uuid7
+
 LORA_NAME_LENGTH = 11
+# 64-bit ID of the current transaction, rows stamped with it are ordered the way clients sync them, see `PostStorage`
+CURRENT_XACT_ID = "pg_current_xact_id()::text::bigint"
 
 
 class InitStatus(StrEnum):
@@ -17,6 +22,11 @@ class InitStatus(StrEnum):
     SUCCESS: str = "SUCCESS"
 
 
+class MediaFileStatus(StrEnum):
+    PENDING: str = "PENDING"
+    CONFIRMED: str = "CONFIRMED"
+
+
 class BaseModel(DeclarativeBase):
     pass
 
@@ -52,6 +62,11 @@ class Avatar(BaseModel):
     lora_path = Column(String, default="")
     profile_image = Column(String, default="")
     lora_name = Column(String, unique=True, nullable=True)
+    # Bumped by every change made with `AvatarsStorage`, the avatar ETag is derived from it
+    version = Column(Integer, nullable=False, default=1, server_default=sql_text("1"))
+
+    # The version is bumped by SQL, so it is read back while flushing instead of lazily
+    __mapper_args__ = {"eager_defaults": True}
 
     def set_random_lora_name(self):
         self.lora_name = "".join(secrets.choice(ascii_letters) for _ in range(LORA_NAME_LENGTH))
@@ -61,17 +76,98 @@ class Topic(BaseModel):
     __tablename__ = "topics"
 
     name = Column(String, primary_key=True)
+    # Topics are never changed or deleted, so the newest one versions the list
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=sql_text("now()"))
 
 
 class Post(BaseModel):
+    """
+    Posts table is range-partitioned by `created_at` month, so `created_at` is a part of the primary key.
+    New posts get time-ordered UUIDs (v7) generated from their `created_at`, see `PostStorage`.
+    """
+
     __tablename__ = "posts"
 
     uuid = Column(
         UUID(as_uuid=True),
         primary_key=True,
+        default=uuid7,
         server_default=sql_text("uuid_generate_v4()"),
     )
     avatar_id = Column(Integer, ForeignKey("avatars.id", ondelete="CASCADE"))
     post_text = Column(Text, nullable=True, default="")
     images = Column(ARRAY(String), default=list)
+    created_at = Column(TIMESTAMP(timezone=True), primary_key=True, server_default=sql_text("now()"))
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=sql_text("now()"), onupdate=func.now())
+    # Transaction which created or last updated the post
+    xact_id = Column(
+        BigInteger, server_default=sql_text(CURRENT_XACT_ID), onupdate=sql_text(CURRENT_XACT_ID), nullable=False
+    )
+
+    __table_args__ = (
+        Index("posts_avatar_id_updated_at_idx", "avatar_id", "updated_at"),
+        Index("posts_avatar_id_xact_id_idx", "avatar_id", "xact_id"),
+        # Media GC looks up references to the uploaded images
+        Index("posts_images_idx", "images", postgresql_using="gin"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+class PostTombstone(BaseModel):
+    """Deleted post marker, lets clients sync deletions incrementally"""
+
+    __tablename__ = "post_tombstones"
+
+    uuid = Column(UUID(as_uuid=True), primary_key=True)
+    # Not a foreign key: tombstones outlive avatars deleted with all their posts
+    avatar_id = Column(Integer, nullable=False)
+    deleted_at = Column(TIMESTAMP(timezone=True), server_default=sql_text("now()"), nullable=False)
+    # Transaction which deleted the post
+    xact_id = Column(BigInteger, server_default=sql_text(CURRENT_XACT_ID), nullable=False)
+
+    __table_args__ = (
+        Index("post_tombstones_avatar_id_deleted_at_idx", "avatar_id", "deleted_at"),
+        Index("post_tombstones_avatar_id_xact_id_idx", "avatar_id", "xact_id"),
+    )
+
+
+class MediaFile(BaseModel):
+    """Object uploaded by a user to the media storage"""
+
+    __tablename__ = "media_files"
+
+    key = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    # Direct-to-bucket uploads stay PENDING until the object is checked
+    status = Column(Enum(MediaFileStatus), nullable=False)
+    size = Column(Integer, nullable=True)
+    content_type = Column(String, nullable=True)
+    # Names of the generated downscaled copies, see `media_storage.derivatives`
+    derivatives = Column(ARRAY(String), nullable=False, default=list, server_default=sql_text("'{}'"))
+    # Set for content-addressed uploads, lets the same file be stored only once
+    sha256 = Column(String, nullable=True)
     created_at = Column(TIMESTAMP(timezone=True), server_default=sql_text("now()"))
+    # Refreshed when deduplication hands the file out again, unreferenced files are collected by it
+    last_used_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=sql_text("now()"))
+
+    __table_args__ = (Index("media_files_sha256_idx", "sha256", unique=True),)
+
+
+class UploadSession(BaseModel):
+    """Resumable upload of a media file, backed by S3 multipart upload"""
+
+    __tablename__ = "upload_sessions"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String, ForeignKey("media_files.key", ondelete="CASCADE"), nullable=False)
+    s3_upload_id = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    # Bytes received so far, the next chunk must start there
+    offset = Column(Integer, nullable=False, default=0, server_default=sql_text("0"))
+    part_etags = Column(ARRAY(String), nullable=False, default=list, server_default=sql_text("'{}'"))
+    created_at = Column(TIMESTAMP(timezone=True), server_default=sql_text("now()"))
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (Index("upload_sessions_expires_at_idx", "expires_at"),)
@@ -0,0 +1,158 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import AsyncIterable, Awaitable, Callable
+
+from loguru import logger
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from publication_admin.settings import settings
+
+from .storages import PostStorage
+from .utils import uuid7
+
+POST_COPY_COLUMNS = ("uuid", "avatar_id", "post_text", "images", "created_at")
+
+
+class ImportedPost(BaseModel):
+    """Single NDJSON line of the posts import"""
+
+    post_text: str = ""
+    images: list[str] = []
+    created_at: datetime | None = None
+
+
+@dataclass
+class RejectedLine:
+    line: int
+    error: str
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    rejected: int = 0
+    rejects: list[RejectedLine] = field(default_factory=list)
+
+
+class PostsImporter:
+    """
+    Load NDJSON posts of a single avatar with COPY.
+
+    Lines are validated while the input is being read and flushed to the database in chunks,
+    every chunk is committed separately so progress survives a failure in the middle of the import.
+    Images of a chunk are checked at once with `check_images`, which returns errors by image key.
+    Invalid lines are skipped and reported in the result.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        avatar_id: int,
+        check_images: Callable[[list[str]], Awaitable[dict[str, str]]],
+        chunk_size: int = settings.posts_import_chunk_size,
+        max_line_size: int = settings.posts_import_max_line_size,
+        max_reported_rejects: int = settings.posts_import_max_reported_rejects,
+        on_progress: Callable[[ImportResult], None] | None = None,
+    ):
+        self.storage = PostStorage(db)
+        self.db = db
+        self.avatar_id = avatar_id
+        self.check_images = check_images
+        self.chunk_size = chunk_size
+        self.max_line_size = max_line_size
+        self.max_reported_rejects = max_reported_rejects
+        self.on_progress = on_progress or self._log_progress
+
+        self.result = ImportResult()
+        self._posts: list[tuple[int, ImportedPost]] = []
+
+    async def run(self, content: AsyncIterable[bytes]) -> ImportResult:
+        line_number = 0
+        pending = b""
+        skip_until_newline = False
+
+        async for chunk in content:
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+
+            for line in lines:
+                line_number += 1
+                if skip_until_newline or len(line) > self.max_line_size:
+                    skip_until_newline = False
+                    self._reject(line_number, "Line is too long")
+                    continue
+                await self._add_line(line_number, line)
+
+            if len(pending) > self.max_line_size:
+                # Do not accumulate a runaway line in memory, drop it up to the next newline
+                pending = b""
+                skip_until_newline = True
+
+        if pending or skip_until_newline:
+            line_number += 1
+            if skip_until_newline:
+                self._reject(line_number, "Line is too long")
+            else:
+                await self._add_line(line_number, pending)
+
+        await self._flush()
+        # Lines with invalid images are only rejected when their chunk is flushed
+        self.result.rejects.sort(key=lambda reject: reject.line)
+        return self.result
+
+    async def _add_line(self, line_number: int, line: bytes) -> None:
+        if not line.strip():
+            return
+
+        try:
+            post = ImportedPost.model_validate_json(line)
+        except ValidationError as e:
+            self._reject(line_number, _format_validation_error(e))
+            return
+
+        post.created_at = post.created_at or datetime.now(timezone.utc)
+        self._posts.append((line_number, post))
+        if len(self._posts) >= self.chunk_size:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._posts:
+            return
+
+        images = [image for _, post in self._posts for image in post.images]
+        image_errors = await self.check_images(images) if images else {}
+        records = []
+        for line_number, post in self._posts:
+            errors = [
+                f"images.{index}: {image_errors[image]}"
+                for index, image in enumerate(post.images)
+                if image in image_errors
+            ]
+            if errors:
+                self._reject(line_number, "; ".join(errors))
+                continue
+            records.append((uuid7(post.created_at), self.avatar_id, post.post_text, post.images, post.created_at))
+
+        if records:
+            await self.storage.copy_posts(records, columns=POST_COPY_COLUMNS)
+            await self.db.commit()
+        self.result.imported += len(records)
+        self._posts = []
+        self.on_progress(self.result)
+
+    def _reject(self, line_number: int, error: str) -> None:
+        self.result.rejected += 1
+        if len(self.result.rejects) < self.max_reported_rejects:
+            self.result.rejects.append(RejectedLine(line=line_number, error=error))
+
+    def _log_progress(self, result: ImportResult) -> None:
+        logger.info(f"Posts import for avatar {self.avatar_id}: imported={result.imported} rejected={result.rejected}")
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    messages = []
+    for err in error.errors():
+        loc = ".".join(str(part) for part in err["loc"])
+        messages.append(f"{loc}: {err['msg']}" if loc else err["msg"])
+    return "; ".join(messages)
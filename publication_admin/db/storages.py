@@ -1,10 +1,20 @@
 import typing
-from uuid import UUID
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
 
-from sqlalchemy import delete, exists, select
+from sqlalchemy import Select, any_, cast, delete, exists, insert, literal, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, array
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import func
 
-from .models import Avatar, Post, Topic
+from .models import CURRENT_XACT_ID, Avatar, MediaFile, MediaFileStatus, Post, PostTombstone, Topic, UploadSession
+from .utils import uuid7, uuid7_datetime
+
+# Max distance between the moment encoded into a post UUID and its `created_at`,
+# covers clock differences between application and database hosts
+POST_UUID_CREATED_AT_SLACK = timedelta(days=1)
 
 
 class BaseStorage:
@@ -24,14 +34,47 @@ class AvatarsStorage(BaseStorage):
         row = await self.db.execute(select(exists().where(Avatar.user_id == user_id)))
         return row.scalar()
 
+    async def get(self, avatar_id: int) -> Avatar | None:
+        return await self.db.get(Avatar, avatar_id)
+
     async def get_by_user_id(self, user_id: int) -> Avatar | None:
         rows = await self.db.execute(select(Avatar).where(Avatar.user_id == user_id).limit(1))
         return rows.scalars().first()
 
+    async def update(self, avatar: Avatar, **values) -> Avatar:
+        """
+        Change the avatar fields and bump its version.
+        Changes are flushed, the caller is responsible for committing
+        """
+        for name, value in values.items():
+            setattr(avatar, name, value)
+        # Incremented by the database, so concurrent changes never end up with the same version
+        avatar.version = Avatar.version + 1
+        await self.db.flush()
+        return avatar
+
+    async def touch_by_image(self, key: str) -> None:
+        """
+        Bump versions of the avatars with the image, when its derivatives change.
+        The caller is responsible for committing
+        """
+        await self.db.execute(
+            update(Avatar)
+            .where(cast(Avatar.images, JSONB).contains(func.jsonb_build_array(key)))
+            .values(version=Avatar.version + 1)
+        )
+
     async def delete_avatar(self, avatar_id: int, user_id: int) -> typing.Optional[int]:
         """
-        Delete avatar by avatar_id and user_id
+        Delete avatar by avatar_id and user_id. Posts are removed by the database cascade,
+        so their tombstones are written beforehand.
         """
+        avatar_posts = (
+            select(Post.uuid, Post.avatar_id)
+            .join(Avatar, Avatar.id == Post.avatar_id)
+            .where(Avatar.id == avatar_id, Avatar.user_id == user_id)
+        )
+        await self.db.execute(PostStorage.insert_tombstones(avatar_posts))
         result = await self.db.execute(
             delete(Avatar).where(Avatar.id == avatar_id, Avatar.user_id == user_id).returning(Avatar.id)
         )
@@ -45,6 +88,11 @@ class TopicsStorage(BaseStorage):
         rows = await self.db.execute(select(Topic))
         return rows.scalars().all()
 
+    async def get_version(self) -> typing.Tuple[int, datetime | None]:
+        """Number of topics and the moment the newest was added, changes whenever a topic is added"""
+        row = await self.db.execute(select(func.count(), func.max(Topic.created_at)))
+        return tuple(row.one())
+
     async def exists(self, name: str) -> bool:
         row = await self.db.execute(select(exists().where(Topic.name == name)))
         return row.scalar()
@@ -61,30 +109,371 @@ class PostStorage(BaseStorage):
         """
         Create new post
         """
-        post = Post(avatar_id=avatar_id, post_text=post_text, images=images)
+        created_at = datetime.now(timezone.utc)
+        post = Post(
+            uuid=uuid7(created_at), created_at=created_at, avatar_id=avatar_id, post_text=post_text, images=images
+        )
         self.db.add(post)
         await self.db.commit()
         await self.db.flush()
         return post
 
+    async def create_many(
+        self, avatar_id: int, posts: typing.List[typing.Tuple[str, typing.List[str]]]
+    ) -> typing.List[Post]:
+        """
+        Create posts with a single multi-row INSERT ... RETURNING.
+        Each item of `posts` is a (post_text, images) pair.
+        """
+        created_at = datetime.now(timezone.utc)
+        rows = [
+            {
+                "uuid": uuid7(created_at),
+                "created_at": created_at,
+                "avatar_id": avatar_id,
+                "post_text": post_text,
+                "images": images,
+            }
+            for post_text, images in posts
+        ]
+        result = await self.db.scalars(insert(Post).values(rows).returning(Post))
+        created_posts = result.all()
+        await self.db.commit()
+        return created_posts
+
+    async def copy_posts(self, records: typing.Sequence[typing.Tuple], columns: typing.Sequence[str]) -> None:
+        """
+        Load post records with a binary COPY, bypassing the ORM. The caller is responsible for committing.
+        """
+        connection = await self.db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            Post.__tablename__, records=records, columns=columns
+        )
+
     async def get_posts_by_avatar(self, avatar_id: int, post_uuid: UUID = None):
         """
         Get posts by avatar. If post_uuid is provided, get a specific post.
         """
         query = select(Post).where(Post.avatar_id == avatar_id)
         if post_uuid:
-            query = query.where(Post.uuid == post_uuid)
+            query = query.where(Post.uuid == post_uuid, *self._partition_criteria([post_uuid]))
         result = await self.db.execute(query)
         posts = result.scalars().all()
         return posts
 
+    async def get_version(self, avatar_id: int) -> typing.Tuple[int, datetime | None, datetime | None]:
+        """
+        Number of avatar posts, the last moment one was created or updated and the last moment one was deleted.
+        Changes whenever the posts do, and is read from the indexes without loading the posts
+        """
+        last_deleted_at = (
+            select(func.max(PostTombstone.deleted_at)).where(PostTombstone.avatar_id == avatar_id).scalar_subquery()
+        )
+        row = await self.db.execute(
+            select(func.count(), func.max(Post.updated_at), last_deleted_at).where(Post.avatar_id == avatar_id)
+        )
+        return tuple(row.one())
+
+    async def touch_by_image(self, key: str) -> None:
+        """
+        Bump `updated_at` of the posts with the image, when its derivatives change.
+        The caller is responsible for committing
+        """
+        await self.db.execute(update(Post).where(Post.images.contains([key])).values(updated_at=func.now()))
+
+    async def stream_posts_by_avatar(self, avatar_id: int, batch_size: int = 1000) -> typing.AsyncIterator[Post]:
+        """
+        Iterate over avatar posts using a server-side cursor, fetching `batch_size` rows at a time
+        """
+        query = select(Post).where(Post.avatar_id == avatar_id).execution_options(yield_per=batch_size)
+        result = await self.db.stream_scalars(query)
+        async for post in result:
+            yield post
+
     async def delete_posts(self, avatar_id: int, post_uuid: UUID) -> typing.Optional[UUID]:
         """
         Delete post by post_id
         """
-        result = await self.db.execute(
-            delete(Post).where(Post.avatar_id == avatar_id, Post.uuid == post_uuid).returning(Post.uuid)
+        deleted_post_uuids = await self._delete_with_tombstones(
+            Post.avatar_id == avatar_id, Post.uuid == post_uuid, *self._partition_criteria([post_uuid])
         )
-        deleted_post_uuid = result.scalar()
+        deleted_post_uuid = next(iter(deleted_post_uuids), None)
         await self.db.commit()
         return deleted_post_uuid
+
+    async def delete_many(self, avatar_id: int, post_uuids: typing.List[UUID]) -> typing.Set[UUID]:
+        """
+        Delete avatar posts with a single DELETE ... WHERE uuid = ANY(...) and return UUIDs of the deleted ones
+        """
+        deleted_post_uuids = await self._delete_with_tombstones(
+            Post.avatar_id == avatar_id,
+            Post.uuid == any_(literal(post_uuids, ARRAY(PG_UUID(as_uuid=True)))),
+            *self._partition_criteria(post_uuids),
+        )
+        await self.db.commit()
+        return deleted_post_uuids
+
+    async def get_sync_horizon(self) -> int:
+        """
+        ID of the oldest transaction in progress which has written anything. Posts and tombstones are stamped with
+        the ID of the transaction which changed them, so everything stamped with a lower one is already committed.
+        Read-only transactions, long exports and idle sessions included, never hold it back
+        """
+        return await self.db.scalar(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"))
+
+    async def get_changed_posts(
+        self, avatar_id: int, until: int, after: typing.Tuple[int, UUID] | None = None, limit: int = 1000
+    ) -> typing.Sequence[Post]:
+        """
+        Get up to `limit` avatar posts created or updated by transactions before `until`, ordered by (xact_id, uuid).
+        Only the posts after the `after` (xact_id, uuid) pair are returned when it is provided
+        """
+        query = select(Post).where(Post.avatar_id == avatar_id, Post.xact_id < until)
+        if after:
+            after_xact_id, after_uuid = after
+            query = query.where(
+                tuple_(Post.xact_id, Post.uuid)
+                > tuple_(literal(after_xact_id, Post.xact_id.type), literal(after_uuid, Post.uuid.type))
+            )
+        result = await self.db.execute(query.order_by(Post.xact_id, Post.uuid).limit(limit))
+        return result.scalars().all()
+
+    async def get_tombstones(
+        self, avatar_id: int, until: int, after: typing.Tuple[int, UUID], limit: int = 1000
+    ) -> typing.Sequence[PostTombstone]:
+        """
+        Get up to `limit` avatar posts deleted by transactions before `until` and after the `after` (xact_id, uuid)
+        pair, ordered by (xact_id, uuid)
+        """
+        after_xact_id, after_uuid = after
+        result = await self.db.execute(
+            select(PostTombstone)
+            .where(
+                PostTombstone.avatar_id == avatar_id,
+                PostTombstone.xact_id < until,
+                tuple_(PostTombstone.xact_id, PostTombstone.uuid)
+                > tuple_(
+                    literal(after_xact_id, PostTombstone.xact_id.type), literal(after_uuid, PostTombstone.uuid.type)
+                ),
+            )
+            .order_by(PostTombstone.xact_id, PostTombstone.uuid)
+            .limit(limit)
+        )
+        return result.scalars().all()
+
+    async def create_partitions(self, months_ahead: int) -> int:
+        """
+        Create monthly partitions of the posts table up to `months_ahead` months from now,
+        return the number of created partitions
+        """
+        result = await self.db.execute(select(func.posts_create_partitions(func.current_date(), months_ahead + 1)))
+        return result.scalar()
+
+    @staticmethod
+    def _partition_criteria(post_uuids: typing.Iterable[UUID]) -> list:
+        """
+        `created_at` bounds derived from time-ordered UUIDs, so Postgres scans only the matching partitions.
+        Legacy random UUIDs carry no time, no bounds are possible if there are any.
+        """
+        moments = [uuid7_datetime(post_uuid) for post_uuid in post_uuids]
+        if not moments or None in moments:
+            return []
+        return [
+            Post.created_at >= min(moments) - POST_UUID_CREATED_AT_SLACK,
+            Post.created_at < max(moments) + POST_UUID_CREATED_AT_SLACK,
+        ]
+
+    async def _delete_with_tombstones(self, *criteria) -> typing.Set[UUID]:
+        """
+        Delete posts matching criteria and record their tombstones in the same statement
+        """
+        deleted_posts = delete(Post).where(*criteria).returning(Post.uuid, Post.avatar_id).cte("deleted_posts")
+        result = await self.db.execute(
+            self.insert_tombstones(select(deleted_posts.c.uuid, deleted_posts.c.avatar_id)).returning(
+                PostTombstone.uuid
+            )
+        )
+        return set(result.scalars().all())
+
+    @staticmethod
+    def insert_tombstones(posts: Select):
+        """
+        INSERT tombstones for (uuid, avatar_id) rows selected by `posts`
+        """
+        return (
+            pg_insert(PostTombstone)
+            .from_select([PostTombstone.uuid, PostTombstone.avatar_id], posts)
+            .on_conflict_do_update(
+                index_elements=[PostTombstone.uuid],
+                # A post deleted again, e.g. re-imported in between, is synced as deleted by the new transaction
+                set_={"deleted_at": func.now(), "xact_id": text(CURRENT_XACT_ID)},
+            )
+        )
+
+
+class MediaFilesStorage(BaseStorage):
+    def add(
+        self,
+        key: str,
+        user_id: int,
+        status: MediaFileStatus,
+        size: int | None = None,
+        content_type: str | None = None,
+    ) -> MediaFile:
+        """Add uploaded file to the session"""
+        media_file = MediaFile(key=key, user_id=user_id, status=status, size=size, content_type=content_type)
+        self.db.add(media_file)
+        return media_file
+
+    async def add_content(
+        self, key: str, sha256: str, user_id: int, size: int | None = None, content_type: str | None = None
+    ) -> MediaFile:
+        """
+        Register the file uploaded under `key` by its content hash, in place of its pending registration if any.
+        Returns the registered file: the one stored before when the same content is registered already,
+        concurrent uploads included. The caller is responsible for committing
+        """
+        await self.db.execute(
+            delete(MediaFile).where(MediaFile.key == key, MediaFile.status == MediaFileStatus.PENDING)
+        )
+        media_file = await self.db.scalar(
+            pg_insert(MediaFile)
+            .values(
+                key=key,
+                sha256=sha256,
+                user_id=user_id,
+                status=MediaFileStatus.CONFIRMED,
+                size=size,
+                content_type=content_type,
+            )
+            # Conflicts on either the key or the hash, waiting for the concurrent upload to commit
+            .on_conflict_do_nothing()
+            .returning(MediaFile)
+            .execution_options(populate_existing=True)
+        )
+        if media_file is None:
+            media_file = (await self.use_by_sha256([sha256]))[sha256]
+        return media_file
+
+    async def get(self, key: str) -> MediaFile | None:
+        return await self.db.get(MediaFile, key)
+
+    async def use_by_sha256(self, hashes: typing.Iterable[str]) -> typing.Dict[str, MediaFile]:
+        """
+        Already stored files by their content hashes. The files are marked as used in the same statement,
+        so the garbage collector keeps them for the grace period. The caller is responsible for committing
+        """
+        rows = await self.db.scalars(
+            update(MediaFile)
+            .where(MediaFile.sha256.in_(list(hashes)), MediaFile.status == MediaFileStatus.CONFIRMED)
+            .values(last_used_at=func.now())
+            .returning(MediaFile)
+        )
+        return {media_file.sha256: media_file for media_file in rows.all()}
+
+    async def get_pending_keys(self, keys: typing.Iterable[str]) -> typing.List[str]:
+        """Keys of files which are uploaded directly to the bucket but not confirmed yet"""
+        rows = await self.db.execute(
+            select(MediaFile.key).where(MediaFile.key.in_(list(keys)), MediaFile.status == MediaFileStatus.PENDING)
+        )
+        return list(rows.scalars().all())
+
+    async def delete_orphaned(self, older_than: datetime, limit: int = 1000) -> typing.List[MediaFile]:
+        """
+        Delete uploads which are not referenced by avatars or posts and were not used since `older_than`,
+        return the deleted ones. References are looked up in the images columns on each run,
+        so no write path can miss one
+        """
+        referenced_by_posts = exists().where(Post.images.contains(array([MediaFile.key])))
+        referenced_by_avatars = exists().where(
+            cast(Avatar.images, JSONB).contains(func.jsonb_build_array(MediaFile.key))
+        )
+        uploading = exists().where(UploadSession.key == MediaFile.key)
+        orphaned = (
+            select(MediaFile.key)
+            .where(MediaFile.last_used_at < older_than, ~referenced_by_posts, ~referenced_by_avatars, ~uploading)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        rows = await self.db.scalars(delete(MediaFile).where(MediaFile.key.in_(orphaned)).returning(MediaFile))
+        return list(rows.all())
+
+    async def set_derivatives(self, key: str, derivatives: typing.List[str]) -> None:
+        await self.db.execute(update(MediaFile).where(MediaFile.key == key).values(derivatives=derivatives))
+
+    async def get_keys_with_derivative(self, keys: typing.Iterable[str], derivative: str) -> typing.Set[str]:
+        rows = await self.db.scalars(
+            select(MediaFile.key).where(MediaFile.key.in_(list(keys)), MediaFile.derivatives.any(derivative))
+        )
+        return set(rows.all())
+
+
+class UploadSessionsStorage(BaseStorage):
+    def add(
+        self, user_id: int, key: str, s3_upload_id: str, size: int, chunk_size: int, expires_at: datetime
+    ) -> UploadSession:
+        """Add upload session to the session"""
+        upload_session = UploadSession(
+            id=uuid4(),
+            user_id=user_id,
+            key=key,
+            s3_upload_id=s3_upload_id,
+            size=size,
+            chunk_size=chunk_size,
+            offset=0,
+            part_etags=[],
+            expires_at=expires_at,
+        )
+        self.db.add(upload_session)
+        return upload_session
+
+    async def get(self, session_id: UUID) -> UploadSession | None:
+        return await self.db.scalar(
+            select(UploadSession).where(UploadSession.id == session_id, UploadSession.expires_at > func.now())
+        )
+
+    async def advance(self, session_id: UUID, offset: int, length: int, part_etag: str) -> int | None:
+        """
+        Record the uploaded chunk if nothing else was recorded since `offset` was read,
+        return the new offset, None if the session was moved by a concurrent request
+        """
+        new_offset = await self.db.scalar(
+            update(UploadSession)
+            .where(UploadSession.id == session_id, UploadSession.offset == offset)
+            .values(
+                offset=UploadSession.offset + length,
+                part_etags=func.array_append(UploadSession.part_etags, part_etag),
+            )
+            .returning(UploadSession.offset)
+        )
+        return new_offset
+
+    async def delete(self, upload_session: UploadSession, with_media_file: bool = False) -> None:
+        if with_media_file:
+            # Upload session is removed by the cascade
+            await self.db.execute(delete(MediaFile).where(MediaFile.key == upload_session.key))
+        else:
+            await self.db.execute(delete(UploadSession).where(UploadSession.id == upload_session.id))
+
+    async def delete_expired(self, limit: int = 1000) -> typing.List[UploadSession]:
+        """Delete expired sessions along with their never finished media files, return the deleted sessions"""
+        expired = (
+            select(UploadSession.id)
+            .where(UploadSession.expires_at <= func.now())
+            .order_by(UploadSession.expires_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        rows = await self.db.scalars(
+            delete(UploadSession).where(UploadSession.id.in_(expired)).returning(UploadSession)
+        )
+        upload_sessions = list(rows.all())
+        if upload_sessions:
+            await self.db.execute(
+                delete(MediaFile).where(
+                    MediaFile.key.in_([upload_session.key for upload_session in upload_sessions]),
+                    MediaFile.status == MediaFileStatus.PENDING,
+                )
+            )
+        return upload_sessions
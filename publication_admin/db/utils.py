@@ -0,0 +1,24 @@
+import os
+from datetime import datetime, timezone
+from uuid import UUID
+
+UUID7_VERSION = 7
+
+
+def uuid7(moment: datetime | None = None) -> UUID:
+    """
+    Time-ordered UUID (RFC 9562 version 7): 48-bit unix timestamp in milliseconds followed by random bits.
+    Values generated one after another land next to each other in a B-tree index.
+    """
+    timestamp_ms = int((moment or datetime.now(timezone.utc)).timestamp() * 1000)
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = value & ~(0xF << 76) | UUID7_VERSION << 76  # version
+    value = value & ~(0x3 << 62) | 0x2 << 62  # RFC 4122 variant
+    return UUID(int=value)
+
+
+def uuid7_datetime(value: UUID) -> datetime | None:
+    """Moment encoded into a version 7 UUID, None for other versions"""
+    if value.version != UUID7_VERSION:
+        return None
+    return datetime.fromtimestamp((value.int >> 80) / 1000, tz=timezone.utc)
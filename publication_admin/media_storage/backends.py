@@ -0,0 +1,16 @@
+import functools
+
+from publication_admin.settings import settings
+
+from .base import AsyncMediaStorage
+from .local import LocalMediaStorage
+from .s3 import AsyncS3MediaStorage
+
+
+@functools.cache
+def get_media_storage() -> AsyncMediaStorage:
+    """Process-wide storage of the configured backend"""
+    media_storage_settings = settings.media_storage
+    if media_storage_settings.media_storage_backend == "local":
+        return LocalMediaStorage(media_storage_settings.media_storage_local_dir)
+    return AsyncS3MediaStorage()
@@ -0,0 +1,133 @@
+import io
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, BinaryIO, Protocol
+
+from loguru import logger
+
+from publication_admin.settings import settings
+
+
+class MediaStorageError(Exception):
+    pass
+
+
+class UploadError(MediaStorageError):
+    pass
+
+
+@dataclass
+class FileInfo:
+    size: int
+    content_type: str | None
+    etag: str
+
+
+class AsyncMediaStorage(Protocol):
+    """
+    Object storage the API works with, files are addressed by S3-like keys.
+    Implementations subclass it to share the methods built on top of the primitives
+    """
+
+    async def upload_file(self, filename: str, content: BinaryIO, content_type: str | None = None) -> None:
+        ...
+
+    async def create_multipart_upload(self, filename: str, content_type: str | None = None) -> str:
+        ...
+
+    async def upload_part(self, filename: str, upload_id: str, part_number: int, content: bytes) -> str:
+        """Upload a part of multipart upload, return its ETag"""
+        ...
+
+    async def complete_multipart_upload(self, filename: str, upload_id: str, part_etags: list[str]) -> None:
+        ...
+
+    async def abort_multipart_upload(self, filename: str, upload_id: str) -> None:
+        ...
+
+    async def head_file(self, filename: str) -> FileInfo | None:
+        """Object metadata, None if it does not exist"""
+        ...
+
+    async def get_file(self, filename: str) -> bytes:
+        ...
+
+    async def download_file(self, filename: str, fileobj: BinaryIO) -> FileInfo | None:
+        """Write the object into the file without holding it in memory, None if it does not exist"""
+        ...
+
+    def stream_file(self, filename: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Bytes from start to end inclusive"""
+        ...
+
+    def iter_files(
+        self, filenames: list[str], concurrency: int, chunks_ahead: int
+    ) -> AsyncIterator[tuple[str, FileInfo, AsyncIterator[bytes]]]:
+        """Contents of the files in order with bounded read-ahead, missing files are skipped"""
+        ...
+
+    async def delete_file(self, filename: str) -> None:
+        ...
+
+    async def delete_files(self, filenames: list[str]) -> None:
+        ...
+
+    def generate_presigned_post(self, filename: str, content_type: str, max_size: int, expires_in: int) -> dict:
+        ...
+
+    def generate_presigned_put(self, filename: str, content_type: str, size: int, expires_in: int) -> str:
+        ...
+
+    def file_path(self, filename: str) -> str | None:
+        """Path of the object on the local disk, None if the storage does not keep files locally"""
+        ...
+
+    async def upload_stream(
+        self,
+        filename: str,
+        chunks: AsyncIterable[bytes],
+        content_type: str | None = None,
+        part_size: int = settings.media_storage.media_storage_multipart_part_size,
+    ) -> int:
+        """
+        Upload the stream without buffering it whole: content is sent in multipart upload parts as soon
+        as a part is collected, streams smaller than a part are sent with a single PUT.
+        The multipart upload is aborted if the stream fails. Returns uploaded size.
+        """
+        buffer = bytearray()
+        size = 0
+        upload_id = None
+        part_etags = []
+
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+
+                while len(buffer) >= part_size:
+                    if upload_id is None:
+                        upload_id = await self.create_multipart_upload(filename, content_type)
+                    part = bytes(buffer[:part_size])
+                    del buffer[:part_size]
+                    part_etags.append(await self.upload_part(filename, upload_id, len(part_etags) + 1, part))
+
+            if upload_id is None:
+                await self.upload_file(filename, io.BytesIO(buffer), content_type)
+                return size
+
+            if buffer:
+                part_etags.append(await self.upload_part(filename, upload_id, len(part_etags) + 1, bytes(buffer)))
+            await self.complete_multipart_upload(filename, upload_id, part_etags)
+        except BaseException:
+            if upload_id is not None:
+                await self.discard_multipart_upload(filename, upload_id)
+            raise
+
+        return size
+
+    async def discard_multipart_upload(self, filename: str, upload_id: str) -> None:
+        """Abort multipart upload, failures are only logged"""
+        try:
+            await self.abort_multipart_upload(filename, upload_id)
+        except UploadError:
+            # Leftover S3 parts can only be removed by a bucket lifecycle rule now
+            logger.warning(f"Failed to abort multipart upload {upload_id} of {filename}")
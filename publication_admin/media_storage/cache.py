@@ -0,0 +1,142 @@
+import asyncio
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+
+from loguru import logger
+
+from publication_admin.settings import settings
+
+from .base import AsyncMediaStorage, FileInfo
+
+METADATA_SUFFIX = ".json"
+
+
+@dataclass
+class CachedFile:
+    path: str
+    size: int
+    content_type: str | None
+    etag: str
+
+
+class MediaCache:
+    """
+    Least recently used S3 objects kept on the local disk, bounded by their total size.
+    Files are written to a temporary name and renamed into place, so readers never see partial files.
+    The index lives in the process memory and is restored from the metadata files on start,
+    processes sharing the directory may evict each other's files, those are downloaded again
+    """
+
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        self._entries: OrderedDict[str, CachedFile] = OrderedDict()
+        self._size = 0
+        self._downloads: dict[str, asyncio.Future] = {}
+        os.makedirs(os.path.join(directory, "tmp"), exist_ok=True)
+        self._load()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key: str) -> CachedFile | None:
+        cached_file = self._entries.get(key)
+        if cached_file is None:
+            return None
+        if not os.path.exists(cached_file.path):
+            self._forget(key)
+            return None
+        self._entries.move_to_end(key)
+        return cached_file
+
+    async def fetch(self, media_storage: AsyncMediaStorage, key: str) -> CachedFile | None:
+        """Cached file of the object, downloaded once however many requests wait for it. None if it does not exist"""
+        if cached_file := self.get(key):
+            return cached_file
+
+        if key not in self._downloads:
+            self._downloads[key] = asyncio.ensure_future(self._download(media_storage, key))
+            self._downloads[key].add_done_callback(lambda _: self._downloads.pop(key, None))
+        return await asyncio.shield(self._downloads[key])
+
+    def put(self, key: str, temp_path: str, file_info: FileInfo) -> CachedFile:
+        """Move the downloaded file into the cache, evicting the least recently used files over the size limit"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        cached_file = CachedFile(path=path, **asdict(file_info))
+        with open(path + METADATA_SUFFIX, "w") as metadata:
+            json.dump({"key": key, **asdict(file_info)}, metadata)
+
+        self._forget(key)
+        self._entries[key] = cached_file
+        self._size += cached_file.size
+        self._evict()
+        return cached_file
+
+    async def _download(self, media_storage: AsyncMediaStorage, key: str) -> CachedFile | None:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.join(self.directory, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file_info = await media_storage.download_file(key, file)
+            if file_info is None:
+                return None
+            return self.put(key, temp_path, file_info)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _path(self, key: str) -> str:
+        # Sharded by the digest, so no directory grows too large
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:4], digest)
+
+    def _evict(self) -> None:
+        while self._size > self.max_size and self._entries:
+            key, cached_file = self._entries.popitem(last=False)
+            self._size -= cached_file.size
+            self._remove(cached_file.path)
+
+    def _forget(self, key: str) -> None:
+        if cached_file := self._entries.pop(key, None):
+            self._size -= cached_file.size
+
+    def _remove(self, path: str) -> None:
+        for filename in (path, path + METADATA_SUFFIX):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(filename)
+
+    def _load(self) -> None:
+        """Restore the index from the metadata files, the least recently modified files go first"""
+        entries = []
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if not filename.endswith(METADATA_SUFFIX) or root == os.path.join(self.directory, "tmp"):
+                    continue
+                metadata_path = os.path.join(root, filename)
+                path = metadata_path.removesuffix(METADATA_SUFFIX)
+                try:
+                    with open(metadata_path) as metadata_file:
+                        metadata = json.load(metadata_file)
+                    entries.append((os.path.getmtime(path), metadata.pop("key"), CachedFile(path=path, **metadata)))
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Dropping broken media cache entry {path}: {e}")
+                    self._remove(path)
+
+        for _, key, cached_file in sorted(entries, key=lambda entry: entry[0]):
+            self._entries[key] = cached_file
+            self._size += cached_file.size
+        self._evict()
+
+
+@functools.cache
+def get_media_cache() -> MediaCache:
+    media_storage_settings = settings.media_storage
+    return MediaCache(media_storage_settings.media_storage_cache_dir, media_storage_settings.media_storage_cache_size)
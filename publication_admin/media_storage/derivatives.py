@@ -0,0 +1,78 @@
+import asyncio
+import functools
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from enum import StrEnum
+
+from loguru import logger
+from PIL import Image, ImageOps
+
+from publication_admin.settings import settings
+
+from .base import AsyncMediaStorage
+from .keys import derivative_key
+
+
+class ImageDerivative(StrEnum):
+    THUMBNAIL: str = "thumbnail"
+    TRAINING: str = "training"
+
+
+def derivative_sizes() -> dict[ImageDerivative, int]:
+    return {
+        ImageDerivative.THUMBNAIL: settings.image_thumbnail_size,
+        ImageDerivative.TRAINING: settings.image_training_size,
+    }
+
+
+@functools.cache
+def get_derivatives_executor() -> ProcessPoolExecutor:
+    """
+    Resizing is CPU bound and holds the GIL, so it runs in worker processes.
+    Workers are spawned, not forked, the parent has running threads and an event loop
+    """
+    return ProcessPoolExecutor(
+        max_workers=settings.image_derivatives_max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def render_derivatives(content: bytes, sizes: dict[str, int], quality: int) -> dict[str, bytes]:
+    """Downscale JPEG to fit each of the sizes, runs in the worker process"""
+    with Image.open(io.BytesIO(content)) as image:
+        # Let the JPEG decoder skip the resolution none of the derivatives need
+        image.draft("RGB", (max(sizes.values()),) * 2)
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+        derivatives = {}
+        for name, size in sizes.items():
+            derivative = image.copy()
+            derivative.thumbnail((size, size), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            derivative.save(buffer, format="JPEG", quality=quality, optimize=True)
+            derivatives[name] = buffer.getvalue()
+        return derivatives
+
+
+async def create_derivatives(media_storage: AsyncMediaStorage, key: str) -> list[ImageDerivative]:
+    """Render derivatives of the uploaded image and store them next to it, return the created ones"""
+    content = await media_storage.get_file(key)
+
+    loop = asyncio.get_running_loop()
+    derivatives = await loop.run_in_executor(
+        get_derivatives_executor(),
+        render_derivatives,
+        content,
+        dict(derivative_sizes()),
+        settings.image_derivatives_quality,
+    )
+
+    await asyncio.gather(
+        *[
+            media_storage.upload_file(derivative_key(key, name), io.BytesIO(data), content_type="image/jpeg")
+            for name, data in derivatives.items()
+        ]
+    )
+    logger.info(f"Created {len(derivatives)} derivatives of {key}")
+    return [ImageDerivative(name) for name in derivatives]
@@ -0,0 +1,49 @@
+import hashlib
+import uuid
+from typing import AsyncIterable, AsyncIterator, BinaryIO
+
+USER_CONTENT_PREFIX = "pubadmin/user-content/"
+
+
+def new_user_content_key() -> str:
+    return f"{USER_CONTENT_PREFIX}{uuid.uuid4()}.jpeg"
+
+
+def new_content_key(sha256: str) -> str:
+    """Key addressed by the file content, the same file always gets the same key"""
+    return f"{USER_CONTENT_PREFIX}{sha256}.jpeg"
+
+
+def is_user_content_key(key: str) -> bool:
+    return key.startswith(USER_CONTENT_PREFIX)
+
+
+def derivative_key(key: str, derivative: str) -> str:
+    """Derivatives are stored next to the original: `<name>.jpeg` -> `<name>.<derivative>.jpeg`"""
+    stem, _, extension = key.rpartition(".")
+    return f"{stem}.{derivative}.{extension}"
+
+
+def file_sha256(file: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """Hash the file without reading it into memory whole, the file is rewound afterwards"""
+    file.seek(0)
+    digest = hashlib.sha256()
+    while chunk := file.read(chunk_size):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+async def hashed_stream(chunks: AsyncIterable[bytes], digest: "hashlib._Hash") -> AsyncIterator[bytes]:
+    """Pass the stream through, the digest is fed with every chunk as it arrives"""
+    async for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+
+async def stream_sha256(chunks: AsyncIterable[bytes]) -> str:
+    """Hash the stream without holding it in memory"""
+    digest = hashlib.sha256()
+    async for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
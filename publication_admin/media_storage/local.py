@@ -0,0 +1,207 @@
+import asyncio
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, Callable, TypeVar
+
+from publication_admin.settings import settings
+
+from .base import AsyncMediaStorage, FileInfo, MediaStorageError, UploadError
+
+T = TypeVar("T")
+
+COPY_CHUNK_SIZE = 1024 * 1024
+METADATA_SUFFIX = ".json"
+
+local_executor = ThreadPoolExecutor(
+    max_workers=settings.media_storage.media_storage_max_workers,
+    thread_name_prefix="local-media-storage",
+)
+
+
+class LocalMediaStorage(AsyncMediaStorage):
+    """
+    Objects kept in a directory, for development and single box benchmarks without S3.
+    Every object is written to a temporary file and renamed into place, so readers never see partial files.
+    Files are sharded by the digest of the key, metadata sits next to them in a JSON file.
+    Presigned uploads are not supported
+    """
+
+    def __init__(self, directory: str, executor: ThreadPoolExecutor = local_executor):
+        self.directory = directory
+        self.executor = executor
+        for name in ("objects", "uploads", "tmp"):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    async def upload_file(self, filename: str, content: BinaryIO, content_type: str | None = None) -> None:
+        await self._run(self._write, filename, [content], content_type)
+
+    async def create_multipart_upload(self, filename: str, content_type: str | None = None) -> str:
+        upload_id = uuid.uuid4().hex
+        await self._run(self._create_multipart_upload, upload_id, content_type)
+        return upload_id
+
+    async def upload_part(self, filename: str, upload_id: str, part_number: int, content: bytes) -> str:
+        return await self._run(self._write_part, upload_id, part_number, content)
+
+    async def complete_multipart_upload(self, filename: str, upload_id: str, part_etags: list[str]) -> None:
+        await self._run(self._complete_multipart_upload, filename, upload_id, part_etags)
+
+    async def abort_multipart_upload(self, filename: str, upload_id: str) -> None:
+        await self._run(shutil.rmtree, self._upload_path(upload_id), True)
+
+    async def head_file(self, filename: str) -> FileInfo | None:
+        return await self._run(self._head, filename)
+
+    async def get_file(self, filename: str) -> bytes:
+        return await self._run(self._read, filename)
+
+    async def download_file(self, filename: str, fileobj: BinaryIO) -> FileInfo | None:
+        return await self._run(self._copy_to, filename, fileobj)
+
+    async def stream_file(
+        self, filename: str, start: int, end: int, chunk_size: int = COPY_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        try:
+            file = await self._run(open, self._object_path(filename), "rb")
+        except FileNotFoundError as e:
+            raise MediaStorageError(f"File {filename} does not exist") from e
+        with file:
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await self._run(file.read, min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    async def iter_files(
+        self, filenames: list[str], concurrency: int, chunks_ahead: int, chunk_size: int = COPY_CHUNK_SIZE
+    ) -> AsyncIterator[tuple[str, FileInfo, AsyncIterator[bytes]]]:
+        # Disk reads are fast enough to be done one by one, there is nothing to read ahead of
+        for filename in filenames:
+            file_info = await self.head_file(filename)
+            if file_info is not None:
+                yield filename, file_info, self.stream_file(filename, 0, file_info.size - 1, chunk_size)
+
+    async def delete_file(self, filename: str) -> None:
+        await self._run(self._delete, filename)
+
+    async def delete_files(self, filenames: list[str]) -> None:
+        await self._run(lambda: [self._delete(filename) for filename in filenames])
+
+    def generate_presigned_post(self, filename: str, content_type: str, max_size: int, expires_in: int) -> dict:
+        raise MediaStorageError("Presigned uploads are not supported by the local storage")
+
+    def generate_presigned_put(self, filename: str, content_type: str, size: int, expires_in: int) -> str:
+        raise MediaStorageError("Presigned uploads are not supported by the local storage")
+
+    def file_path(self, filename: str) -> str | None:
+        return self._object_path(filename)
+
+    def _object_path(self, filename: str) -> str:
+        # Sharded by the digest, so no directory grows too large
+        digest = hashlib.sha256(filename.encode()).hexdigest()
+        return os.path.join(self.directory, "objects", digest[:2], digest[2:4], digest)
+
+    def _upload_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, "uploads", upload_id)
+
+    def _write(self, filename: str, contents: list[BinaryIO], content_type: str | None) -> None:
+        """Concatenate the contents into the object, ETag is MD5 of the content as for S3 single part uploads"""
+        md5 = hashlib.md5(usedforsecurity=False)
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=os.path.join(self.directory, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for content in contents:
+                    while chunk := content.read(COPY_CHUNK_SIZE):
+                        md5.update(chunk)
+                        size += len(chunk)
+                        file.write(chunk)
+
+            path = self._object_path(filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            file_info = FileInfo(size=size, content_type=content_type, etag=f'"{md5.hexdigest()}"')
+            os.replace(temp_path, path)
+            # Objects are looked up by the metadata, so they exist for readers only once complete
+            self._write_metadata(path, file_info)
+        except OSError as e:
+            raise UploadError(str(e)) from e
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+
+    def _write_metadata(self, path: str, file_info: FileInfo) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.join(self.directory, "tmp"))
+        with os.fdopen(fd, "w") as file:
+            json.dump({"size": file_info.size, "content_type": file_info.content_type, "etag": file_info.etag}, file)
+        os.replace(temp_path, path + METADATA_SUFFIX)
+
+    def _create_multipart_upload(self, upload_id: str, content_type: str | None) -> None:
+        upload_path = self._upload_path(upload_id)
+        os.makedirs(upload_path)
+        with open(os.path.join(upload_path, METADATA_SUFFIX), "w") as file:
+            json.dump({"content_type": content_type}, file)
+
+    def _write_part(self, upload_id: str, part_number: int, content: bytes) -> str:
+        upload_path = self._upload_path(upload_id)
+        if not os.path.isdir(upload_path):
+            raise UploadError(f"Multipart upload {upload_id} does not exist")
+        fd, temp_path = tempfile.mkstemp(dir=upload_path)
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+        os.replace(temp_path, os.path.join(upload_path, str(part_number)))
+        return f'"{hashlib.md5(content, usedforsecurity=False).hexdigest()}"'
+
+    def _complete_multipart_upload(self, filename: str, upload_id: str, part_etags: list[str]) -> None:
+        upload_path = self._upload_path(upload_id)
+        part_paths = [os.path.join(upload_path, str(number)) for number in range(1, len(part_etags) + 1)]
+        if not all(os.path.exists(part_path) for part_path in part_paths):
+            raise UploadError(f"Multipart upload {upload_id} misses parts")
+
+        with contextlib.ExitStack() as stack:
+            parts = [stack.enter_context(open(part_path, "rb")) for part_path in part_paths]
+            with open(os.path.join(upload_path, METADATA_SUFFIX)) as file:
+                content_type = json.load(file)["content_type"]
+            self._write(filename, parts, content_type)
+        shutil.rmtree(upload_path, ignore_errors=True)
+
+    def _head(self, filename: str) -> FileInfo | None:
+        try:
+            with open(self._object_path(filename) + METADATA_SUFFIX) as file:
+                return FileInfo(**json.load(file))
+        except FileNotFoundError:
+            return None
+
+    def _read(self, filename: str) -> bytes:
+        try:
+            with open(self._object_path(filename), "rb") as file:
+                return file.read()
+        except FileNotFoundError as e:
+            raise MediaStorageError(f"File {filename} does not exist") from e
+
+    def _copy_to(self, filename: str, fileobj: BinaryIO) -> FileInfo | None:
+        file_info = self._head(filename)
+        if file_info is None:
+            return None
+        with open(self._object_path(filename), "rb") as file:
+            shutil.copyfileobj(file, fileobj, COPY_CHUNK_SIZE)
+        return file_info
+
+    def _delete(self, filename: str) -> None:
+        path = self._object_path(filename)
+        for name in (path + METADATA_SUFFIX, path):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(name)
+
+    async def _run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,62 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+
+from publication_admin.settings import settings
+
+from .base import AsyncMediaStorage, FileInfo
+
+
+class FileInfoCache:
+    """
+    Metadata of existing objects by key, objects are never rewritten under the same key
+    and entries expire only to notice deletions. Missing objects are not cached, they may be uploaded any moment
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[FileInfo, float]] = OrderedDict()
+
+    def get(self, key: str) -> FileInfo | None:
+        if cached := self._entries.get(key):
+            file_info, expires_at = cached
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(key)
+                return file_info
+            del self._entries[key]
+        return None
+
+    def put(self, key: str, file_info: FileInfo) -> None:
+        self._entries[key] = (file_info, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def head_files(
+        self, media_storage: AsyncMediaStorage, keys: list[str], concurrency: int
+    ) -> dict[str, FileInfo | None]:
+        """Metadata of the objects, at most `concurrency` HEAD requests are sent at once"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def head_file(key: str) -> FileInfo | None:
+            if file_info := self.get(key):
+                return file_info
+            async with semaphore:
+                file_info = await media_storage.head_file(key)
+            if file_info is not None:
+                self.put(key, file_info)
+            return file_info
+
+        unique_keys = list(dict.fromkeys(keys))
+        return dict(zip(unique_keys, await asyncio.gather(*[head_file(key) for key in unique_keys])))
+
+
+@functools.cache
+def get_file_info_cache() -> FileInfoCache:
+    media_storage_settings = settings.media_storage
+    return FileInfoCache(
+        max_size=media_storage_settings.media_storage_metadata_cache_size,
+        ttl=media_storage_settings.media_storage_metadata_cache_ttl,
+    )
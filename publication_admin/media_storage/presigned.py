@@ -0,0 +1,57 @@
+import functools
+import time
+from collections import OrderedDict
+
+from publication_admin.settings import settings
+
+from .s3 import S3MediaStorage
+
+# Enough for every image of a busy instance, an entry is a few hundred bytes
+PRESIGNED_URLS_CACHE_SIZE = 100_000
+
+
+class PresignedURLCache:
+    """
+    Presigned GET URLs by object key. Signing is local but not free, and list responses sign
+    every image they return, so a URL is reused until `renew_before` seconds to its expiry
+    """
+
+    def __init__(
+        self,
+        storage: S3MediaStorage,
+        expires_in: int,
+        renew_before: int,
+        max_size: int = PRESIGNED_URLS_CACHE_SIZE,
+    ):
+        if renew_before >= expires_in:
+            raise ValueError("URLs have to be renewed before they expire")
+        self.storage = storage
+        self.expires_in = expires_in
+        self.renew_before = renew_before
+        self.max_size = max_size
+        self._urls: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def get(self, key: str) -> str:
+        now = time.time()
+        if cached := self._urls.get(key):
+            url, renew_at = cached
+            if now < renew_at:
+                self._urls.move_to_end(key)
+                return url
+
+        url = self.storage.generate_presigned_get(key, self.expires_in)
+        self._urls[key] = (url, now + self.expires_in - self.renew_before)
+        self._urls.move_to_end(key)
+        if len(self._urls) > self.max_size:
+            self._urls.popitem(last=False)
+        return url
+
+
+@functools.cache
+def get_presigned_urls() -> PresignedURLCache:
+    media_storage_settings = settings.media_storage
+    return PresignedURLCache(
+        S3MediaStorage(),
+        expires_in=media_storage_settings.media_storage_presigned_url_expires_in,
+        renew_before=media_storage_settings.media_storage_presigned_url_renew_before,
+    )
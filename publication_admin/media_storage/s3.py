@@ -1,38 +1,379 @@
-from typing import BinaryIO
+import asyncio
+import functools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, Callable, TypeVar
 
 import boto3
 from botocore.client import Config
 from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
 from loguru import logger
 
+from publication_admin.metrics import S3_REQUEST_DURATION, S3_UPLOADED_BYTES
 from publication_admin.settings import settings
+from publication_admin.timing import timed
 
+from .base import AsyncMediaStorage, FileInfo, MediaStorageError, UploadError
 
-class MediaStorageError(Exception):
-    pass
+T = TypeVar("T")
 
+DELETE_OBJECTS_BATCH_SIZE = 1000
+# Downloaded objects are read from the response body in portions of this size
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
 
-class UploadError(MediaStorageError):
-    pass
+# boto3 is blocking, its calls are offloaded here to keep the event loop free during network transfers
+s3_executor = ThreadPoolExecutor(
+    max_workers=settings.media_storage.media_storage_max_workers,
+    thread_name_prefix="s3-media-storage",
+)
+
+
+def create_s3_client():
+    media_storage_settings = settings.media_storage
+    client = boto3.client(
+        service_name="s3",
+        endpoint_url=media_storage_settings.media_storage_url,
+        aws_access_key_id=media_storage_settings.media_storage_access_key_id,
+        aws_secret_access_key=media_storage_settings.media_storage_secret_access_key,
+        config=Config(
+            signature_version="s3v4",
+            max_pool_connections=media_storage_settings.media_storage_max_pool_connections,
+            retries={
+                "mode": media_storage_settings.media_storage_retry_mode,
+                "total_max_attempts": media_storage_settings.media_storage_max_attempts,
+            },
+            tcp_keepalive=media_storage_settings.media_storage_tcp_keepalive,
+        ),
+    )
+    # Counted as sent, so retried uploads are counted every time
+    for operation in ("PutObject", "UploadPart"):
+        client.meta.events.register(f"before-send.s3.{operation}", _count_uploaded_bytes)
+    return client
+
+
+def _count_uploaded_bytes(request, **_) -> None:
+    S3_UPLOADED_BYTES.inc(int(request.headers.get("Content-Length", 0)))
+
+
+@functools.cache
+def get_s3_client():
+    """
+    Process-wide S3 client, boto3 clients are thread-safe and building one per request
+    means resolving credentials, loading the service model and opening new connections every time
+    """
+    return create_s3_client()
 
 
 class S3MediaStorage:
-    def __init__(self):
-        self.client = boto3.client(
-            service_name="s3",
-            endpoint_url=settings.media_storage.media_storage_url,
-            aws_access_key_id=settings.media_storage.media_storage_access_key_id,
-            aws_secret_access_key=settings.media_storage.media_storage_secret_access_key,
-            config=Config(signature_version="s3v4"),
-        )
+    def __init__(self, client=None):
+        self.client = client or get_s3_client()
 
-    def upload_file(self, filename: str, content: BinaryIO) -> None:
+    def upload_file(self, filename: str, content: BinaryIO, content_type: str | None = None) -> None:
+        extra_args = {"ContentType": content_type} if content_type else {}
         try:
             self.client.put_object(
                 Body=content,
                 Bucket=settings.media_storage.media_storage_bucket,
                 Key=filename,
+                **extra_args,
+            )
+        except ClientError as e:
+            logger.exception(e)
+            raise UploadError(str(e)) from e
+
+    def create_multipart_upload(self, filename: str, content_type: str | None = None) -> str:
+        extra_args = {"ContentType": content_type} if content_type else {}
+        try:
+            response = self.client.create_multipart_upload(
+                Bucket=settings.media_storage.media_storage_bucket, Key=filename, **extra_args
             )
         except ClientError as e:
             logger.exception(e)
             raise UploadError(str(e)) from e
+        return response["UploadId"]
+
+    def upload_part(self, filename: str, upload_id: str, part_number: int, content: bytes) -> str:
+        """Upload a part of multipart upload, return its ETag"""
+        try:
+            response = self.client.upload_part(
+                Bucket=settings.media_storage.media_storage_bucket,
+                Key=filename,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=content,
+            )
+        except ClientError as e:
+            logger.exception(e)
+            raise UploadError(str(e)) from e
+        return response["ETag"]
+
+    def complete_multipart_upload(self, filename: str, upload_id: str, part_etags: list[str]) -> None:
+        parts = [{"PartNumber": number, "ETag": etag} for number, etag in enumerate(part_etags, start=1)]
+        try:
+            self.client.complete_multipart_upload(
+                Bucket=settings.media_storage.media_storage_bucket,
+                Key=filename,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except ClientError as e:
+            logger.exception(e)
+            raise UploadError(str(e)) from e
+
+    def abort_multipart_upload(self, filename: str, upload_id: str) -> None:
+        try:
+            self.client.abort_multipart_upload(
+                Bucket=settings.media_storage.media_storage_bucket, Key=filename, UploadId=upload_id
+            )
+        except ClientError as e:
+            logger.exception(e)
+            raise UploadError(str(e)) from e
+
+    def head_file(self, filename: str) -> FileInfo | None:
+        """Object metadata, None if it does not exist"""
+        try:
+            response = self.client.head_object(Bucket=settings.media_storage.media_storage_bucket, Key=filename)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            logger.exception(e)
+            raise MediaStorageError(str(e)) from e
+        return FileInfo(size=response["ContentLength"], content_type=response.get("ContentType"), etag=response["ETag"])
+
+    def get_file(self, filename: str) -> bytes:
+        try:
+            response = self.client.get_object(Bucket=settings.media_storage.media_storage_bucket, Key=filename)
+            return response["Body"].read()
+        except ClientError as e:
+            logger.exception(e)
+            raise MediaStorageError(str(e)) from e
+
+    def download_file(self, filename: str, fileobj: BinaryIO) -> FileInfo | None:
+        """Write the object into the file without holding it in memory, None if it does not exist"""
+        try:
+            response = self.client.get_object(Bucket=settings.media_storage.media_storage_bucket, Key=filename)
+            for chunk in response["Body"].iter_chunks(DOWNLOAD_CHUNK_SIZE):
+                fileobj.write(chunk)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            logger.exception(e)
+            raise MediaStorageError(str(e)) from e
+        return FileInfo(size=response["ContentLength"], content_type=response.get("ContentType"), etag=response["ETag"])
+
+    def open_file(self, filename: str) -> tuple[FileInfo, StreamingBody] | None:
+        """Metadata and the body of the object to read it gradually, None if it does not exist"""
+        try:
+            response = self.client.get_object(Bucket=settings.media_storage.media_storage_bucket, Key=filename)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            logger.exception(e)
+            raise MediaStorageError(str(e)) from e
+        file_info = FileInfo(
+            size=response["ContentLength"], content_type=response.get("ContentType"), etag=response["ETag"]
+        )
+        return file_info, response["Body"]
+
+    def get_file_range(self, filename: str, start: int, end: int) -> StreamingBody:
+        """Body of the object bytes from start to end inclusive, it has to be closed after reading"""
+        try:
+            response = self.client.get_object(
+                Bucket=settings.media_storage.media_storage_bucket, Key=filename, Range=f"bytes={start}-{end}"
+            )
+        except ClientError as e:
+            logger.exception(e)
+            raise MediaStorageError(str(e)) from e
+        return response["Body"]
+
+    def delete_file(self, filename: str) -> None:
+        try:
+            self.client.delete_object(Bucket=settings.media_storage.media_storage_bucket, Key=filename)
+        except ClientError as e:
+            logger.exception(e)
+            raise MediaStorageError(str(e)) from e
+
+    def delete_files(self, filenames: list[str]) -> None:
+        """Delete objects with as few requests as possible, DeleteObjects takes up to 1000 keys"""
+        for start in range(0, len(filenames), DELETE_OBJECTS_BATCH_SIZE):
+            batch = filenames[start : start + DELETE_OBJECTS_BATCH_SIZE]
+            try:
+                response = self.client.delete_objects(
+                    Bucket=settings.media_storage.media_storage_bucket,
+                    Delete={"Objects": [{"Key": filename} for filename in batch], "Quiet": True},
+                )
+            except ClientError as e:
+                logger.exception(e)
+                raise MediaStorageError(str(e)) from e
+
+            if errors := response.get("Errors"):
+                raise MediaStorageError(f"Failed to delete {len(errors)} objects, first error: {errors[0]}")
+
+    def generate_presigned_post(self, filename: str, content_type: str, max_size: int, expires_in: int) -> dict:
+        """Form fields for a browser POST upload, S3 itself enforces content type and size"""
+        return self.client.generate_presigned_post(
+            Bucket=settings.media_storage.media_storage_bucket,
+            Key=filename,
+            Fields={"Content-Type": content_type},
+            Conditions=[{"Content-Type": content_type}, ["content-length-range", 1, max_size]],
+            ExpiresIn=expires_in,
+        )
+
+    def generate_presigned_get(self, filename: str, expires_in: int) -> str:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": settings.media_storage.media_storage_bucket, "Key": filename},
+            ExpiresIn=expires_in,
+        )
+
+    def generate_presigned_put(self, filename: str, content_type: str, size: int, expires_in: int) -> str:
+        """URL for a PUT upload, the client must send exactly the signed Content-Type and Content-Length"""
+        return self.client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": settings.media_storage.media_storage_bucket,
+                "Key": filename,
+                "ContentType": content_type,
+                "ContentLength": size,
+            },
+            ExpiresIn=expires_in,
+        )
+
+
+class AsyncS3MediaStorage(AsyncMediaStorage):
+    """
+    Non-blocking counterpart of S3MediaStorage with the same methods and errors,
+    boto3 calls run in the bounded `s3_executor` thread pool
+    """
+
+    def __init__(self, storage: S3MediaStorage | None = None, executor: ThreadPoolExecutor = s3_executor):
+        self.storage = storage or S3MediaStorage()
+        self.executor = executor
+
+    async def upload_file(self, filename: str, content: BinaryIO, content_type: str | None = None) -> None:
+        await self._run(self.storage.upload_file, filename, content, content_type)
+
+    async def create_multipart_upload(self, filename: str, content_type: str | None = None) -> str:
+        return await self._run(self.storage.create_multipart_upload, filename, content_type)
+
+    async def upload_part(self, filename: str, upload_id: str, part_number: int, content: bytes) -> str:
+        return await self._run(self.storage.upload_part, filename, upload_id, part_number, content)
+
+    async def complete_multipart_upload(self, filename: str, upload_id: str, part_etags: list[str]) -> None:
+        await self._run(self.storage.complete_multipart_upload, filename, upload_id, part_etags)
+
+    async def abort_multipart_upload(self, filename: str, upload_id: str) -> None:
+        await self._run(self.storage.abort_multipart_upload, filename, upload_id)
+
+    async def head_file(self, filename: str) -> FileInfo | None:
+        return await self._run(self.storage.head_file, filename)
+
+    async def get_file(self, filename: str) -> bytes:
+        return await self._run(self.storage.get_file, filename)
+
+    async def download_file(self, filename: str, fileobj: BinaryIO) -> FileInfo | None:
+        return await self._run(self.storage.download_file, filename, fileobj)
+
+    async def stream_file(
+        self, filename: str, start: int, end: int, chunk_size: int = DOWNLOAD_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        """Bytes from start to end inclusive, read from S3 as the consumer goes"""
+        body = await self._run(self.storage.get_file_range, filename, start, end)
+        try:
+            while chunk := await self._run(body.read, chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    async def iter_files(
+        self,
+        filenames: list[str],
+        concurrency: int,
+        chunks_ahead: int,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    ) -> AsyncIterator[tuple[str, FileInfo, AsyncIterator[bytes]]]:
+        """
+        Contents of the files in order, the next files are fetched while the current one is consumed.
+        At most `concurrency` files are read at once, each buffering at most `chunks_ahead` chunks,
+        so memory use is bounded whatever the files are. Missing files are skipped.
+        """
+
+        async def fetch(filename: str, queue: asyncio.Queue) -> None:
+            try:
+                opened = await self._run(self.storage.open_file, filename)
+                if opened is None:
+                    await queue.put(None)
+                    return
+                file_info, body = opened
+                try:
+                    await queue.put(file_info)
+                    while chunk := await self._run(body.read, chunk_size):
+                        await queue.put(chunk)
+                finally:
+                    body.close()
+                await queue.put(b"")
+            except Exception as e:
+                await queue.put(e)
+
+        async def contents(queue: asyncio.Queue) -> AsyncIterator[bytes]:
+            while chunk := await _get_or_raise(queue):
+                yield chunk
+
+        pending = deque()
+        remaining = iter(filenames)
+        try:
+            while True:
+                while len(pending) < concurrency and (filename := next(remaining, None)) is not None:
+                    queue = asyncio.Queue(maxsize=chunks_ahead)
+                    pending.append((filename, queue, asyncio.create_task(fetch(filename, queue))))
+                if not pending:
+                    break
+
+                filename, queue, _ = pending[0]
+                file_info = await _get_or_raise(queue)
+                if file_info is None:
+                    logger.warning(f"Skipping missing file {filename}")
+                else:
+                    yield filename, file_info, contents(queue)
+                # Whatever is left unread of the file is dropped
+                _, _, task = pending.popleft()
+                task.cancel()
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+    async def delete_file(self, filename: str) -> None:
+        await self._run(self.storage.delete_file, filename)
+
+    async def delete_files(self, filenames: list[str]) -> None:
+        await self._run(self.storage.delete_files, filenames)
+
+    def generate_presigned_post(self, filename: str, content_type: str, max_size: int, expires_in: int) -> dict:
+        # Signing is local CPU work, no need to go to the thread pool
+        return self.storage.generate_presigned_post(filename, content_type, max_size, expires_in)
+
+    def generate_presigned_put(self, filename: str, content_type: str, size: int, expires_in: int) -> str:
+        return self.storage.generate_presigned_put(filename, content_type, size, expires_in)
+
+    def file_path(self, filename: str) -> str | None:
+        return None
+
+    async def _run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        started_at = time.perf_counter()
+        try:
+            with timed("s3"):
+                return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        finally:
+            # Partials and other callables have no names
+            operation = getattr(func, "__name__", "other")
+            S3_REQUEST_DURATION.labels(operation).observe(time.perf_counter() - started_at)
+
+
+async def _get_or_raise(queue: asyncio.Queue):
+    item = await queue.get()
+    if isinstance(item, Exception):
+        raise item
+    return item
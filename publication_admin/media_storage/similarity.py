@@ -0,0 +1,80 @@
+import asyncio
+import functools
+import io
+from enum import StrEnum
+
+import numpy as np
+from PIL import Image
+
+from publication_admin.settings import settings
+
+from .base import AsyncMediaStorage
+from .derivatives import get_derivatives_executor
+
+HASH_SIZE = 8
+PHASH_IMAGE_SIZE = HASH_SIZE * 4
+
+
+class PerceptualHash(StrEnum):
+    DHASH: str = "dhash"
+    PHASH: str = "phash"
+
+
+def dhash(image: Image.Image) -> np.ndarray:
+    """Gradient hash: whether each pixel is brighter than its right neighbour"""
+    pixels = np.asarray(image.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS), dtype=np.float32)
+    return (pixels[:, 1:] > pixels[:, :-1]).ravel()
+
+
+@functools.cache
+def _dct_matrix(size: int) -> np.ndarray:
+    """Orthonormal DCT-II basis, `matrix @ x` transforms the columns of x"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.sqrt(2 / size) * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def phash(image: Image.Image) -> np.ndarray:
+    """DCT hash: whether each low frequency is above the median, robust to recompression and small edits"""
+    pixels = np.asarray(image.resize((PHASH_IMAGE_SIZE,) * 2, Image.Resampling.LANCZOS), dtype=np.float64)
+    dct = _dct_matrix(PHASH_IMAGE_SIZE)
+    low_frequencies = (dct @ pixels @ dct.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    # DC term only reflects the overall brightness
+    return low_frequencies > np.median(low_frequencies[1:])
+
+
+def perceptual_hash(content: bytes, method: PerceptualHash) -> np.ndarray:
+    """Hash of HASH_SIZE² bits, runs in the worker process"""
+    with Image.open(io.BytesIO(content)) as image:
+        image.draft("L", (PHASH_IMAGE_SIZE,) * 2)
+        grayscale = image.convert("L")
+    return dhash(grayscale) if method == PerceptualHash.DHASH else phash(grayscale)
+
+
+def hamming_distances(hashes: np.ndarray) -> np.ndarray:
+    """Pairwise distances between the rows of (images, bits) boolean matrix"""
+    return np.count_nonzero(hashes[:, None, :] != hashes[None, :, :], axis=2)
+
+
+def find_near_duplicates(hashes: np.ndarray, max_distance: int) -> dict[int, int]:
+    """Map indexes of near-duplicate images to the earliest image they repeat"""
+    close = np.triu(hamming_distances(hashes) <= max_distance, k=1)
+    duplicates = {}
+    for original, duplicate in zip(*np.nonzero(close)):
+        # Pairs come ordered by the original, so a duplicate is attached to the first kept image
+        if original not in duplicates and duplicate not in duplicates:
+            duplicates[int(duplicate)] = int(original)
+    return duplicates
+
+
+async def hash_images(media_storage: AsyncMediaStorage, keys: list[str]) -> np.ndarray:
+    contents = await asyncio.gather(*[media_storage.get_file(key) for key in keys])
+
+    loop = asyncio.get_running_loop()
+    method = PerceptualHash(settings.image_duplicates_hash)
+    hashes = await asyncio.gather(
+        *[loop.run_in_executor(get_derivatives_executor(), perceptual_hash, content, method) for content in contents]
+    )
+    return np.stack(hashes)
@@ -0,0 +1,71 @@
+import os
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+
+# Requests are expected to take from milliseconds to the minutes of the ML service calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being handled",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Database connections taken from the pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKOUTS = Counter("db_pool_checkouts", "Database connections taken from the pool")
+DB_POOL_WAIT_DURATION = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting for a pooled database connection, including opening a new one",
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_TIMEOUTS = Counter("db_pool_timeouts", "Database connections not taken from the exhausted pool in time")
+
+SERVICE_REQUEST_DURATION = Histogram(
+    "service_request_duration_seconds",
+    "Time spent on requests to the ML services",
+    ["service", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+SERVICE_REQUEST_ERRORS = Counter(
+    "service_request_errors",
+    "Failed requests to the ML services, by HTTP status or `request` for network failures",
+    ["service", "reason"],
+)
+
+S3_REQUEST_DURATION = Histogram(
+    "s3_request_duration_seconds",
+    "Time spent on S3 calls, including waiting for a free thread",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+S3_UPLOADED_BYTES = Counter("s3_uploaded_bytes", "Bytes sent to S3 in objects and multipart upload parts")
+
+EMAILS_PENDING = Gauge("emails_pending", "Emails queued and not sent yet", multiprocess_mode="livesum")
+EMAILS_FAILED = Counter("emails_failed", "Emails which could not be sent")
+
+
+def is_multiprocess() -> bool:
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def get_registry() -> CollectorRegistry:
+    """
+    Registry served by `/api/meta/metrics`. With several workers PROMETHEUS_MULTIPROC_DIR is set to a directory
+    emptied before the start: workers write their values there and the scraped one aggregates them all
+    """
+    if not is_multiprocess():
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
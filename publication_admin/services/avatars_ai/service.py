@@ -1,9 +1,13 @@
+import time
 from typing import Mapping
 
 import httpx
 from loguru import logger
 from pydantic import BaseModel
 
+from publication_admin.metrics import SERVICE_REQUEST_DURATION, SERVICE_REQUEST_ERRORS
+from publication_admin.timing import timed
+
 
 class ServiceError(Exception):
     pass
@@ -34,20 +38,28 @@ class Service:
         timeout_config = self._get_timeout_config()
         log_prefix = self._log_prefix(path=path, method=method)
 
+        service = self.__class__.__name__
+        started_at = time.perf_counter()
+
         async with httpx.AsyncClient(base_url=self.base_url, timeout=timeout_config) as client:
             try:
                 logger.info(f"{log_prefix} requested: {json or params}")
-                response = await client.request(method, path, json=json, params=params)
+                with timed(service):
+                    response = await client.request(method, path, json=json, params=params)
                 logger.info(f"{log_prefix} response: {response.text}")
                 response.raise_for_status()
             except httpx.RequestError as exc:
                 logger.error(f"{log_prefix} request failed: {repr(exc)}")
+                SERVICE_REQUEST_ERRORS.labels(service, "request").inc()
                 raise ServiceError(str(exc)) from exc
             except httpx.HTTPStatusError as exc:
                 logger.error(
                     f"{log_prefix} non-2xx response: " f"code={exc.response.status_code} response={exc.response.text}"
                 )
+                SERVICE_REQUEST_ERRORS.labels(service, str(exc.response.status_code)).inc()
                 raise ServiceResponseError(str(exc), exc.response) from exc
+            finally:
+                SERVICE_REQUEST_DURATION.labels(service, method).observe(time.perf_counter() - started_at)
 
         return response.json()
 
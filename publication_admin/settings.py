@@ -1,7 +1,11 @@
+import os
+import tempfile
 from enum import StrEnum
+from typing import Literal
 
 from fastapi_mail import ConnectionConfig
 from loguru import logger
+from pydantic import Field, model_validator
 from pydantic_core import ValidationError
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -31,12 +35,64 @@ class DatabaseSettings(BaseSettings):
 
 
 class MediaStorageSettings(BaseSettings):
-    media_storage_url: str
-    media_storage_access_key_id: str
-    media_storage_secret_access_key: str
-    media_storage_bucket: str
+    # Local backend keeps files in `media_storage_local_dir`, for development and benchmarks without S3
+    media_storage_backend: Literal["s3", "local"] = "s3"
+    media_storage_local_dir: str = "media"
+    # Required by the S3 backend only
+    media_storage_url: str | None = None
+    media_storage_access_key_id: str | None = None
+    media_storage_secret_access_key: str | None = None
+    media_storage_bucket: str | None = None
+    # Size of the thread pool running blocking S3 calls
+    media_storage_max_workers: int = 16
+    # Shared S3 client tuning, the pool should fit all the workers
+    media_storage_max_pool_connections: int = 16
+    media_storage_retry_mode: Literal["legacy", "standard", "adaptive"] = "standard"
+    media_storage_max_attempts: int = 3
+    media_storage_tcp_keepalive: bool = True
+    # Streamed uploads are sent to S3 in parts of this size (5 MiB is the S3 minimum)
+    media_storage_multipart_part_size: int = 8 * 1024 * 1024
+    # Private buckets: media URLs are presigned, a signature is reused until `renew_before` seconds to its expiry
+    media_storage_presigned_urls: bool = False
+    media_storage_presigned_url_expires_in: int = 6 * 60 * 60
+    media_storage_presigned_url_renew_before: int = 30 * 60
+    # Metadata of the objects referenced by requests, see `media_storage.metadata`
+    media_storage_metadata_cache_size: int = 10_000
+    media_storage_metadata_cache_ttl: int = 60 * 60
+    # Public URL of the /api/media/ proxy, media URLs point straight to the bucket when not set
+    media_storage_proxy_url: str | None = None
+    # Disk cache of the proxied objects, larger objects are streamed from S3 without caching
+    media_storage_cache_dir: str = os.path.join(tempfile.gettempdir(), "publication_admin_media")
+    media_storage_cache_size: int = 1024 * 1024 * 1024
+    media_storage_cache_max_file_size: int = 20 * 1024 * 1024
+    # Objects are never rewritten under the same key, so clients may keep them for long
+    media_storage_cache_max_age: int = 7 * 24 * 60 * 60
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
+    @model_validator(mode="after")
+    def check_s3_configured(self) -> "MediaStorageSettings":
+        if self.media_storage_backend == "s3":
+            missing = [
+                name
+                for name in (
+                    "media_storage_url",
+                    "media_storage_access_key_id",
+                    "media_storage_secret_access_key",
+                    "media_storage_bucket",
+                )
+                if getattr(self, name) is None
+            ]
+            if missing:
+                raise ValueError(f"S3 media storage requires {', '.join(missing)}")
+        return self
+
+    @model_validator(mode="after")
+    def check_private_bucket_not_proxied(self) -> "MediaStorageSettings":
+        # The proxy serves files to anyone, objects of a private bucket are only given out by presigned URLs
+        if self.media_storage_presigned_urls and self.media_storage_proxy_url:
+            raise ValueError("Media proxy can't be used with presigned URLs, the bucket is private")
+        return self
+
 
 class MailConnectionConfig(ConnectionConfig):
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
@@ -48,6 +104,44 @@ class Settings(BaseSettings):
     secret_key: str
     enable_email_code_rate_limit: bool = True
     image_size_limit: int = 10 * 1024 * 1024
+    # Longer side of the image derivatives in pixels
+    image_thumbnail_size: int = 320
+    image_training_size: int = 1024
+    image_derivatives_quality: int = Field(default=85, ge=1, le=95)
+    image_derivatives_max_workers: int = 2
+    # Near-duplicate avatar training images, see `media_storage.similarity`
+    image_duplicates_hash: Literal["dhash", "phash"] = "phash"
+    image_duplicates_max_distance: int = Field(default=8, ge=0, le=64)
+    drop_duplicate_training_images: bool = True
+    presigned_upload_expires_in: int = 15 * 60
+    upload_batch_size_limit: int = 30
+    upload_batch_concurrency: int = 8
+    # HEAD requests sent at once when checking the images referenced by an avatar
+    image_keys_check_concurrency: int = 16
+    # Avatar images archive: files fetched at once and chunks each of them may read ahead of the archive
+    avatar_archive_concurrency: int = 4
+    avatar_archive_chunks_ahead: int = 4
+    # Resumable uploads are S3 multipart uploads, chunks can't be smaller than S3 minimal part size
+    upload_session_chunk_size: int = Field(default=5 * 1024 * 1024, ge=5 * 1024 * 1024)
+    upload_session_expires_in: int = 24 * 60 * 60
+    # Uploads not referenced by avatars or posts are deleted when not uploaded again for this long
+    media_gc_grace_period: int = 7 * 24 * 60 * 60
+    posts_batch_size_limit: int = 500
+    posts_changes_limit: int = 1000
+    posts_import_chunk_size: int = 5000
+    posts_import_max_line_size: int = 1024 * 1024
+    posts_import_max_reported_rejects: int = 1000
+    posts_partitions_premake_months: int = 3
+    # Responses of at least this size are compressed for clients accepting gzip, br or zstd, see `api.compression`.
+    # Higher levels save bandwidth at the cost of CPU
+    compression_minimum_size: int = 1024
+    compression_gzip_level: int = Field(default=6, ge=1, le=9)
+    compression_brotli_quality: int = Field(default=4, ge=0, le=11)
+    compression_zstd_level: int = Field(default=3, ge=1, le=22)
+    # Server-Timing header with the time requests spend on auth, database, ML services and S3, see `timing`.
+    # Sent to everyone when enabled, otherwise to the listed users only
+    server_timing: bool = False
+    server_timing_user_ids: list[int] = []
 
     ml_text_service_url: str
     ml_images_service_url: str
@@ -74,7 +168,8 @@ except ValidationError as e:
     logger.critical("Some environment variables are missing or invalid!")
 
     for env_error in e.errors():
-        env_name = env_error["loc"][0]
+        # Errors of the settings as a whole, e.g. conflicting values, have no location
+        env_name = env_error["loc"][0] if env_error["loc"] else "settings"
         logger.critical(f"{env_name}: {env_error['msg']}")
 
     raise e
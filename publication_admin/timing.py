@@ -0,0 +1,66 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+
+class ServerTiming:
+    """
+    Time spent by the request on its dependencies, summed up by name. Concurrent calls are summed as well,
+    so a name may take more than the request itself
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.durations: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        # Set once the request is authenticated, timings may be shown to some users only
+        self.user_id: int | None = None
+
+    def add(self, name: str, duration: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + duration
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def header(self) -> str:
+        """Server-Timing header value, durations are in milliseconds"""
+        metrics = []
+        for name, duration in self.durations.items():
+            metric = f"{name};dur={duration * 1000:.1f}"
+            if self.counts[name] > 1:
+                metric += f';desc="{self.counts[name]} calls"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={(time.perf_counter() - self.started_at) * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+_server_timing: ContextVar[ServerTiming | None] = ContextVar("server_timing", default=None)
+
+
+@contextmanager
+def collect_server_timing() -> Iterator[ServerTiming]:
+    """Collect timings of the block, tasks spawned within it keep adding to the same collector"""
+    server_timing = ServerTiming()
+    token = _server_timing.set(server_timing)
+    try:
+        yield server_timing
+    finally:
+        _server_timing.reset(token)
+
+
+def current_server_timing() -> ServerTiming | None:
+    return _server_timing.get()
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Add the time of the block to the request timings, does nothing outside of requests"""
+    server_timing = _server_timing.get()
+    if server_timing is None:
+        yield
+        return
+
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        server_timing.add(name, time.perf_counter() - started_at)
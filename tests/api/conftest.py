@@ -29,9 +29,17 @@ def session_mock():
 
 @pytest.fixture
 def media_storage_mock():
-    from publication_admin.media_storage.s3 import S3MediaStorage
+    from publication_admin.media_storage.base import FileInfo
+    from publication_admin.media_storage.metadata import get_file_info_cache
+    from publication_admin.media_storage.s3 import AsyncS3MediaStorage
 
-    return Mock(name="media_storage_mock", spec_set=S3MediaStorage)
+    # Metadata cached by one test must not leak into another
+    get_file_info_cache.cache_clear()
+
+    media_storage_mock = Mock(name="media_storage_mock", spec_set=AsyncS3MediaStorage)
+    media_storage_mock.file_path.return_value = None
+    media_storage_mock.head_file.return_value = FileInfo(size=1024, content_type="image/jpeg", etag='"etag"')
+    return media_storage_mock
 
 
 @pytest.fixture
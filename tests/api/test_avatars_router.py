@@ -1,8 +1,17 @@
+import io
+import zipfile
+from unittest.mock import AsyncMock, Mock
+
+import numpy as np
+import pytest
 from fastapi import status
 from httpx import AsyncClient
 from pytest_mock import MockerFixture
 
-from publication_admin.db.models import Avatar
+from publication_admin.db.models import Avatar, InitStatus
+from publication_admin.media_storage.base import FileInfo
+from publication_admin.services.avatars_ai import MLImages
+from publication_admin.services.avatars_ai.ml_images.dto import GETTextToPictureResponse, POSTInitPersonaTaskResponse
 
 AvatarsStoragePath = "publication_admin.api.routers.avatars.AvatarsStorage"
 TopicsStoragePath = "publication_admin.api.routers.avatars.TopicsStorage"
@@ -25,6 +34,73 @@ class TestGetCurrentAvatar:
         assert response.status_code == status.HTTP_200_OK
         assert_faky_avatar_response(response.json())
 
+    async def test_not_modified(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        avatar = faky_avatar(john_doe.user_id)
+        avatar.version = 1
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = avatar
+        response = await client.get("/api/avatars/current/", headers=john_doe.headers_mixin)
+        etag = response.headers["etag"]
+
+        response_mock = mocker.patch("publication_admin.api.routers.avatars._avatar_response")
+        response = await client.get(
+            "/api/avatars/current/", headers={**john_doe.headers_mixin, "if-none-match": f'W/"other", {etag}'}
+        )
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["etag"] == etag
+        response_mock.assert_not_called()
+
+        avatar.version = 2
+        mocker.stopall()
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = avatar
+        response = await client.get("/api/avatars/current/", headers={**john_doe.headers_mixin, "if-none-match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["etag"] != etag
+        assert_faky_avatar_response(response.json())
+
+    async def test_presigned_urls_etag(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        mocker.patch("publication_admin.api.images.settings.media_storage.media_storage_presigned_urls", True)
+        mocker.patch("publication_admin.api.images.settings.media_storage.media_storage_presigned_url_renew_before", 60)
+        get_presigned_urls_mock = mocker.patch("publication_admin.api.images.get_presigned_urls")
+        get_presigned_urls_mock.return_value.get.side_effect = lambda key: f"https://s3/{key}?signature"
+        time_mock = mocker.patch("publication_admin.api.images.time.time", return_value=1000)
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = faky_avatar(john_doe.user_id)
+        etag = (await client.get("/api/avatars/current/", headers=john_doe.headers_mixin)).headers["etag"]
+
+        # Presigned URLs are renewed, the client has to get the new ones
+        time_mock.return_value = 1000 + 60
+        response = await client.get("/api/avatars/current/", headers={**john_doe.headers_mixin, "if-none-match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["etag"] != etag
+
+    async def test_presigned_image_urls(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        mocker.patch("publication_admin.api.images.settings.media_storage.media_storage_presigned_urls", True)
+        get_presigned_urls_mock = mocker.patch("publication_admin.api.images.get_presigned_urls")
+        get_presigned_urls_mock.return_value.get.side_effect = lambda key: f"https://s3/{key}?signature"
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = faky_avatar(john_doe.user_id)
+
+        response = await client.get("/api/avatars/current/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["image_urls"] == ["https://s3/secret_image_of_me.jpg?signature"]
+
+    async def test_presigned_thumbnail_urls(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        mocker.patch("publication_admin.api.images.settings.media_storage.media_storage_presigned_urls", True)
+        get_presigned_urls_mock = mocker.patch("publication_admin.api.images.get_presigned_urls")
+        get_presigned_urls_mock.return_value.get.side_effect = lambda key: f"https://s3/{key}?signature"
+        avatar = faky_avatar(john_doe.user_id)
+        avatar.images = ["pubadmin/user-content/image.jpeg"]
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = avatar
+        mocker.patch("publication_admin.api.images.MediaFilesStorage.get_keys_with_derivative").return_value = {
+            "pubadmin/user-content/image.jpeg"
+        }
+
+        response = await client.get("/api/avatars/current/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["thumbnail_urls"] == {
+            "pubadmin/user-content/image.jpeg": "https://s3/pubadmin/user-content/image.thumbnail.jpeg?signature"
+        }
+
 
 class TestCreateAvatar:
     valid_payload = {"name": "test", "text": "test", "topics": [], "images": []}
@@ -54,6 +130,24 @@ class TestCreateAvatar:
         create_mock.call_args_list[0].kwargs["user_id"] = john_doe.user_id
         assert_faky_avatar_response(response.json())
 
+    async def test_invalid_images(self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, john_doe):
+        mocker.patch(f"{AvatarsStoragePath}.exists_for_user").return_value = False
+        create_mock = mocker.patch(f"{AvatarsStoragePath}.create")
+        media_storage_mock.head_file.side_effect = lambda key: {
+            "ok.jpg": FileInfo(size=1024, content_type="image/jpeg", etag='"1"'),
+            "doc.pdf": FileInfo(size=1024, content_type="application/pdf", etag='"2"'),
+        }.get(key)
+        payload = {**self.valid_payload, "images": ["ok.jpg", "missing.jpg", "doc.pdf"]}
+
+        response = await client.post("/api/avatars/", json=payload, headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert [(error["loc"], error["type"]) for error in response.json()["details"]] == [
+            (["body", "images", 1], "image_not_found"),
+            (["body", "images", 2], "image_content_type"),
+        ]
+        create_mock.assert_not_called()
+
 
 class TestPatchAvatar:
     valid_payload = {"name": "test_patch", "text": "test_patch", "topics": [" patching ", "debug"]}
@@ -96,6 +190,191 @@ class TestPatchAvatar:
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
 
+class TestInitAvatar:
+    @pytest.fixture
+    def ml_images_mock(self, app):
+        from publication_admin.api.deps import get_ml_images_service
+
+        ml_images_mock = Mock(spec_set=MLImages)
+        ml_images_mock.post_init_persona_task = AsyncMock(
+            return_value=POSTInitPersonaTaskResponse(task_id="task", status="PENDING")
+        )
+        app.dependency_overrides[get_ml_images_service] = lambda: ml_images_mock
+        return ml_images_mock
+
+    @pytest.fixture
+    def avatar(self, mocker: MockerFixture, john_doe) -> Avatar:
+        avatar = faky_avatar(john_doe.user_id)
+        avatar.images = ["a.jpg", "b.jpg", "c.jpg"]
+        avatar.init_status = InitStatus.CREATED
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = avatar
+        return avatar
+
+    async def test_drop_duplicates(self, client: AsyncClient, mocker: MockerFixture, ml_images_mock, avatar, john_doe):
+        find_duplicates_mock = mocker.patch("publication_admin.api.routers.avatars.find_duplicate_images")
+        find_duplicates_mock.return_value = {1: 0}
+
+        response = await client.post("/api/avatars/current/init/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"status": InitStatus.PENDING, "duplicate_images": {"b.jpg": "a.jpg"}}
+        assert ml_images_mock.post_init_persona_task.call_args.kwargs["s3_paths"] == ["a.jpg", "c.jpg"]
+
+    async def test_flag_duplicates(self, client: AsyncClient, mocker: MockerFixture, ml_images_mock, avatar, john_doe):
+        mocker.patch("publication_admin.api.routers.avatars.settings.drop_duplicate_training_images", False)
+        mocker.patch("publication_admin.api.routers.avatars.find_duplicate_images").return_value = {1: 0}
+
+        response = await client.post("/api/avatars/current/init/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["duplicate_images"] == {"b.jpg": "a.jpg"}
+        assert ml_images_mock.post_init_persona_task.call_args.kwargs["s3_paths"] == ["a.jpg", "b.jpg", "c.jpg"]
+
+    async def test_repeated_image(self, client: AsyncClient, mocker: MockerFixture, ml_images_mock, avatar, john_doe):
+        avatar.images = ["a.jpg", "a.jpg", "b.jpg"]
+        mocker.patch("publication_admin.api.images.hash_images").return_value = np.array(
+            [[0] * 64, [0] * 64, [1] * 64], dtype=bool
+        )
+
+        response = await client.post("/api/avatars/current/init/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["duplicate_images"] == {}
+        assert ml_images_mock.post_init_persona_task.call_args.kwargs["s3_paths"] == ["a.jpg", "b.jpg"]
+
+    async def test_missing_images(self, client: AsyncClient, media_storage_mock, ml_images_mock, avatar, john_doe):
+        media_storage_mock.head_file.side_effect = lambda key: (
+            None if key == "b.jpg" else FileInfo(size=1024, content_type="image/jpeg", etag='"1"')
+        )
+
+        response = await client.post("/api/avatars/current/init/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["details"][0]["loc"] == ["images", 1]
+        ml_images_mock.post_init_persona_task.assert_not_called()
+        assert avatar.init_status == InitStatus.CREATED
+
+
+class TestProfileImagesStatus:
+    @pytest.fixture
+    def ml_images_mock(self, app):
+        from publication_admin.api.deps import get_ml_images_service
+
+        ml_images_mock = Mock(spec_set=MLImages)
+        app.dependency_overrides[get_ml_images_service] = lambda: ml_images_mock
+        return ml_images_mock
+
+    async def test_image_url(self, client: AsyncClient, mocker: MockerFixture, ml_images_mock, john_doe):
+        mocker.patch(
+            "publication_admin.api.images.settings.media_storage.media_storage_proxy_url",
+            "https://api.example.com/api/media/",
+        )
+        ml_images_mock.get_text_to_picture_task = AsyncMock(
+            return_value=GETTextToPictureResponse(task_id="task", status="SUCCESS", image_path="results/1.jpeg")
+        )
+
+        response = await client.get(
+            "/api/avatars/current/profile-images-status/", params={"task_id": "task"}, headers=john_doe.headers_mixin
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        # Generated images are not served by the media proxy
+        assert response.json()["image_url"].endswith("/results/1.jpeg")
+        assert not response.json()["image_url"].startswith("https://api.example.com/api/media/")
+
+    async def test_pending(self, client: AsyncClient, ml_images_mock, john_doe):
+        ml_images_mock.get_text_to_picture_task = AsyncMock(
+            return_value=GETTextToPictureResponse(task_id="task", status="PENDING", image_path=None)
+        )
+
+        response = await client.get(
+            "/api/avatars/current/profile-images-status/", params={"task_id": "task"}, headers=john_doe.headers_mixin
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["image_url"] is None
+
+
+class TestDownloadAvatarImages:
+    @pytest.fixture
+    def avatar(self, mocker: MockerFixture, john_doe) -> Avatar:
+        avatar = faky_avatar(john_doe.user_id)
+        avatar.images = ["user_content/me.jpg", "other/me.jpg"]
+        avatar.profile_image = "results/profile.jpg"
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = avatar
+        return avatar
+
+    @pytest.fixture
+    def stored_files(self, media_storage_mock):
+        async def iter_files(filenames, **kwargs):
+            for filename in filenames:
+                content = filename.encode() * 1000
+                yield filename, FileInfo(size=len(content), content_type="image/jpeg", etag='"etag"'), chunks(content)
+
+        async def chunks(content):
+            for start in range(0, len(content), 4096):
+                yield content[start : start + 4096]
+
+        media_storage_mock.iter_files.side_effect = iter_files
+
+    async def test_archive(self, client: AsyncClient, session_mock, avatar, stored_files, john_doe):
+        response = await client.get("/api/avatars/current/images/archive/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        # The database session is not kept open while the archive is streamed
+        session_mock.close.assert_awaited_once()
+        assert response.headers["content-type"] == "application/zip"
+        assert response.headers["content-disposition"] == 'attachment; filename="avatar-1.zip"'
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            assert archive.namelist() == ["images/01_me.jpg", "images/02_me.jpg"]
+            assert archive.read("images/02_me.jpg") == b"other/me.jpg" * 1000
+
+    async def test_include_profile_image(self, client: AsyncClient, avatar, stored_files, john_doe):
+        response = await client.get(
+            "/api/avatars/current/images/archive/",
+            params={"include_profile_image": True},
+            headers=john_doe.headers_mixin,
+        )
+
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            assert archive.namelist()[-1] == "profile/profile.jpg"
+
+    async def test_repeated_keys(self, client: AsyncClient, avatar, stored_files, john_doe):
+        avatar.images = ["user_content/me.jpg", "user_content/me.jpg"]
+        avatar.profile_image = "user_content/me.jpg"
+
+        response = await client.get(
+            "/api/avatars/current/images/archive/",
+            params={"include_profile_image": True},
+            headers=john_doe.headers_mixin,
+        )
+
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            assert archive.namelist() == ["images/01_me.jpg", "images/02_me.jpg", "profile/me.jpg"]
+            assert archive.read("images/02_me.jpg") == b"user_content/me.jpg" * 1000
+
+    async def test_missing_file(self, client: AsyncClient, avatar, media_storage_mock, stored_files, john_doe):
+        avatar.images = ["missing/me.jpg", "user_content/me.jpg"]
+        iter_files = media_storage_mock.iter_files.side_effect
+
+        def iter_stored_files(filenames, **kwargs):
+            return iter_files([filename for filename in filenames if not filename.startswith("missing/")], **kwargs)
+
+        media_storage_mock.iter_files.side_effect = iter_stored_files
+
+        response = await client.get("/api/avatars/current/images/archive/", headers=john_doe.headers_mixin)
+
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            assert archive.namelist() == ["images/02_me.jpg"]
+
+    async def test_no_avatar(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = None
+
+        response = await client.get("/api/avatars/current/images/archive/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
 def faky_avatar(user_id):
     return Avatar(
         id=1,
@@ -0,0 +1,151 @@
+import asyncio
+import gzip
+
+import brotli
+import pytest
+import zstandard
+from fastapi import status
+from httpx import AsyncClient
+from pytest_mock import MockerFixture
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from publication_admin.api.compression import CompressionMiddleware, negotiate_encoding
+from publication_admin.db.models import Topic
+
+TEXT = b"compressible " * 200
+ENCODINGS = ["zstd", "br", "gzip"]
+
+
+async def chunks():
+    for _ in range(3):
+        yield TEXT
+
+
+def make_app() -> Starlette:
+    routes = [
+        Route("/text", lambda _: PlainTextResponse(TEXT, headers={"etag": '"v1"'})),
+        Route("/small", lambda _: PlainTextResponse(b"small", headers={"etag": '"v1"'})),
+        Route("/not-modified", lambda _: Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"etag": '"v1"'})),
+        Route("/image", lambda _: Response(TEXT, media_type="image/jpeg")),
+        Route("/partial", lambda _: PlainTextResponse(TEXT[:100], status_code=status.HTTP_206_PARTIAL_CONTENT)),
+        Route("/stream", lambda _: StreamingResponse(chunks(), media_type="application/x-ndjson")),
+    ]
+    app = Starlette(routes=routes)
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    return app
+
+
+@pytest.fixture
+async def compression_client():
+    async with AsyncClient(app=make_app(), base_url="http://test") as client:
+        yield client
+
+
+async def get_raw(client: AsyncClient, path: str, accept_encoding: str) -> tuple[dict, bytes]:
+    async with client.stream("GET", path, headers={"accept-encoding": accept_encoding}) as response:
+        return response.headers, b"".join([chunk async for chunk in response.aiter_raw()])
+
+
+class TestCompressionMiddleware:
+    @pytest.mark.parametrize(
+        ("encoding", "decompress"),
+        [
+            ("gzip", gzip.decompress),
+            ("br", brotli.decompress),
+            ("zstd", lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)),
+        ],
+    )
+    async def test_compressed(self, compression_client: AsyncClient, encoding, decompress):
+        headers, body = await get_raw(compression_client, "/text", encoding)
+
+        assert headers["content-encoding"] == encoding
+        assert headers["vary"] == "Accept-Encoding"
+        assert headers["content-length"] == str(len(body))
+        assert headers["etag"] == 'W/"v1"'
+        assert decompress(body) == TEXT
+
+    async def test_streaming(self):
+        messages = []
+
+        async def receive():
+            # Client never disconnects
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/stream", "headers": [(b"accept-encoding", b"gzip")]}
+        await make_app()(scope, receive, send)
+
+        start, *bodies = messages
+        headers = dict(start["headers"])
+        assert headers[b"content-encoding"] == b"gzip"
+        assert b"content-length" not in headers
+        # Every chunk is flushed as soon as it is produced
+        assert len([body for body in bodies if body["more_body"]]) == 3
+        assert gzip.decompress(b"".join(body["body"] for body in bodies)) == TEXT * 3
+
+    @pytest.mark.parametrize(("path", "accept_encoding"), [("/small", "gzip"), ("/text", "identity")])
+    async def test_not_compressed(self, compression_client: AsyncClient, path, accept_encoding):
+        headers, body = await get_raw(compression_client, path, accept_encoding)
+
+        assert "content-encoding" not in headers
+        assert headers["vary"] == "Accept-Encoding"
+        assert headers["content-length"] == str(len(body))
+
+    @pytest.mark.parametrize(
+        ("path", "accept_encoding", "etag"),
+        [
+            ("/text", "gzip", 'W/"v1"'),
+            ("/small", "gzip", 'W/"v1"'),
+            ("/not-modified", "gzip", 'W/"v1"'),
+            ("/text", "identity", '"v1"'),
+            ("/not-modified", "identity", '"v1"'),
+        ],
+    )
+    async def test_etag(self, compression_client: AsyncClient, path, accept_encoding, etag):
+        headers, _ = await get_raw(compression_client, path, accept_encoding)
+
+        # 304s carry the same validators as the 200s of the same encoding
+        assert headers["etag"] == etag
+        assert headers["vary"] == "Accept-Encoding"
+
+    @pytest.mark.parametrize("path", ["/image", "/partial"])
+    async def test_skipped(self, compression_client: AsyncClient, path):
+        headers, _ = await get_raw(compression_client, path, "gzip, br, zstd")
+
+        assert "content-encoding" not in headers
+        assert "vary" not in headers
+
+    async def test_api_response(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        mocker.patch("publication_admin.api.routers.topics.TopicsStorage.get_version").return_value = (100, None)
+        mocker.patch("publication_admin.api.routers.topics.TopicsStorage.all").return_value = [
+            Topic(name=f"topic {i}") for i in range(100)
+        ]
+
+        response = await client.get("/api/topics/", headers={**john_doe.headers_mixin, "accept-encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.json()) == 100
+
+
+class TestNegotiateEncoding:
+    @pytest.mark.parametrize(
+        ("accept_encoding", "expected"),
+        [
+            ("gzip, deflate, br, zstd", "zstd"),
+            ("gzip, deflate, br", "br"),
+            ("gzip;q=1.0, br;q=0.5", "gzip"),
+            ("br;q=0, gzip", "gzip"),
+            ("*", "zstd"),
+            ("*, zstd;q=0", "br"),
+            ("identity", None),
+            ("gzip;q=0", None),
+            ("GZIP;q=invalid, br", "br"),
+            ("", None),
+        ],
+    )
+    def test_negotiate(self, accept_encoding, expected):
+        assert negotiate_encoding(accept_encoding, ENCODINGS) == expected
@@ -1,5 +1,71 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+from unittest.mock import AsyncMock
+
+import pytest
 from fastapi import status
 from httpx import AsyncClient
+from pytest_mock import MockerFixture
+
+from publication_admin.api.errors import APIValidationException
+from publication_admin.api.routers.files import validate_image_stream
+from publication_admin.db.models import MediaFile, MediaFileStatus, UploadSession, User
+from publication_admin.media_storage.base import FileInfo, MediaStorageError, UploadError
+
+MediaFilesStoragePath = "publication_admin.api.routers.files.MediaFilesStorage"
+UploadSessionsStoragePath = "publication_admin.api.routers.files.UploadSessionsStorage"
+
+
+@pytest.fixture(autouse=True)
+def generate_derivatives_mock(mocker: MockerFixture):
+    return mocker.patch("publication_admin.api.routers.files.generate_derivatives")
+
+
+@pytest.fixture
+def current_user(session_mock, john_doe) -> User:
+    user = User(id=john_doe.user_id, email=john_doe.email)
+    session_mock.get = AsyncMock(return_value=user)
+    return user
+
+
+@pytest.fixture
+def known_hashes(mocker: MockerFixture) -> dict[str, MediaFile]:
+    """Content hashes of stored files, uploads are checked against them"""
+    hashes = {}
+    mocker.patch(
+        f"{MediaFilesStoragePath}.use_by_sha256",
+        side_effect=lambda requested: {sha256: file for sha256, file in hashes.items() if sha256 in requested},
+    )
+    return hashes
+
+
+def stored_file(content: bytes, derivatives: list[str]) -> MediaFile:
+    return MediaFile(
+        key="pubadmin/user-content/stored.jpeg", sha256=sha256(content).hexdigest(), derivatives=derivatives
+    )
+
+
+@pytest.fixture
+def add_content_mock(mocker: MockerFixture):
+    """New content is registered under the uploaded key"""
+    return mocker.patch(
+        f"{MediaFilesStoragePath}.add_content",
+        side_effect=lambda key, sha256, **kwargs: MediaFile(key=key, sha256=sha256, derivatives=[]),
+    )
+
+
+@pytest.fixture
+def stored_content(media_storage_mock) -> bytes:
+    """Content of the files uploaded straight to the storage"""
+    content = b"\xff\xd8\xff image data"
+
+    async def stream_file(key, start, end):
+        yield content[start : end + 1]
+
+    media_storage_mock.stream_file.side_effect = stream_file
+    return content
 
 
 class TestUpload:
@@ -19,9 +85,585 @@ class TestUpload:
         response = await client.post("/api/files/image/upload/", files=self.jumbo_file, headers=john_doe.headers_mixin)
         assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
-    async def test_successful_upload(self, client: AsyncClient, media_storage_mock, john_doe):
+    async def test_successful_upload(
+        self, client: AsyncClient, media_storage_mock, known_hashes, add_content_mock, john_doe
+    ):
         response = await client.post("/api/files/image/upload/", files=self.jpeg_file, headers=john_doe.headers_mixin)
         assert response.status_code == status.HTTP_200_OK
-        media_storage_mock.upload_file.assert_called_once()
-        assert response.json()["file_id"] != ""
+        media_storage_mock.upload_file.assert_awaited_once()
+        assert response.json()["file_id"] == f"pubadmin/user-content/{sha256(b'image data').hexdigest()}.jpeg"
         assert response.json()["url"] != ""
+
+        add_content_mock.assert_awaited_once()
+        assert add_content_mock.call_args.kwargs["key"] == response.json()["file_id"]
+        assert add_content_mock.call_args.kwargs["sha256"] == sha256(b"image data").hexdigest()
+
+    async def test_known_content_is_not_uploaded(
+        self,
+        client: AsyncClient,
+        media_storage_mock,
+        known_hashes,
+        add_content_mock,
+        generate_derivatives_mock,
+        john_doe,
+    ):
+        known_hashes[sha256(b"image data").hexdigest()] = stored_file(b"image data", ["thumbnail", "training"])
+        response = await client.post("/api/files/image/upload/", files=self.jpeg_file, headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["file_id"] == "pubadmin/user-content/stored.jpeg"
+        assert response.json()["thumbnail_url"].endswith("pubadmin/user-content/stored.thumbnail.jpeg")
+        media_storage_mock.upload_file.assert_not_called()
+        add_content_mock.assert_not_called()
+        generate_derivatives_mock.assert_not_called()
+
+    async def test_known_content_without_derivatives(
+        self,
+        client: AsyncClient,
+        media_storage_mock,
+        known_hashes,
+        add_content_mock,
+        generate_derivatives_mock,
+        john_doe,
+    ):
+        known_hashes[sha256(b"image data").hexdigest()] = stored_file(b"image data", [])
+        response = await client.post("/api/files/image/upload/", files=self.jpeg_file, headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["thumbnail_url"] is None
+        media_storage_mock.upload_file.assert_not_called()
+        generate_derivatives_mock.assert_called_once_with(media_storage_mock, "pubadmin/user-content/stored.jpeg")
+
+    async def test_derivatives(
+        self,
+        client: AsyncClient,
+        media_storage_mock,
+        known_hashes,
+        add_content_mock,
+        generate_derivatives_mock,
+        john_doe,
+    ):
+        response = await client.post("/api/files/image/upload/", files=self.jpeg_file, headers=john_doe.headers_mixin)
+        assert response.status_code == status.HTTP_200_OK
+
+        # Derivatives are not there until the background task creates them
+        assert response.json()["thumbnail_url"] is None
+        assert response.json()["training_url"] is None
+        generate_derivatives_mock.assert_called_once_with(media_storage_mock, response.json()["file_id"])
+
+
+@pytest.mark.usefixtures("known_hashes")
+class TestUploadBatch:
+    url = "/api/files/image/upload/batch/"
+
+    async def test_require_auth(self, client: AsyncClient):
+        response = await client.post(self.url, files=[("files", ("test.jpg", b"image data", "image/jpeg"))])
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_validation_files_count(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, john_doe
+    ):
+        mocker.patch("publication_admin.api.routers.files.settings.upload_batch_size_limit", 2)
+        files = [("files", (f"{i}.jpg", b"image data", "image/jpeg")) for i in range(3)]
+        response = await client.post(self.url, files=files, headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        media_storage_mock.upload_file.assert_not_called()
+
+    async def test_per_file_results(
+        self, client: AsyncClient, media_storage_mock, session_mock, add_content_mock, john_doe
+    ):
+        async def upload_file(filename, content, content_type=None):
+            if content.read() == b"broken":
+                raise UploadError("boom")
+
+        media_storage_mock.upload_file.side_effect = upload_file
+        files = [
+            ("files", ("first.jpg", b"image data", "image/jpeg")),
+            ("files", ("second.png", b"image data", "image/png")),
+            ("files", ("third.jpg", b"broken", "image/jpeg")),
+            ("files", ("fourth.jpg", b"other image data", "image/jpeg")),
+        ]
+        response = await client.post(self.url, files=files, headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        results = response.json()["results"]
+        assert [result["filename"] for result in results] == ["first.jpg", "second.png", "third.jpg", "fourth.jpg"]
+        assert [result["image"] is not None for result in results] == [True, False, False, True]
+        assert [result["error"] is not None for result in results] == [False, True, True, False]
+        assert media_storage_mock.upload_file.await_count == 3
+
+        added_keys = [call.kwargs["key"] for call in add_content_mock.call_args_list]
+        assert added_keys == [results[0]["image"]["file_id"], results[3]["image"]["file_id"]]
+        session_mock.commit.assert_awaited_once()
+
+    async def test_deduplication(
+        self, client: AsyncClient, media_storage_mock, known_hashes, add_content_mock, john_doe
+    ):
+        known_hashes[sha256(b"stored").hexdigest()] = stored_file(b"stored", ["thumbnail", "training"])
+        files = [
+            ("files", ("first.jpg", b"stored", "image/jpeg")),
+            ("files", ("second.jpg", b"new", "image/jpeg")),
+            ("files", ("third.jpg", b"new", "image/jpeg")),
+        ]
+        response = await client.post(self.url, files=files, headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        file_ids = [result["image"]["file_id"] for result in response.json()["results"]]
+        new_key = f"pubadmin/user-content/{sha256(b'new').hexdigest()}.jpeg"
+        assert file_ids == ["pubadmin/user-content/stored.jpeg", new_key, new_key]
+        media_storage_mock.upload_file.assert_awaited_once()
+        assert media_storage_mock.upload_file.call_args.args[0] == new_key
+        add_content_mock.assert_awaited_once()
+
+    async def test_bounded_concurrency(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, add_content_mock, john_doe
+    ):
+        mocker.patch("publication_admin.api.routers.files.settings.upload_batch_concurrency", 2)
+        in_flight = 0
+        max_in_flight = 0
+
+        async def upload_file(filename, content, content_type=None):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+        media_storage_mock.upload_file.side_effect = upload_file
+        files = [("files", (f"{i}.jpg", f"image data {i}".encode(), "image/jpeg")) for i in range(6)]
+        response = await client.post(self.url, files=files, headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert media_storage_mock.upload_file.await_count == 6
+        assert max_in_flight == 2
+
+
+class TestUploadStream:
+    url = "/api/files/image/upload/stream/"
+    jpeg_headers = {"Content-Type": "image/jpeg"}
+
+    @pytest.fixture(autouse=True)
+    def consume_stream(self, media_storage_mock):
+        async def upload_stream(filename, chunks, content_type=None):
+            return sum([len(chunk) async for chunk in chunks])
+
+        media_storage_mock.upload_stream.side_effect = upload_stream
+
+    async def test_require_auth(self, client: AsyncClient):
+        response = await client.post(self.url, content=b"\xff\xd8\xff", headers=self.jpeg_headers)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_validation_content_type(self, client: AsyncClient, media_storage_mock, john_doe):
+        response = await client.post(
+            self.url, content=b"\xff\xd8\xff", headers={"Content-Type": "image/png", **john_doe.headers_mixin}
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        media_storage_mock.upload_stream.assert_not_called()
+
+    async def test_validation_content_length(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, john_doe
+    ):
+        mocker.patch("publication_admin.api.routers.files.settings.image_size_limit", 2)
+        response = await client.post(
+            self.url, content=b"\xff\xd8\xff", headers={**self.jpeg_headers, **john_doe.headers_mixin}
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        media_storage_mock.upload_stream.assert_not_called()
+
+    async def test_validation_magic_bytes(self, client: AsyncClient, john_doe):
+        response = await client.post(
+            self.url, content=b"\x89PNG image data", headers={**self.jpeg_headers, **john_doe.headers_mixin}
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_successful_upload(self, client: AsyncClient, media_storage_mock, add_content_mock, john_doe):
+        content = b"\xff\xd8\xff image data"
+        response = await client.post(self.url, content=content, headers={**self.jpeg_headers, **john_doe.headers_mixin})
+        assert response.status_code == status.HTTP_200_OK
+
+        add_content_mock.assert_awaited_once()
+        assert add_content_mock.call_args.kwargs["key"] == response.json()["file_id"]
+        assert add_content_mock.call_args.kwargs["sha256"] == sha256(content).hexdigest()
+        assert add_content_mock.call_args.kwargs["size"] == len(content)
+        media_storage_mock.delete_file.assert_not_called()
+
+    async def test_known_content(
+        self, client: AsyncClient, media_storage_mock, add_content_mock, generate_derivatives_mock, john_doe
+    ):
+        content = b"\xff\xd8\xff image data"
+        add_content_mock.side_effect = None
+        add_content_mock.return_value = stored_file(content, ["thumbnail", "training"])
+        response = await client.post(self.url, content=content, headers={**self.jpeg_headers, **john_doe.headers_mixin})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["file_id"] == "pubadmin/user-content/stored.jpeg"
+        # The streamed copy is not kept
+        media_storage_mock.delete_file.assert_awaited_once_with(media_storage_mock.upload_stream.call_args.args[0])
+        generate_derivatives_mock.assert_not_called()
+
+
+class TestValidateImageStream:
+    async def chunks(self, *chunks: bytes):
+        for chunk in chunks:
+            yield chunk
+
+    async def test_magic_bytes_split_between_chunks(self):
+        chunks = [chunk async for chunk in validate_image_stream(self.chunks(b"\xff", b"\xd8\xff", b"data"), 100)]
+        assert b"".join(chunks) == b"\xff\xd8\xffdata"
+
+    async def test_fails_fast_on_invalid_magic_bytes(self):
+        stream = validate_image_stream(self.chunks(b"\xff\x00", b"never read"), 100)
+        with pytest.raises(APIValidationException):
+            await anext(stream)
+
+    async def test_fails_on_size_limit(self):
+        stream = validate_image_stream(self.chunks(b"\xff\xd8\xff", b"x" * 100), 100)
+        assert await anext(stream) == b"\xff\xd8\xff"
+        with pytest.raises(APIValidationException):
+            await anext(stream)
+
+    async def test_fails_on_empty_stream(self):
+        with pytest.raises(APIValidationException):
+            await anext(validate_image_stream(self.chunks(), 100))
+
+
+class TestPresignedUpload:
+    async def test_require_auth(self, client: AsyncClient):
+        response = await client.post("/api/files/image/presigned-upload/", json={})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_presigned_post(self, client: AsyncClient, media_storage_mock, session_mock, john_doe):
+        media_storage_mock.generate_presigned_post.return_value = {"url": "http://s3", "fields": {"key": "value"}}
+        response = await client.post("/api/files/image/presigned-upload/", json={}, headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["method"] == "POST"
+        assert response.json()["fields"] == {"key": "value"}
+        media_file: MediaFile = session_mock.add.call_args.args[0]
+        assert media_file.key == response.json()["file_id"]
+        assert media_file.status == MediaFileStatus.PENDING
+
+    async def test_presigned_put_requires_size(self, client: AsyncClient, john_doe):
+        response = await client.post(
+            "/api/files/image/presigned-upload/", json={"method": "PUT"}, headers=john_doe.headers_mixin
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_presigned_put(self, client: AsyncClient, media_storage_mock, john_doe):
+        media_storage_mock.generate_presigned_put.return_value = "http://s3/signed"
+        response = await client.post(
+            "/api/files/image/presigned-upload/", json={"method": "PUT", "size": 1024}, headers=john_doe.headers_mixin
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["url"] == "http://s3/signed"
+        assert response.json()["headers"] == {"Content-Type": "image/jpeg", "Content-Length": "1024"}
+
+    async def test_not_supported(self, client: AsyncClient, media_storage_mock, session_mock, john_doe):
+        media_storage_mock.generate_presigned_post.side_effect = MediaStorageError("not supported")
+        response = await client.post("/api/files/image/presigned-upload/", json={}, headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_501_NOT_IMPLEMENTED
+        assert response.json()["error_code"] == "files.presigned_upload_unsupported"
+        session_mock.add.assert_not_called()
+
+
+class TestConfirmUpload:
+    file_id = "pubadmin/user-content/test.jpeg"
+
+    async def test_not_issued(self, client: AsyncClient, mocker: MockerFixture, current_user, john_doe):
+        mocker.patch(f"{MediaFilesStoragePath}.get").return_value = None
+        response = await client.post(
+            "/api/files/image/confirm/", json={"file_id": self.file_id}, headers=john_doe.headers_mixin
+        )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    async def test_not_uploaded(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, current_user, john_doe
+    ):
+        mocker.patch(f"{MediaFilesStoragePath}.get").return_value = self.pending_file(current_user)
+        media_storage_mock.head_file.return_value = None
+        response = await self.confirm(client, john_doe)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_invalid_file(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, current_user, john_doe
+    ):
+        mocker.patch(f"{MediaFilesStoragePath}.get").return_value = self.pending_file(current_user)
+        media_storage_mock.head_file.return_value = FileInfo(size=1024, content_type="image/png", etag='"etag"')
+        response = await self.confirm(client, john_doe)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        media_storage_mock.delete_file.assert_awaited_once_with(self.file_id)
+
+    async def test_confirmed(
+        self,
+        client: AsyncClient,
+        mocker: MockerFixture,
+        media_storage_mock,
+        add_content_mock,
+        stored_content,
+        current_user,
+        john_doe,
+    ):
+        mocker.patch(f"{MediaFilesStoragePath}.get").return_value = self.pending_file(current_user)
+        media_storage_mock.head_file.return_value = FileInfo(
+            size=len(stored_content), content_type="image/jpeg", etag='"etag"'
+        )
+        response = await self.confirm(client, john_doe)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["file_id"] == self.file_id
+        add_content_mock.assert_awaited_once_with(
+            key=self.file_id,
+            sha256=sha256(stored_content).hexdigest(),
+            user_id=current_user.id,
+            size=len(stored_content),
+            content_type="image/jpeg",
+        )
+        media_storage_mock.delete_file.assert_not_called()
+
+    async def test_known_content(
+        self,
+        client: AsyncClient,
+        mocker: MockerFixture,
+        media_storage_mock,
+        add_content_mock,
+        stored_content,
+        current_user,
+        john_doe,
+    ):
+        mocker.patch(f"{MediaFilesStoragePath}.get").return_value = self.pending_file(current_user)
+        media_storage_mock.head_file.return_value = FileInfo(
+            size=len(stored_content), content_type="image/jpeg", etag='"etag"'
+        )
+        add_content_mock.side_effect = None
+        add_content_mock.return_value = stored_file(stored_content, ["thumbnail", "training"])
+        response = await self.confirm(client, john_doe)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["file_id"] == "pubadmin/user-content/stored.jpeg"
+        media_storage_mock.delete_file.assert_awaited_once_with(self.file_id)
+
+    def pending_file(self, user: User) -> MediaFile:
+        return MediaFile(key=self.file_id, user_id=user.id, status=MediaFileStatus.PENDING)
+
+    async def confirm(self, client: AsyncClient, john_doe):
+        return await client.post(
+            "/api/files/image/confirm/", json={"file_id": self.file_id}, headers=john_doe.headers_mixin
+        )
+
+
+class TestUploadSessions:
+    file_id = "pubadmin/user-content/test.jpeg"
+    chunk_size = 5 * 1024 * 1024
+    size = chunk_size + 10
+
+    async def test_require_auth(self, client: AsyncClient):
+        response = await client.post("/api/files/image/uploads/", json={"size": self.size})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_create_validation_size(self, client: AsyncClient, john_doe):
+        response = await client.post(
+            "/api/files/image/uploads/", json={"size": 15 * 1024 * 1024}, headers=john_doe.headers_mixin
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_create(self, client: AsyncClient, media_storage_mock, session_mock, current_user, john_doe):
+        media_storage_mock.create_multipart_upload.return_value = "s3-upload-id"
+        response = await client.post(
+            "/api/files/image/uploads/", json={"size": self.size}, headers=john_doe.headers_mixin
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json()["offset"] == 0
+        media_file, upload_session = [call.args[0] for call in session_mock.add.call_args_list]
+        assert media_file.status == MediaFileStatus.PENDING
+        assert upload_session.key == media_file.key == response.json()["file_id"]
+        assert upload_session.s3_upload_id == "s3-upload-id"
+        session_mock.commit.assert_awaited_once()
+
+    async def test_resume(self, client: AsyncClient, mocker: MockerFixture, current_user, john_doe):
+        upload_session = self.upload_session(current_user, offset=self.chunk_size)
+        mocker.patch(f"{UploadSessionsStoragePath}.get").return_value = upload_session
+        response = await client.get(f"/api/files/image/uploads/{upload_session.id}/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["offset"] == self.chunk_size
+
+    async def test_other_user_session(self, client: AsyncClient, mocker: MockerFixture, current_user, john_doe):
+        upload_session = self.upload_session(User(id=current_user.id + 1))
+        mocker.patch(f"{UploadSessionsStoragePath}.get").return_value = upload_session
+        response = await client.get(f"/api/files/image/uploads/{upload_session.id}/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    async def test_upload_chunk(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, current_user, john_doe
+    ):
+        upload_session = self.upload_session(current_user)
+        mocker.patch(f"{UploadSessionsStoragePath}.get").return_value = upload_session
+        advance_mock = mocker.patch(f"{UploadSessionsStoragePath}.advance", return_value=self.chunk_size)
+        media_storage_mock.upload_part.return_value = '"etag-1"'
+        chunk = b"\xff\xd8\xff" + b"x" * (self.chunk_size - 3)
+
+        response = await self.upload_chunk(client, john_doe, upload_session, 0, chunk)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["offset"] == self.chunk_size
+        media_storage_mock.upload_part.assert_awaited_once_with(self.file_id, "s3-upload-id", 1, chunk)
+        advance_mock.assert_awaited_once_with(upload_session.id, 0, self.chunk_size, '"etag-1"')
+
+    async def test_upload_last_chunk(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, current_user, john_doe
+    ):
+        upload_session = self.upload_session(current_user, offset=self.chunk_size)
+        mocker.patch(f"{UploadSessionsStoragePath}.get").return_value = upload_session
+        mocker.patch(f"{UploadSessionsStoragePath}.advance", return_value=self.size)
+
+        response = await self.upload_chunk(client, john_doe, upload_session, self.chunk_size, b"x" * 10)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["offset"] == self.size
+        assert media_storage_mock.upload_part.call_args.args[2] == 2
+
+    async def test_upload_chunk_offset_mismatch(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, current_user, john_doe
+    ):
+        upload_session = self.upload_session(current_user, offset=self.chunk_size)
+        mocker.patch(f"{UploadSessionsStoragePath}.get").return_value = upload_session
+
+        response = await self.upload_chunk(client, john_doe, upload_session, 0, b"x" * self.chunk_size)
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.json()["details"] == {"offset": self.chunk_size}
+        media_storage_mock.upload_part.assert_not_called()
+
+    async def test_upload_chunk_after_last(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, current_user, john_doe
+    ):
+        upload_session = self.upload_session(current_user, offset=self.size)
+        mocker.patch(f"{UploadSessionsStoragePath}.get").return_value = upload_session
+        advance_mock = mocker.patch(f"{UploadSessionsStoragePath}.advance")
+
+        response = await self.upload_chunk(client, john_doe, upload_session, self.size, b"")
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.json()["details"] == {"offset": self.size}
+        media_storage_mock.upload_part.assert_not_called()
+        advance_mock.assert_not_called()
+
+    async def test_upload_chunk_invalid_size(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, current_user, john_doe
+    ):
+        upload_session = self.upload_session(current_user, offset=self.chunk_size)
+        mocker.patch(f"{UploadSessionsStoragePath}.get").return_value = upload_session
+
+        response = await self.upload_chunk(client, john_doe, upload_session, self.chunk_size, b"x" * 11)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        media_storage_mock.upload_part.assert_not_called()
+
+    async def test_upload_chunk_not_jpeg(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, current_user, john_doe
+    ):
+        upload_session = self.upload_session(current_user)
+        mocker.patch(f"{UploadSessionsStoragePath}.get").return_value = upload_session
+
+        response = await self.upload_chunk(client, john_doe, upload_session, 0, b"x" * self.chunk_size)
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        media_storage_mock.upload_part.assert_not_called()
+
+    async def test_concurrent_chunk(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, session_mock, current_user, john_doe
+    ):
+        upload_session = self.upload_session(current_user, offset=self.chunk_size)
+        moved_session = self.upload_session(current_user, offset=self.size)
+        mocker.patch(f"{UploadSessionsStoragePath}.get").side_effect = [upload_session, moved_session]
+        mocker.patch(f"{UploadSessionsStoragePath}.advance", return_value=None)
+
+        response = await self.upload_chunk(client, john_doe, upload_session, self.chunk_size, b"x" * 10)
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.json()["details"] == {"offset": self.size}
+        session_mock.commit.assert_not_called()
+
+    async def test_finalize_incomplete(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, current_user, john_doe
+    ):
+        upload_session = self.upload_session(current_user, offset=self.chunk_size)
+        mocker.patch(f"{UploadSessionsStoragePath}.get").return_value = upload_session
+
+        response = await client.post(
+            f"/api/files/image/uploads/{upload_session.id}/finalize/", headers=john_doe.headers_mixin
+        )
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        media_storage_mock.complete_multipart_upload.assert_not_called()
+
+    async def test_finalize(
+        self,
+        client: AsyncClient,
+        mocker: MockerFixture,
+        media_storage_mock,
+        add_content_mock,
+        stored_content,
+        current_user,
+        john_doe,
+    ):
+        upload_session = self.upload_session(current_user, offset=self.size, part_etags=['"etag-1"', '"etag-2"'])
+        mocker.patch(f"{UploadSessionsStoragePath}.get").return_value = upload_session
+        delete_mock = mocker.patch(f"{UploadSessionsStoragePath}.delete")
+
+        response = await client.post(
+            f"/api/files/image/uploads/{upload_session.id}/finalize/", headers=john_doe.headers_mixin
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["file_id"] == self.file_id
+        media_storage_mock.complete_multipart_upload.assert_awaited_once_with(
+            self.file_id, "s3-upload-id", ['"etag-1"', '"etag-2"']
+        )
+        media_storage_mock.stream_file.assert_called_once_with(self.file_id, 0, self.size - 1)
+        add_content_mock.assert_awaited_once_with(
+            key=self.file_id,
+            sha256=sha256(stored_content).hexdigest(),
+            user_id=current_user.id,
+            size=self.size,
+            content_type="image/jpeg",
+        )
+        delete_mock.assert_awaited_once_with(upload_session)
+
+    async def test_abort(self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, current_user, john_doe):
+        upload_session = self.upload_session(current_user)
+        mocker.patch(f"{UploadSessionsStoragePath}.get").return_value = upload_session
+        delete_mock = mocker.patch(f"{UploadSessionsStoragePath}.delete")
+
+        response = await client.delete(f"/api/files/image/uploads/{upload_session.id}/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        media_storage_mock.discard_multipart_upload.assert_awaited_once_with(self.file_id, "s3-upload-id")
+        delete_mock.assert_awaited_once_with(upload_session, with_media_file=True)
+
+    def upload_session(self, user: User, offset: int = 0, part_etags: list[str] | None = None) -> UploadSession:
+        return UploadSession(
+            id=uuid.uuid4(),
+            user_id=user.id,
+            key=self.file_id,
+            s3_upload_id="s3-upload-id",
+            size=self.size,
+            chunk_size=self.chunk_size,
+            offset=offset,
+            part_etags=part_etags or [],
+            expires_at=datetime.now(timezone.utc) + timedelta(days=1),
+        )
+
+    async def upload_chunk(self, client: AsyncClient, john_doe, upload_session: UploadSession, offset: int, chunk):
+        return await client.put(
+            f"/api/files/image/uploads/{upload_session.id}/",
+            params={"offset": offset},
+            content=chunk,
+            headers=john_doe.headers_mixin,
+        )
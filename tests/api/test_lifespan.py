@@ -0,0 +1,62 @@
+from unittest.mock import AsyncMock, MagicMock, Mock
+
+import pytest
+from pytest_mock import MockerFixture
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from publication_admin.api.lifespan import collect_orphaned_media
+from publication_admin.db.models import MediaFile
+from publication_admin.media_storage.base import MediaStorageError
+from publication_admin.media_storage.s3 import AsyncS3MediaStorage
+
+LifespanPath = "publication_admin.api.lifespan"
+
+
+class TestCollectOrphanedMedia:
+    @pytest.fixture
+    def session_mock(self, mocker: MockerFixture):
+        session_mock = Mock(spec_set=AsyncSession)
+        session_factory = MagicMock()
+        session_factory.return_value.__aenter__.return_value = session_mock
+        mocker.patch(f"{LifespanPath}.AsyncSessionFactory", session_factory)
+        return session_mock
+
+    @pytest.fixture
+    def media_storage_mock(self, mocker: MockerFixture):
+        media_storage_mock = Mock(spec_set=AsyncS3MediaStorage)
+        mocker.patch(f"{LifespanPath}.get_media_storage").return_value = media_storage_mock
+        return media_storage_mock
+
+    async def test_deletes_objects_with_derivatives(self, mocker: MockerFixture, session_mock, media_storage_mock):
+        orphans = [
+            MediaFile(key="pubadmin/user-content/a.jpeg", derivatives=["thumbnail", "training"]),
+            MediaFile(key="pubadmin/user-content/b.jpeg", derivatives=[]),
+        ]
+        delete_orphaned_mock = mocker.patch(f"{LifespanPath}.MediaFilesStorage.delete_orphaned")
+        delete_orphaned_mock.side_effect = [orphans, []]
+
+        await collect_orphaned_media()
+
+        media_storage_mock.delete_files.assert_awaited_once_with(
+            [
+                "pubadmin/user-content/a.jpeg",
+                "pubadmin/user-content/b.jpeg",
+                "pubadmin/user-content/a.thumbnail.jpeg",
+                "pubadmin/user-content/a.training.jpeg",
+            ]
+        )
+        session_mock.commit.assert_awaited_once()
+        assert delete_orphaned_mock.await_count == 2
+
+    async def test_keeps_rows_when_objects_are_not_deleted(
+        self, mocker: MockerFixture, session_mock, media_storage_mock
+    ):
+        mocker.patch(f"{LifespanPath}.MediaFilesStorage.delete_orphaned").return_value = [
+            MediaFile(key="pubadmin/user-content/a.jpeg", derivatives=[])
+        ]
+        media_storage_mock.delete_files = AsyncMock(side_effect=MediaStorageError("boom"))
+
+        with pytest.raises(MediaStorageError):
+            await collect_orphaned_media()
+
+        session_mock.commit.assert_not_called()
@@ -0,0 +1,219 @@
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from pydantic import ValidationError
+from pytest_mock import MockerFixture
+
+from publication_admin.api.images import media_url
+from publication_admin.api.streaming import FileRangeResponse, RangeNotSatisfiableError, parse_range
+from publication_admin.media_storage.base import FileInfo
+from publication_admin.media_storage.cache import MediaCache
+from publication_admin.settings import MediaStorageSettings
+
+CONTENT = bytes(range(256)) * 4
+ETAG = '"0123456789abcdef"'
+
+
+@pytest.fixture
+def media_cache(mocker: MockerFixture, tmp_path) -> MediaCache:
+    media_cache = MediaCache(str(tmp_path), max_size=1024 * 1024)
+    mocker.patch("publication_admin.api.routers.media.get_media_cache", return_value=media_cache)
+    return media_cache
+
+
+@pytest.fixture
+def stored_file(media_storage_mock) -> FileInfo:
+    file_info = FileInfo(size=len(CONTENT), content_type="image/jpeg", etag=ETAG)
+
+    async def download_file(key, file):
+        file.write(CONTENT)
+        return file_info
+
+    async def stream_file(key, start, end):
+        yield CONTENT[start : end + 1]
+
+    media_storage_mock.head_file.return_value = file_info
+    media_storage_mock.download_file.side_effect = download_file
+    media_storage_mock.stream_file.side_effect = stream_file
+    return file_info
+
+
+class TestGetMedia:
+    url = "/api/media/pubadmin/user-content/image.jpeg"
+
+    async def test_whole_file(self, client: AsyncClient, media_cache, stored_file):
+        response = await client.get(self.url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.content == CONTENT
+        assert response.headers["etag"] == ETAG
+        assert response.headers["content-type"] == "image/jpeg"
+        assert response.headers["accept-ranges"] == "bytes"
+        assert "immutable" in response.headers["cache-control"]
+        assert media_cache.get("pubadmin/user-content/image.jpeg") is not None
+
+    async def test_served_from_cache(self, client: AsyncClient, media_storage_mock, media_cache, stored_file):
+        await client.get(self.url)
+        media_storage_mock.head_file.reset_mock()
+
+        response = await client.get(self.url)
+
+        assert response.content == CONTENT
+        media_storage_mock.head_file.assert_not_called()
+        media_storage_mock.download_file.assert_called_once()
+
+    async def test_range(self, client: AsyncClient, media_cache, stored_file):
+        response = await client.get(self.url, headers={"Range": "bytes=100-199"})
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response.content == CONTENT[100:200]
+        assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+        assert response.headers["content-length"] == "100"
+
+    async def test_range_with_stale_if_range(self, client: AsyncClient, media_cache, stored_file):
+        response = await client.get(self.url, headers={"Range": "bytes=100-199", "If-Range": '"stale"'})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.content == CONTENT
+
+    async def test_range_not_satisfiable(self, client: AsyncClient, media_cache, stored_file):
+        response = await client.get(self.url, headers={"Range": f"bytes={len(CONTENT)}-"})
+
+        assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+        assert response.json()["error_code"] == "media.range_not_satisfiable"
+
+    async def test_not_modified(self, client: AsyncClient, media_cache, stored_file):
+        response = await client.get(self.url, headers={"If-None-Match": f'"other", W/{ETAG}'})
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+        assert response.headers["etag"] == ETAG
+
+    async def test_not_found(self, client: AsyncClient, media_storage_mock, media_cache):
+        media_storage_mock.head_file.return_value = None
+
+        response = await client.get(self.url)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.parametrize("key", ["loras/1.safetensors", "results/1.jpeg", "pubadmin/other.jpeg"])
+    async def test_not_media_key(self, client: AsyncClient, media_storage_mock, media_cache, stored_file, key):
+        response = await client.get(f"/api/media/{key}")
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        media_storage_mock.head_file.assert_not_called()
+        media_storage_mock.file_path.assert_not_called()
+
+    async def test_private_bucket(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, media_cache, stored_file
+    ):
+        mocker.patch("publication_admin.api.routers.media.settings.media_storage.media_storage_presigned_urls", True)
+
+        response = await client.get(self.url)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        media_storage_mock.head_file.assert_not_called()
+
+    async def test_large_file_streamed_from_storage(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, media_cache, stored_file
+    ):
+        mocker.patch("publication_admin.api.routers.media.settings.media_storage.media_storage_cache_max_file_size", 10)
+
+        response = await client.get(self.url, headers={"Range": "bytes=-24"})
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response.content == CONTENT[-24:]
+        media_storage_mock.stream_file.assert_called_once_with("pubadmin/user-content/image.jpeg", 1000, 1023)
+        media_storage_mock.download_file.assert_not_called()
+        assert media_cache.size == 0
+
+    async def test_local_storage_file(
+        self, client: AsyncClient, media_storage_mock, media_cache, stored_file, tmp_path
+    ):
+        path = tmp_path / "object"
+        path.write_bytes(CONTENT)
+        media_storage_mock.file_path.return_value = str(path)
+
+        response = await client.get(self.url, headers={"Range": "bytes=0-9"})
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response.content == CONTENT[:10]
+        media_storage_mock.download_file.assert_not_called()
+        assert media_cache.size == 0
+
+
+class TestFileRangeResponse:
+    @staticmethod
+    async def send_response(response: FileRangeResponse) -> list[dict]:
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await response({"type": "http", "method": "GET"}, receive, send)
+        return messages
+
+    async def test_range(self, tmp_path):
+        path = tmp_path / "object"
+        path.write_bytes(CONTENT)
+        response = FileRangeResponse(str(path), offset=10, length=200)
+        response.chunk_size = 100
+
+        messages = await self.send_response(response)
+
+        assert b"".join(message["body"] for message in messages[1:]) == CONTENT[10:210]
+        assert [message["more_body"] for message in messages[1:]] == [True, False]
+
+    async def test_empty_file(self, tmp_path):
+        path = tmp_path / "object"
+        path.write_bytes(b"")
+
+        messages = await self.send_response(FileRangeResponse(str(path), offset=0, length=0))
+
+        assert messages[1:] == [{"type": "http.response.body", "body": b"", "more_body": False}]
+
+
+class TestParseRange:
+    @pytest.mark.parametrize(
+        "header, expected",
+        [
+            ("bytes=0-99", (0, 99)),
+            ("bytes=900-", (900, 999)),
+            ("bytes=900-5000", (900, 999)),
+            ("bytes=-100", (900, 999)),
+            ("bytes=-5000", (0, 999)),
+            ("bytes=0-99,200-299", None),
+            ("items=0-99", None),
+            ("bytes=99-0", None),
+            ("bytes=abc", None),
+            ("bytes=-", None),
+        ],
+    )
+    def test_parse(self, header, expected):
+        assert parse_range(header, 1000) == expected
+
+    @pytest.mark.parametrize("header", ["bytes=1000-", "bytes=-0"])
+    def test_not_satisfiable(self, header):
+        with pytest.raises(RangeNotSatisfiableError):
+            parse_range(header, 1000)
+
+
+def test_private_bucket_is_not_proxied():
+    with pytest.raises(ValidationError, match="presigned URLs"):
+        MediaStorageSettings(media_storage_presigned_urls=True, media_storage_proxy_url="https://media.example.com")
+
+
+def test_media_url_proxies_uploaded_images_only(mocker: MockerFixture):
+    mocker.patch(
+        "publication_admin.api.images.settings.media_storage.media_storage_proxy_url", "https://api.example.com/media/"
+    )
+
+    assert (
+        media_url("pubadmin/user-content/image.jpeg")
+        == "https://api.example.com/media/pubadmin/user-content/image.jpeg"
+    )
+    assert not media_url("results/1.jpeg").startswith("https://api.example.com/media/")
@@ -0,0 +1,72 @@
+from uuid import uuid4
+
+import httpx
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+from pytest_mock import MockerFixture
+
+from publication_admin.services.avatars_ai import MLImages
+from publication_admin.services.avatars_ai.service import ServiceError
+
+
+def sample_value(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestMetrics:
+    async def test_request_latency_by_route(self, client: AsyncClient):
+        labels = {"method": "GET", "route": "/api/meta/ping/", "status": "200"}
+        before = sample_value("http_request_duration_seconds_count", **labels)
+
+        await client.get("/api/meta/ping/")
+        response = await client.get("/api/meta/metrics")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'http_request_duration_seconds_count{method="GET",route="/api/meta/ping/",status="200"}' in response.text
+        assert sample_value("http_request_duration_seconds_count", **labels) == before + 1
+        assert sample_value("http_requests_in_progress", method="GET") == 0
+
+    async def test_route_template(self, client: AsyncClient):
+        labels = {"method": "GET", "route": "/api/posts/{post_uuid}", "status": "401"}
+        before = sample_value("http_request_duration_seconds_count", **labels)
+
+        await client.get(f"/api/posts/{uuid4()}")
+
+        assert sample_value("http_request_duration_seconds_count", **labels) == before + 1
+
+    async def test_unmatched_route(self, client: AsyncClient):
+        labels = {"method": "GET", "route": "unmatched", "status": "404"}
+        before = sample_value("http_request_duration_seconds_count", **labels)
+
+        await client.get("/api/no/such/path")
+
+        assert sample_value("http_request_duration_seconds_count", **labels) == before + 1
+
+
+class TestServiceMetrics:
+    async def test_request_error(self, mocker: MockerFixture):
+        mocker.patch("httpx.AsyncClient.request", side_effect=httpx.ConnectError("refused"))
+        errors_before = sample_value("service_request_errors_total", service="MLImages", reason="request")
+        requests_before = sample_value("service_request_duration_seconds_count", service="MLImages", method="GET")
+
+        with pytest.raises(ServiceError):
+            await MLImages(base_url="http://ml").get_init_persona_task("task")
+
+        assert sample_value("service_request_errors_total", service="MLImages", reason="request") == errors_before + 1
+        assert (
+            sample_value("service_request_duration_seconds_count", service="MLImages", method="GET")
+            == requests_before + 1
+        )
+
+    async def test_error_status(self, mocker: MockerFixture):
+        response = httpx.Response(status.HTTP_502_BAD_GATEWAY, request=httpx.Request("GET", "http://ml/task"))
+        mocker.patch("httpx.AsyncClient.request", return_value=response)
+        before = sample_value("service_request_errors_total", service="MLImages", reason="502")
+
+        with pytest.raises(ServiceError):
+            await MLImages(base_url="http://ml").get_init_persona_task("task")
+
+        assert sample_value("service_request_errors_total", service="MLImages", reason="502") == before + 1
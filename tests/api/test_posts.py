@@ -1,14 +1,23 @@
+import csv
 import datetime
+import gzip
+import io
 import json
 import random
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 from fastapi import status
 from httpx import AsyncClient
 from pytest_mock import MockerFixture
 
-from publication_admin.api.routers.posts import PostResponse
-from publication_admin.db.models import Avatar, Post
+from publication_admin.api.routers.posts import (
+    PostResponse,
+    PostWithThumbnailsResponse,
+    decode_changes_cursor,
+    encode_changes_cursor,
+)
+from publication_admin.db.models import Avatar, Post, PostTombstone
+from publication_admin.settings import settings
 
 PostStoragePath = "publication_admin.api.routers.posts.PostStorage"
 AvatarsStoragePath = "publication_admin.api.routers.posts.AvatarsStorage"
@@ -20,6 +29,7 @@ class TestGetPosts:
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
     async def test_get_posts(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        mocker.patch(f"{PostStoragePath}.get_version").return_value = (0, None, None)
         avatar_id = random.randint(1, 20)
         mocked_posts = [
             Post(
@@ -51,9 +61,159 @@ class TestGetPosts:
         response = await client.get("/api/posts/", headers=john_doe.headers_mixin)
         assert response.status_code == status.HTTP_200_OK
         assert response.json() == [
-            json.loads(PostResponse.model_validate(post).model_dump_json()) for post in mocked_posts
+            json.loads(PostWithThumbnailsResponse.model_validate(post).model_dump_json()) for post in mocked_posts
         ]
 
+    async def test_get_posts_thumbnails(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        mocker.patch(f"{PostStoragePath}.get_version").return_value = (0, None, None)
+        image, pending_image = "pubadmin/user-content/image.jpeg", "pubadmin/user-content/pending.jpeg"
+        mocked_posts = [
+            Post(uuid=uuid4(), avatar_id=1, post_text="", images=[image, "link"], created_at=datetime.datetime.now()),
+            Post(uuid=uuid4(), avatar_id=1, post_text="", images=[pending_image], created_at=datetime.datetime.now()),
+        ]
+        mocker.patch(f"{PostStoragePath}.get_posts_by_avatar").return_value = mocked_posts
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=1
+        )
+        get_keys_mock = mocker.patch("publication_admin.api.images.MediaFilesStorage.get_keys_with_derivative")
+        get_keys_mock.return_value = {image}
+
+        response = await client.get("/api/posts/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [post["thumbnails"] for post in response.json()] == [
+            {image: "pubadmin/user-content/image.thumbnail.jpeg"},
+            {},
+        ]
+        get_keys_mock.assert_awaited_once_with([image, pending_image], "thumbnail")
+
+    async def test_presigned_thumbnail_urls(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        mocker.patch("publication_admin.api.images.settings.media_storage.media_storage_presigned_urls", True)
+        get_presigned_urls_mock = mocker.patch("publication_admin.api.images.get_presigned_urls")
+        get_presigned_urls_mock.return_value.get.side_effect = lambda key: f"https://s3/{key}?signature"
+        mocker.patch(f"{PostStoragePath}.get_version").return_value = (0, None, None)
+        image = "pubadmin/user-content/image.jpeg"
+        mocker.patch(f"{PostStoragePath}.get_posts_by_avatar").return_value = [
+            Post(uuid=uuid4(), avatar_id=1, post_text="", images=[image], created_at=datetime.datetime.now())
+        ]
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=1
+        )
+        mocker.patch("publication_admin.api.images.MediaFilesStorage.get_keys_with_derivative").return_value = {image}
+
+        response = await client.get("/api/posts/", headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        [post] = response.json()
+        assert post["image_urls"] == [f"https://s3/{image}?signature"]
+        assert post["thumbnail_urls"] == {image: "https://s3/pubadmin/user-content/image.thumbnail.jpeg?signature"}
+
+    async def test_not_modified(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        avatar_id = random.randint(1, 20)
+        updated_at = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        get_version_mock = mocker.patch(f"{PostStoragePath}.get_version")
+        get_version_mock.return_value = (1, updated_at, None)
+        get_posts_mock = mocker.patch(f"{PostStoragePath}.get_posts_by_avatar")
+        get_posts_mock.return_value = [
+            Post(uuid=uuid4(), avatar_id=avatar_id, post_text="text", images=[], created_at=updated_at)
+        ]
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=avatar_id
+        )
+        response = await client.get("/api/posts/", headers=john_doe.headers_mixin)
+        etag = response.headers["etag"]
+        assert response.headers["cache-control"] == "private, no-cache"
+
+        response = await client.get("/api/posts/", headers={**john_doe.headers_mixin, "if-none-match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["etag"] == etag
+        get_posts_mock.assert_awaited_once()
+        get_version_mock.assert_awaited_with(avatar_id)
+
+        # A post was deleted
+        get_version_mock.return_value = (0, updated_at, updated_at + datetime.timedelta(minutes=1))
+        response = await client.get("/api/posts/", headers={**john_doe.headers_mixin, "if-none-match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["etag"] != etag
+
+
+class TestGetPostsChanges:
+    async def test_auth_required(self, client: AsyncClient):
+        response = await client.get("/api/posts/changes")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_changes_since_cursor(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        avatar_id = random.randint(1, 20)
+        since = 1000
+        horizon = 1010
+        post = make_post(avatar_id, xact_id=since + 1)
+        tombstone = PostTombstone(uuid=uuid4(), avatar_id=avatar_id, xact_id=since + 2)
+        mocker.patch(f"{PostStoragePath}.get_sync_horizon").return_value = horizon
+        get_changed_posts_mock = mocker.patch(f"{PostStoragePath}.get_changed_posts")
+        get_changed_posts_mock.return_value = [post]
+        mocker.patch(f"{PostStoragePath}.get_tombstones").return_value = [tombstone]
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=avatar_id
+        )
+
+        response = await client.get(
+            "/api/posts/changes",
+            params={"cursor": encode_changes_cursor(since, UUID(int=0)), "limit": 10},
+            headers=john_doe.headers_mixin,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        get_changed_posts_mock.assert_awaited_once_with(
+            avatar_id=avatar_id, until=horizon, after=(since, UUID(int=0)), limit=11
+        )
+        assert [upsert["uuid"] for upsert in response.json()["upserts"]] == [str(post.uuid)]
+        assert response.json()["deletions"] == [str(tombstone.uuid)]
+        assert response.json()["has_more"] is False
+        # Nothing before the horizon is left, the next call starts from it
+        assert decode_changes_cursor(response.json()["cursor"]) == (horizon, UUID(int=0))
+
+    async def test_pagination(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        avatar_id = random.randint(1, 20)
+        # Posts created in one transaction share its ID, the page may end between them
+        posts = [make_post(avatar_id, xact_id=1000, post_uuid=UUID(int=i)) for i in range(1, 4)]
+        mocker.patch(f"{PostStoragePath}.get_sync_horizon").return_value = 1010
+        mocker.patch(f"{PostStoragePath}.get_changed_posts").return_value = posts
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=avatar_id
+        )
+
+        response = await client.get("/api/posts/changes", params={"limit": 2}, headers=john_doe.headers_mixin)
+        assert response.status_code == status.HTTP_200_OK
+        assert [upsert["uuid"] for upsert in response.json()["upserts"]] == [str(UUID(int=1)), str(UUID(int=2))]
+        assert response.json()["has_more"] is True
+        assert decode_changes_cursor(response.json()["cursor"]) == (1000, UUID(int=2))
+
+    async def test_full_sync(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        horizon = 1000
+        mocker.patch(f"{PostStoragePath}.get_sync_horizon").return_value = horizon
+        mocker.patch(f"{PostStoragePath}.get_changed_posts").return_value = []
+        get_tombstones_mock = mocker.patch(f"{PostStoragePath}.get_tombstones")
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=random.randint(1, 20)
+        )
+
+        response = await client.get("/api/posts/changes", headers=john_doe.headers_mixin)
+        assert response.status_code == status.HTTP_200_OK
+        get_tombstones_mock.assert_not_called()
+        assert response.json() == {
+            "upserts": [],
+            "deletions": [],
+            "cursor": encode_changes_cursor(horizon, UUID(int=0)),
+            "has_more": False,
+        }
+
+    async def test_invalid_cursor(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=random.randint(1, 20)
+        )
+
+        response = await client.get("/api/posts/changes", params={"cursor": "garbage"}, headers=john_doe.headers_mixin)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
 
 class TestGetPostById:
     async def test_auth_required(self, client: AsyncClient):
@@ -114,6 +274,20 @@ class TestCreatePost:
         assert response.status_code == status.HTTP_200_OK
         assert response.json() == json.loads(PostResponse.model_validate(new_post).model_dump_json())
 
+    async def test_unconfirmed_images(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        image = "pubadmin/user-content/pending.jpeg"
+        mocker.patch("publication_admin.api.images.MediaFilesStorage.get_pending_keys").return_value = [image]
+        create_mock = mocker.patch(f"{PostStoragePath}.create")
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=random.randint(1, 20)
+        )
+        response = await client.post(
+            "/api/posts/", headers=john_doe.headers_mixin, json={"post_text": "New post", "images": [image]}
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["details"] == [image]
+        create_mock.assert_not_called()
+
 
 class TestDeletePost:
     async def test_auth_required(self, client: AsyncClient):
@@ -143,8 +317,205 @@ class TestDeletePost:
         assert response.json().get("deleted_post_uuid") == str(post_uuid)
 
 
+class TestExportPosts:
+    async def test_auth_required(self, client: AsyncClient):
+        response = await client.get("/api/posts/export")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_export_ndjson(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        posts = mock_exported_posts(mocker, john_doe)
+        response = await client.get("/api/posts/export", headers=john_doe.headers_mixin)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(line) for line in response.text.splitlines()] == [
+            json.loads(PostResponse.model_validate(post).model_dump_json()) for post in posts
+        ]
+
+    async def test_export_csv(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        posts = mock_exported_posts(mocker, john_doe)
+        response = await client.get("/api/posts/export", params={"format": "csv"}, headers=john_doe.headers_mixin)
+        assert response.status_code == status.HTTP_200_OK
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row["uuid"] for row in rows] == [str(post.uuid) for post in posts]
+        assert json.loads(rows[0]["images"]) == posts[0].images
+
+    async def test_export_gzip(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        posts = mock_exported_posts(mocker, john_doe)
+        response = await client.get("/api/posts/export", params={"gzip": True}, headers=john_doe.headers_mixin)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-disposition"] == 'attachment; filename="posts.ndjson.gz"'
+        lines = gzip.decompress(response.content).decode().splitlines()
+        assert [json.loads(line)["uuid"] for line in lines] == [str(post.uuid) for post in posts]
+
+
+class TestImportPosts:
+    async def test_auth_required(self, client: AsyncClient):
+        response = await client.post("/api/posts/import", content=b"{}")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_import(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        avatar_id = random.randint(1, 20)
+        copy_posts_mock = mocker.patch(f"{PostStoragePath}.copy_posts")
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=avatar_id
+        )
+        content = b'{"post_text": "first", "images": ["a.jpeg"]}\n{"images": "not a list"}\n{"post_text": "third"}\n'
+        response = await client.post("/api/posts/import", content=content, headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["imported"] == 2
+        assert response.json()["rejected"] == 1
+        assert response.json()["rejects"][0]["line"] == 2
+        records = copy_posts_mock.call_args.args[0]
+        assert [(record[1], record[2], record[3]) for record in records] == [
+            (avatar_id, "first", ["a.jpeg"]),
+            (avatar_id, "third", []),
+        ]
+
+    async def test_import_invalid_images(
+        self, client: AsyncClient, mocker: MockerFixture, media_storage_mock, john_doe
+    ):
+        copy_posts_mock = mocker.patch(f"{PostStoragePath}.copy_posts")
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=1
+        )
+        pending, missing = "pubadmin/user-content/pending.jpeg", "pubadmin/user-content/missing.jpeg"
+        mocker.patch("publication_admin.api.images.MediaFilesStorage.get_pending_keys").return_value = [pending]
+        media_storage_mock.head_file.return_value = None
+        content = f'{{"images": ["{pending}"]}}\n{{"images": ["{missing}"]}}\n{{"images": ["link"]}}\n'.encode()
+
+        response = await client.post("/api/posts/import", content=content, headers=john_doe.headers_mixin)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["imported"] == 1
+        assert response.json()["rejects"] == [
+            {"line": 1, "error": "images.0: Image is not confirmed yet"},
+            {"line": 2, "error": "images.0: File not found"},
+        ]
+        assert [record[3] for record in copy_posts_mock.call_args.args[0]] == [["link"]]
+        media_storage_mock.head_file.assert_awaited_once_with(missing)
+
+
+class TestCreatePostsBatch:
+    payload = {"posts": [{"post_text": "first", "images": ["image1.jpg"]}, {"post_text": "second", "images": []}]}
+
+    async def test_auth_required(self, client: AsyncClient):
+        response = await client.post("/api/posts/batch", json=self.payload)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_empty_batch(self, client: AsyncClient, john_doe):
+        response = await client.post("/api/posts/batch", json={"posts": []}, headers=john_doe.headers_mixin)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_batch_size_limit(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        create_many_mock = mocker.patch(f"{PostStoragePath}.create_many")
+        posts = [{"post_text": "post", "images": []}] * (settings.posts_batch_size_limit + 1)
+        response = await client.post("/api/posts/batch", json={"posts": posts}, headers=john_doe.headers_mixin)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        create_many_mock.assert_not_called()
+
+    async def test_create_posts(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        avatar_id = random.randint(1, 20)
+        new_posts = [
+            Post(
+                uuid=uuid4(),
+                avatar_id=avatar_id,
+                post_text=post["post_text"],
+                images=post["images"],
+                created_at=datetime.datetime.now(),
+            )
+            for post in self.payload["posts"]
+        ]
+        create_many_mock = mocker.patch(f"{PostStoragePath}.create_many")
+        create_many_mock.return_value = new_posts
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=avatar_id
+        )
+        response = await client.post("/api/posts/batch", headers=john_doe.headers_mixin, json=self.payload)
+        assert response.status_code == status.HTTP_200_OK
+        create_many_mock.assert_awaited_once_with(
+            avatar_id=avatar_id, posts=[("first", ["image1.jpg"]), ("second", [])]
+        )
+        assert response.json()["posts"] == [
+            json.loads(PostResponse.model_validate(post).model_dump_json()) for post in new_posts
+        ]
+
+
+class TestDeletePostsBatch:
+    async def test_auth_required(self, client: AsyncClient):
+        response = await client.post("/api/posts/batch/delete", json={"post_uuids": [str(uuid4())]})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_empty_batch(self, client: AsyncClient, john_doe):
+        response = await client.post("/api/posts/batch/delete", json={"post_uuids": []}, headers=john_doe.headers_mixin)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_batch_size_limit(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        delete_many_mock = mocker.patch(f"{PostStoragePath}.delete_many")
+        post_uuids = [str(uuid4()) for _ in range(settings.posts_batch_size_limit + 1)]
+        response = await client.post(
+            "/api/posts/batch/delete", json={"post_uuids": post_uuids}, headers=john_doe.headers_mixin
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        delete_many_mock.assert_not_called()
+
+    async def test_delete_posts(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        deleted_uuid, missing_uuid = uuid4(), uuid4()
+        mocker.patch(f"{PostStoragePath}.delete_many").return_value = {deleted_uuid}
+        mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+            user_id=john_doe.user_id, avatar_id=random.randint(1, 20)
+        )
+        response = await client.post(
+            "/api/posts/batch/delete",
+            json={"post_uuids": [str(deleted_uuid), str(missing_uuid)]},
+            headers=john_doe.headers_mixin,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["results"] == [
+            {"post_uuid": str(deleted_uuid), "deleted": True},
+            {"post_uuid": str(missing_uuid), "deleted": False},
+        ]
+
+
 def get_fake_avatar(user_id, avatar_id):
     return Avatar(
         id=avatar_id,
         user_id=user_id,
     )
+
+
+def make_post(avatar_id: int, xact_id: int, post_uuid: UUID | None = None) -> Post:
+    created_at = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    return Post(
+        uuid=post_uuid or uuid4(),
+        avatar_id=avatar_id,
+        post_text="",
+        images=[],
+        created_at=created_at,
+        updated_at=created_at,
+        xact_id=xact_id,
+    )
+
+
+def mock_exported_posts(mocker: MockerFixture, john_doe) -> list[Post]:
+    avatar_id = random.randint(1, 20)
+    posts = [
+        Post(
+            uuid=uuid4(),
+            avatar_id=avatar_id,
+            post_text=f"text{i}",
+            images=[f"link{i}"],
+            created_at=datetime.datetime.now(),
+        )
+        for i in range(3)
+    ]
+
+    async def stream_posts(*args, **kwargs):
+        for post in posts:
+            yield post
+
+    mocker.patch(f"{PostStoragePath}.stream_posts_by_avatar", stream_posts)
+    mocker.patch(f"{AvatarsStoragePath}.get_by_user_id").return_value = get_fake_avatar(
+        user_id=john_doe.user_id, avatar_id=avatar_id
+    )
+    return posts
@@ -0,0 +1,109 @@
+import json
+from datetime import datetime, timezone
+from uuid import UUID
+
+import fastapi.routing
+from fastapi import APIRouter, BackgroundTasks, FastAPI, status
+from httpx import AsyncClient
+from pydantic import BaseModel, computed_field
+from pytest_mock import MockerFixture
+
+from publication_admin.api.responses import PydanticJSONResponse, PydanticJSONRoute
+
+
+class Item(BaseModel):
+    id: UUID
+    created_at: datetime
+
+    @computed_field
+    def label(self) -> str:
+        return f"item {self.id}"
+
+
+ITEM = Item(id=UUID(int=1), created_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+ITEM_JSON = {
+    "id": "00000000-0000-0000-0000-000000000001",
+    "created_at": "2024-01-01T00:00:00Z",
+    "label": "item 00000000-0000-0000-0000-000000000001",
+}
+
+
+class TestPydanticJSONResponse:
+    def test_model(self):
+        response = PydanticJSONResponse(ITEM)
+
+        assert json.loads(response.body) == ITEM_JSON
+        assert response.headers["content-type"] == "application/json"
+
+    def test_list_of_models(self):
+        assert json.loads(PydanticJSONResponse([ITEM, ITEM]).body) == [ITEM_JSON, ITEM_JSON]
+
+    def test_plain_content(self):
+        response = PydanticJSONResponse({"ok": True, 1: [], "when": datetime(2024, 1, 1)}, status_code=201)
+
+        assert json.loads(response.body) == {"ok": True, "1": [], "when": "2024-01-01T00:00:00"}
+        assert response.status_code == 201
+
+    def test_empty_list(self):
+        assert PydanticJSONResponse([]).body == b"[]"
+
+
+class TestPydanticJSONRoute:
+    @staticmethod
+    def make_app(router: APIRouter) -> FastAPI:
+        app = FastAPI(default_response_class=PydanticJSONResponse)
+        api_router = APIRouter(prefix="/api")
+        api_router.include_router(router)
+        app.include_router(api_router)
+        return app
+
+    async def test_returned_model(self, mocker: MockerFixture):
+        serialize_response = mocker.spy(fastapi.routing, "serialize_response")
+        tasks = []
+        router = APIRouter(route_class=PydanticJSONRoute)
+
+        @router.post("/items/", status_code=status.HTTP_201_CREATED)
+        async def create_item(background_tasks: BackgroundTasks) -> Item:
+            background_tasks.add_task(tasks.append, "done")
+            return ITEM
+
+        async with AsyncClient(app=self.make_app(router), base_url="http://test") as client:
+            response = await client.post("/api/items/")
+
+        assert response.status_code == 201
+        assert response.content == PydanticJSONResponse(ITEM).body
+        assert tasks == ["done"]
+        # Not validated and converted by FastAPI before rendering
+        serialize_response.assert_not_called()
+
+    async def test_other_content(self):
+        router = APIRouter(route_class=PydanticJSONRoute)
+
+        @router.get("/ping/")
+        async def ping() -> str:
+            return "ok"
+
+        @router.get("/items/")
+        async def get_items() -> list[Item]:
+            return [ITEM]
+
+        async with AsyncClient(app=self.make_app(router), base_url="http://test") as client:
+            assert (await client.get("/api/ping/")).json() == "ok"
+            assert (await client.get("/api/items/")).json() == [ITEM_JSON]
+
+    def test_schema(self):
+        router = APIRouter(route_class=PydanticJSONRoute)
+
+        @router.post("/items/")
+        async def create_item(name: str) -> Item:
+            return ITEM
+
+        app = self.make_app(router)
+        operation = app.openapi()["paths"]["/api/items/"]["post"]
+
+        assert operation["parameters"][0]["name"] == "name"
+        assert operation["responses"]["200"]["content"]["application/json"]["schema"] == {
+            "$ref": "#/components/schemas/Item"
+        }
+        # Copies made by include_router wrap the original endpoint once
+        assert all(route.endpoint is create_item for route in (router.routes[0], app.routes[-1]))
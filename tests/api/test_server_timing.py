@@ -0,0 +1,58 @@
+import re
+from unittest.mock import AsyncMock
+
+from httpx import AsyncClient
+from pytest_mock import MockerFixture
+
+from publication_admin.db.models import User
+from publication_admin.timing import ServerTiming, collect_server_timing, current_server_timing, timed
+
+SETTINGS_PATH = "publication_admin.api.metrics.settings"
+
+
+class TestServerTimingMiddleware:
+    async def test_disabled(self, client: AsyncClient):
+        response = await client.get("/api/meta/ping/")
+
+        assert "server-timing" not in response.headers
+
+    async def test_enabled(self, client: AsyncClient, mocker: MockerFixture, session_mock, john_doe):
+        mocker.patch(f"{SETTINGS_PATH}.server_timing", True)
+        session_mock.get = AsyncMock(return_value=User(email=john_doe.email, id=john_doe.user_id))
+
+        response = await client.get("/api/users/me/", headers=john_doe.headers_mixin)
+
+        assert re.fullmatch(r"auth;dur=[\d.]+, total;dur=[\d.]+", response.headers["server-timing"])
+
+    async def test_privileged_users(self, client: AsyncClient, mocker: MockerFixture, session_mock, john_doe):
+        mocker.patch(f"{SETTINGS_PATH}.server_timing_user_ids", [john_doe.user_id])
+        session_mock.get = AsyncMock(return_value=User(email=john_doe.email, id=john_doe.user_id))
+
+        response = await client.get("/api/users/me/", headers=john_doe.headers_mixin)
+        assert "auth;dur=" in response.headers["server-timing"]
+
+        response = await client.get("/api/meta/ping/")
+        assert "server-timing" not in response.headers
+
+
+class TestServerTiming:
+    def test_header(self):
+        server_timing = ServerTiming()
+        server_timing.add("db", 0.002)
+        server_timing.add("db", 0.0015)
+        server_timing.add("s3", 0.1)
+
+        assert re.fullmatch(r'db;dur=3\.5;desc="2 calls", s3;dur=100\.0, total;dur=[\d.]+', server_timing.header())
+
+    def test_timed(self):
+        with collect_server_timing() as server_timing, timed("s3"):
+            pass
+
+        assert list(server_timing.durations) == ["s3"]
+        assert current_server_timing() is None
+
+    def test_timed_outside_of_request(self):
+        with timed("s3"):
+            pass
+
+        assert current_server_timing() is None
@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+
 from fastapi import status
 from httpx import AsyncClient
 from pytest_mock import MockerFixture
@@ -13,6 +15,7 @@ class TestGetAll:
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
     async def test_all(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        mocker.patch(f"{TopicsStoragePath}.get_version").return_value = (3, datetime(2024, 1, 1, tzinfo=timezone.utc))
         mocker.patch(f"{TopicsStoragePath}.all").return_value = [
             Topic(name="pet"),
             Topic(name="food"),
@@ -21,3 +24,22 @@ class TestGetAll:
         response = await client.get("/api/topics/", headers=john_doe.headers_mixin)
         assert response.status_code == status.HTTP_200_OK
         assert response.json() == [{"name": "pet"}, {"name": "food"}, {"name": "alco"}]
+
+    async def test_not_modified(self, client: AsyncClient, mocker: MockerFixture, john_doe):
+        get_version_mock = mocker.patch(f"{TopicsStoragePath}.get_version")
+        get_version_mock.return_value = (1, datetime(2024, 1, 1, tzinfo=timezone.utc))
+        all_mock = mocker.patch(f"{TopicsStoragePath}.all")
+        all_mock.return_value = [Topic(name="pet")]
+        response = await client.get("/api/topics/", headers=john_doe.headers_mixin)
+        etag = response.headers["etag"]
+
+        response = await client.get("/api/topics/", headers={**john_doe.headers_mixin, "if-none-match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+        all_mock.assert_awaited_once()
+
+        get_version_mock.return_value = (2, datetime(2024, 1, 2, tzinfo=timezone.utc))
+        response = await client.get("/api/topics/", headers={**john_doe.headers_mixin, "if-none-match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["etag"] != etag
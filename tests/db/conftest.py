@@ -0,0 +1,33 @@
+import socket
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from publication_admin.settings import settings
+
+
+@pytest.fixture(scope="session")
+def migrated_database():
+    """Database of the test settings migrated to the head, tests using it are skipped when it is unreachable"""
+    try:
+        socket.create_connection((settings.database.postgres_host, settings.database.postgres_port), timeout=1).close()
+    except OSError:
+        pytest.skip("Test database is unreachable")
+    command.upgrade(Config("alembic.ini"), "head")
+
+
+@pytest.fixture
+async def db_session(migrated_database):
+    """Session on a real database, everything done in the test, including commits, is rolled back"""
+    engine = create_async_engine(settings.database.db_connection, poolclass=NullPool)
+    async with engine.connect() as connection:
+        transaction = await connection.begin()
+        async with AsyncSession(
+            bind=connection, expire_on_commit=False, join_transaction_mode="create_savepoint"
+        ) as session:
+            yield session
+        await transaction.rollback()
+    await engine.dispose()
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from publication_admin.db.models import MediaFile, MediaFileStatus
+from publication_admin.db.storages import MediaFilesStorage
+
+
+async def test_deduplicated_file_is_not_collected(db_session: AsyncSession):
+    month_ago = datetime.now(timezone.utc) - timedelta(days=30)
+    await db_session.execute(
+        insert(MediaFile),
+        [
+            {
+                "key": f"pubadmin/user-content/{sha256}.jpeg",
+                "sha256": sha256,
+                "status": MediaFileStatus.CONFIRMED,
+                "created_at": month_ago,
+                "last_used_at": month_ago,
+            }
+            for sha256 in ["uploaded-again", "forgotten"]
+        ],
+    )
+    storage = MediaFilesStorage(db_session)
+
+    used = await storage.use_by_sha256(["uploaded-again"])
+    assert [media_file.key for media_file in used.values()] == ["pubadmin/user-content/uploaded-again.jpeg"]
+    orphans = await storage.delete_orphaned(older_than=datetime.now(timezone.utc) - timedelta(days=7))
+
+    assert [media_file.key for media_file in orphans] == ["pubadmin/user-content/forgotten.jpeg"]
+
+
+async def test_add_content(db_session: AsyncSession):
+    storage = MediaFilesStorage(db_session)
+    storage.add(key="pubadmin/user-content/pending.jpeg", user_id=None, status=MediaFileStatus.PENDING)
+    await db_session.flush()
+
+    media_file = await storage.add_content(key="pubadmin/user-content/pending.jpeg", sha256="content", user_id=None)
+    assert (media_file.key, media_file.status) == ("pubadmin/user-content/pending.jpeg", MediaFileStatus.CONFIRMED)
+
+    # The same content uploaded under another key resolves to the file stored first
+    same_content = await storage.add_content(key="pubadmin/user-content/other.jpeg", sha256="content", user_id=None)
+    assert same_content.key == "pubadmin/user-content/pending.jpeg"
+    assert await storage.get("pubadmin/user-content/other.jpeg") is None
@@ -0,0 +1,50 @@
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from publication_admin.db.models import CURRENT_XACT_ID
+from publication_admin.db.storages import AvatarsStorage, PostStorage
+from publication_admin.settings import settings
+
+
+async def test_sync_horizon_waits_for_writing_transactions(migrated_database):
+    engine = create_async_engine(settings.database.db_connection, poolclass=NullPool)
+    async with engine.connect() as writer, engine.connect() as idle_reader:
+        # Read-only transactions left open, like the ones streaming exports, don't hold the horizon back
+        await idle_reader.execute(text("SELECT 1"))
+        writer_xact_id = await writer.scalar(text(f"SELECT {CURRENT_XACT_ID}"))
+
+        async with AsyncSession(engine) as reader:
+            assert await PostStorage(reader).get_sync_horizon() == writer_xact_id
+
+        await writer.rollback()
+        async with AsyncSession(engine) as reader:
+            assert await PostStorage(reader).get_sync_horizon() > writer_xact_id
+    await engine.dispose()
+
+
+async def test_changed_posts_pages_within_same_transaction(db_session: AsyncSession):
+    avatar = await AvatarsStorage(db_session).create(name="test", images=[], topics=[])
+    storage = PostStorage(db_session)
+    # Created in one transaction, so all the posts are stamped with the same ID
+    posts = sorted(await storage.create_many(avatar.id, [("1", []), ("2", []), ("3", [])]), key=lambda p: p.uuid)
+    until = await db_session.scalar(text(f"SELECT {CURRENT_XACT_ID}")) + 1
+
+    first_page = await storage.get_changed_posts(avatar.id, until=until, limit=2)
+    last = first_page[-1]
+    second_page = await storage.get_changed_posts(avatar.id, until=until, after=(last.xact_id, last.uuid))
+
+    assert [post.uuid for post in first_page + second_page] == [post.uuid for post in posts]
+
+
+async def test_deleted_post_tombstone(db_session: AsyncSession):
+    avatar = await AvatarsStorage(db_session).create(name="test", images=[], topics=[])
+    storage = PostStorage(db_session)
+    [post] = await storage.create_many(avatar.id, [("1", [])])
+    await storage.delete_posts(avatar.id, post.uuid)
+    until = await db_session.scalar(text(f"SELECT {CURRENT_XACT_ID}")) + 1
+
+    [tombstone] = await storage.get_tombstones(avatar.id, until=until, after=(0, UUID(int=0)))
+    assert tombstone.uuid == post.uuid
@@ -0,0 +1,80 @@
+import io
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from publication_admin.cli.import_posts import import_posts
+from publication_admin.db.posts_import import PostsImporter
+
+
+async def as_chunks(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+def make_importer(image_errors: dict[str, str] | None = None, **kwargs) -> tuple[PostsImporter, AsyncMock]:
+    check_images = AsyncMock(return_value=image_errors or {})
+    importer = PostsImporter(Mock(spec_set=AsyncSession), avatar_id=1, check_images=check_images, **kwargs)
+    copy_posts_mock = AsyncMock()
+    importer.storage.copy_posts = copy_posts_mock
+    return importer, copy_posts_mock
+
+
+class TestPostsImporter:
+    async def test_lines_split_between_chunks(self):
+        importer, copy_posts_mock = make_importer()
+        result = await importer.run(as_chunks(b'{"post_text": "fi', b'rst"}\n{"post_t', b'ext": "second"}'))
+
+        assert result.imported == 2
+        assert result.rejected == 0
+        assert [record[2] for record in copy_posts_mock.call_args.args[0]] == ["first", "second"]
+
+    async def test_flush_in_chunks(self):
+        progress = []
+        importer, copy_posts_mock = make_importer(chunk_size=2, on_progress=lambda r: progress.append(r.imported))
+        result = await importer.run(as_chunks(b'{"post_text": "1"}\n' * 5))
+
+        assert result.imported == 5
+        assert copy_posts_mock.await_count == 3
+        assert progress == [2, 4, 5]
+
+    async def test_rejects(self):
+        importer, copy_posts_mock = make_importer(max_line_size=32, max_reported_rejects=1)
+        content = b'not json\n{"post_text": "' + b"x" * 64 + b'"}\n\n{"post_text": "ok"}\n'
+        result = await importer.run(as_chunks(content[:20], content[20:]))
+
+        assert result.imported == 1
+        assert result.rejected == 2
+        assert [reject.line for reject in result.rejects] == [1]
+
+    async def test_invalid_images(self):
+        importer, copy_posts_mock = make_importer(
+            image_errors={"pending.jpeg": "Image is not confirmed yet"}, max_line_size=64
+        )
+        content = (
+            b'{"post_text": "1", "images": ["ok.jpeg", "pending.jpeg"]}\n'
+            b"not json\n"
+            b'{"post_text": "3", "images": ["ok.jpeg"]}\n'
+        )
+        result = await importer.run(as_chunks(content))
+
+        assert result.imported == 1
+        # Reported in the order of lines, though the invalid images are found when the chunk is flushed
+        assert [reject.line for reject in result.rejects] == [1, 2]
+        assert result.rejects[0].error == "images.1: Image is not confirmed yet"
+        assert [record[2] for record in copy_posts_mock.call_args.args[0]] == ["3"]
+        importer.check_images.assert_awaited_once_with(["ok.jpeg", "pending.jpeg", "ok.jpeg"])
+
+    async def test_all_lines_rejected(self):
+        importer, copy_posts_mock = make_importer(image_errors={"missing.jpeg": "File not found"})
+        result = await importer.run(as_chunks(b'{"images": ["missing.jpeg"]}\n'))
+
+        assert result.imported == 0
+        assert result.rejected == 1
+        copy_posts_mock.assert_not_called()
+
+
+async def test_cli_unknown_avatar(migrated_database):
+    with pytest.raises(SystemExit):
+        await import_posts(avatar_id=2**31 - 1, file=io.BytesIO(b'{"post_text": "1"}\n'))
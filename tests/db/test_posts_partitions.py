@@ -0,0 +1,22 @@
+from datetime import date, datetime, timezone
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from publication_admin.db.models import Post
+
+
+async def create_partitions(session: AsyncSession, from_month: date, months: int) -> int:
+    return (await session.execute(select(func.posts_create_partitions(from_month, months)))).scalar()
+
+
+async def test_partition_takes_rows_from_default(db_session: AsyncSession):
+    created_at = datetime(2099, 1, 15, tzinfo=timezone.utc)
+    await db_session.execute(insert(Post).values(post_text="from the future", created_at=created_at))
+    post_partition = select(text("tableoid::regclass::text")).select_from(Post).where(Post.created_at == created_at)
+    assert (await db_session.execute(post_partition)).scalar() == "posts_default"
+
+    assert await create_partitions(db_session, date(2099, 1, 1), 2) == 2
+
+    assert (await db_session.execute(post_partition)).scalar() == "posts_2099_01"
+    assert await create_partitions(db_session, date(2099, 1, 1), 2) == 0
@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from publication_admin.db.utils import uuid7, uuid7_datetime
+
+
+def test_uuid7():
+    moment = datetime(2024, 2, 29, 12, 30, 15, 123000, tzinfo=timezone.utc)
+    value = uuid7(moment)
+
+    assert value.version == 7
+    assert uuid7_datetime(value) == moment
+    assert uuid7(moment) != value
+
+
+def test_uuid7_ordered_by_time():
+    earlier = uuid7(datetime(2024, 1, 1, tzinfo=timezone.utc))
+    later = uuid7(datetime(2024, 1, 1, 0, 0, 0, 1000, tzinfo=timezone.utc))
+    assert earlier < later
+
+
+def test_uuid7_datetime_of_random_uuid():
+    assert uuid7_datetime(uuid4()) is None
@@ -0,0 +1,83 @@
+import asyncio
+import os
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+
+from publication_admin.media_storage.base import FileInfo
+from publication_admin.media_storage.cache import MediaCache
+from publication_admin.media_storage.s3 import AsyncS3MediaStorage
+
+
+@pytest.fixture
+def media_storage():
+    objects = {"a.jpeg": b"a" * 10, "b.jpeg": b"b" * 10, "c.jpeg": b"c" * 10}
+
+    async def download_file(key, file):
+        await asyncio.sleep(0)
+        if key not in objects:
+            return None
+        file.write(objects[key])
+        return FileInfo(size=len(objects[key]), content_type="image/jpeg", etag=f'"{key}"')
+
+    media_storage = Mock(spec_set=AsyncS3MediaStorage)
+    media_storage.download_file.side_effect = download_file
+    return media_storage
+
+
+class TestMediaCache:
+    async def test_fetch(self, tmp_path, media_storage):
+        cache = MediaCache(str(tmp_path), max_size=100)
+
+        cached_file = await cache.fetch(media_storage, "a.jpeg")
+
+        assert cached_file.etag == '"a.jpeg"'
+        assert cached_file.content_type == "image/jpeg"
+        assert Path(cached_file.path).read_bytes() == b"a" * 10
+        assert cache.get("a.jpeg") == cached_file
+        assert os.listdir(tmp_path / "tmp") == []
+
+    async def test_fetch_missing(self, tmp_path, media_storage):
+        cache = MediaCache(str(tmp_path), max_size=100)
+
+        assert await cache.fetch(media_storage, "missing.jpeg") is None
+        assert cache.size == 0
+        assert os.listdir(tmp_path / "tmp") == []
+
+    async def test_concurrent_fetches_download_once(self, tmp_path, media_storage):
+        cache = MediaCache(str(tmp_path), max_size=100)
+
+        cached_files = await asyncio.gather(*[cache.fetch(media_storage, "a.jpeg") for _ in range(5)])
+
+        assert len({cached_file.path for cached_file in cached_files}) == 1
+        media_storage.download_file.assert_called_once()
+
+    async def test_evicts_least_recently_used(self, tmp_path, media_storage):
+        cache = MediaCache(str(tmp_path), max_size=20)
+        a = await cache.fetch(media_storage, "a.jpeg")
+        await cache.fetch(media_storage, "b.jpeg")
+        cache.get("a.jpeg")
+
+        await cache.fetch(media_storage, "c.jpeg")
+
+        assert cache.get("b.jpeg") is None
+        assert cache.get("a.jpeg") == a
+        assert cache.size == 20
+
+    async def test_restores_index(self, tmp_path, media_storage):
+        cache = MediaCache(str(tmp_path), max_size=100)
+        a = await cache.fetch(media_storage, "a.jpeg")
+
+        restored = MediaCache(str(tmp_path), max_size=100)
+
+        assert restored.get("a.jpeg") == a
+        assert restored.size == 10
+
+    async def test_file_removed_by_another_process(self, tmp_path, media_storage):
+        cache = MediaCache(str(tmp_path), max_size=100)
+        a = await cache.fetch(media_storage, "a.jpeg")
+        os.remove(a.path)
+
+        assert cache.get("a.jpeg") is None
+        assert cache.size == 0
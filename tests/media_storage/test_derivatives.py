@@ -0,0 +1,49 @@
+import io
+from unittest.mock import AsyncMock, Mock
+
+from PIL import Image
+from pytest_mock import MockerFixture
+
+from publication_admin.media_storage.derivatives import ImageDerivative, create_derivatives, render_derivatives
+from publication_admin.media_storage.keys import derivative_key
+from publication_admin.media_storage.s3 import AsyncS3MediaStorage
+
+
+def jpeg(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color="red").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_derivative_key():
+    key = "pubadmin/user-content/8d1a.jpeg"
+    assert derivative_key(key, ImageDerivative.THUMBNAIL) == "pubadmin/user-content/8d1a.thumbnail.jpeg"
+
+
+def test_render_derivatives_keeps_aspect_ratio():
+    derivatives = render_derivatives(jpeg(2000, 1000), {"thumbnail": 320, "training": 1024}, quality=85)
+
+    sizes = {name: Image.open(io.BytesIO(content)).size for name, content in derivatives.items()}
+    assert sizes == {"thumbnail": (320, 160), "training": (1024, 512)}
+
+
+def test_render_derivatives_does_not_upscale():
+    derivatives = render_derivatives(jpeg(200, 100), {"thumbnail": 320}, quality=85)
+    assert Image.open(io.BytesIO(derivatives["thumbnail"])).size == (200, 100)
+
+
+async def test_create_derivatives(mocker: MockerFixture):
+    # Render in the current process, the pool is exercised by the running app
+    mocker.patch("publication_admin.media_storage.derivatives.get_derivatives_executor").return_value = None
+    media_storage = Mock(spec_set=AsyncS3MediaStorage)
+    media_storage.get_file = AsyncMock(return_value=jpeg(2000, 1000))
+    media_storage.upload_file = AsyncMock()
+
+    derivatives = await create_derivatives(media_storage, "pubadmin/user-content/8d1a.jpeg")
+
+    assert set(derivatives) == {ImageDerivative.THUMBNAIL, ImageDerivative.TRAINING}
+    uploaded_keys = {call.args[0] for call in media_storage.upload_file.call_args_list}
+    assert uploaded_keys == {
+        "pubadmin/user-content/8d1a.thumbnail.jpeg",
+        "pubadmin/user-content/8d1a.training.jpeg",
+    }
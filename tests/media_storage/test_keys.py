@@ -0,0 +1,18 @@
+import hashlib
+import io
+
+from publication_admin.media_storage.keys import file_sha256, is_user_content_key, new_content_key
+
+
+def test_file_sha256_rewinds_file():
+    file = io.BytesIO(b"x" * 3000)
+    file.seek(100)
+
+    assert file_sha256(file, chunk_size=1024) == hashlib.sha256(b"x" * 3000).hexdigest()
+    assert file.tell() == 0
+
+
+def test_content_key_is_user_content():
+    sha256 = hashlib.sha256(b"image").hexdigest()
+    assert new_content_key(sha256) == new_content_key(sha256)
+    assert is_user_content_key(new_content_key(sha256))
@@ -0,0 +1,115 @@
+import io
+import os
+
+import pytest
+from pydantic import ValidationError
+
+from publication_admin.media_storage.base import MediaStorageError, UploadError
+from publication_admin.media_storage.local import LocalMediaStorage
+from publication_admin.settings import MediaStorageSettings
+
+
+@pytest.fixture
+def storage(tmp_path) -> LocalMediaStorage:
+    return LocalMediaStorage(str(tmp_path))
+
+
+class TestLocalMediaStorage:
+    async def test_upload_file(self, storage):
+        await storage.upload_file("user_content/a.jpeg", io.BytesIO(b"image data"), "image/jpeg")
+
+        file_info = await storage.head_file("user_content/a.jpeg")
+        assert file_info.size == 10
+        assert file_info.content_type == "image/jpeg"
+        assert file_info.etag == '"e09a574ca3760a3e28a3e5920fe4627e"'
+        assert await storage.get_file("user_content/a.jpeg") == b"image data"
+        assert os.listdir(os.path.join(storage.directory, "tmp")) == []
+
+    async def test_sharded_paths(self, storage):
+        path = storage.file_path("user_content/a.jpeg")
+
+        assert path.startswith(os.path.join(storage.directory, "objects"))
+        assert os.path.relpath(path, storage.directory).count(os.sep) == 3
+
+    async def test_missing_file(self, storage):
+        assert await storage.head_file("missing.jpeg") is None
+        assert await storage.download_file("missing.jpeg", io.BytesIO()) is None
+        with pytest.raises(MediaStorageError):
+            await storage.get_file("missing.jpeg")
+
+    async def test_upload_stream_in_parts(self, storage):
+        async def chunks():
+            for chunk in (b"a" * 7, b"b" * 7, b"c" * 3):
+                yield chunk
+
+        size = await storage.upload_stream("stream.jpeg", chunks(), "image/jpeg", part_size=5)
+
+        assert size == 17
+        assert await storage.get_file("stream.jpeg") == b"a" * 7 + b"b" * 7 + b"c" * 3
+        assert (await storage.head_file("stream.jpeg")).content_type == "image/jpeg"
+        assert os.listdir(os.path.join(storage.directory, "uploads")) == []
+
+    async def test_abort_multipart_upload(self, storage):
+        upload_id = await storage.create_multipart_upload("a.jpeg")
+        await storage.upload_part("a.jpeg", upload_id, 1, b"part")
+
+        await storage.abort_multipart_upload("a.jpeg", upload_id)
+
+        assert os.listdir(os.path.join(storage.directory, "uploads")) == []
+        with pytest.raises(UploadError):
+            await storage.upload_part("a.jpeg", upload_id, 2, b"part")
+
+    async def test_complete_with_missing_parts(self, storage):
+        upload_id = await storage.create_multipart_upload("a.jpeg")
+        await storage.upload_part("a.jpeg", upload_id, 1, b"part")
+
+        with pytest.raises(UploadError):
+            await storage.complete_multipart_upload("a.jpeg", upload_id, ['"1"', '"2"'])
+        assert await storage.head_file("a.jpeg") is None
+
+    async def test_stream_file_range(self, storage):
+        await storage.upload_file("a.jpeg", io.BytesIO(bytes(range(100))))
+
+        chunks = [chunk async for chunk in storage.stream_file("a.jpeg", 10, 59, chunk_size=16)]
+
+        assert b"".join(chunks) == bytes(range(10, 60))
+
+    async def test_iter_files(self, storage):
+        await storage.upload_file("a.jpeg", io.BytesIO(b"aaa"))
+        await storage.upload_file("b.jpeg", io.BytesIO(b"bb"))
+
+        files = {
+            filename: b"".join([chunk async for chunk in contents])
+            async for filename, _, contents in storage.iter_files(
+                ["b.jpeg", "missing.jpeg", "a.jpeg"], concurrency=2, chunks_ahead=2
+            )
+        }
+
+        assert files == {"b.jpeg": b"bb", "a.jpeg": b"aaa"}
+
+    async def test_delete_files(self, storage):
+        await storage.upload_file("a.jpeg", io.BytesIO(b"a"))
+        await storage.upload_file("b.jpeg", io.BytesIO(b"b"))
+
+        await storage.delete_files(["a.jpeg", "b.jpeg", "missing.jpeg"])
+
+        assert await storage.head_file("a.jpeg") is None
+        assert not os.path.exists(storage.file_path("b.jpeg"))
+
+    def test_presigned_uploads_not_supported(self, storage):
+        with pytest.raises(MediaStorageError):
+            storage.generate_presigned_put("a.jpeg", "image/jpeg", 10, 60)
+
+
+def test_settings_without_s3():
+    media_storage_settings = MediaStorageSettings(
+        media_storage_backend="local",
+        media_storage_url=None,
+        media_storage_access_key_id=None,
+        media_storage_secret_access_key=None,
+        media_storage_bucket=None,
+    )
+    assert media_storage_settings.media_storage_bucket is None
+
+    with pytest.raises(ValidationError, match="media_storage_url, media_storage_bucket"):
+        MediaStorageSettings(media_storage_backend="s3", media_storage_url=None, media_storage_bucket=None)
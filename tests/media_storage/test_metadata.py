@@ -0,0 +1,61 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from publication_admin.media_storage.base import FileInfo
+from publication_admin.media_storage.metadata import FileInfoCache
+from publication_admin.media_storage.s3 import AsyncS3MediaStorage
+
+
+@pytest.fixture
+def media_storage():
+    in_flight = []
+
+    async def head_file(key):
+        in_flight.append(key)
+        media_storage.max_in_flight = max(getattr(media_storage, "max_in_flight", 0), len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(key)
+        return None if key.startswith("missing") else FileInfo(size=1, content_type="image/jpeg", etag=f'"{key}"')
+
+    media_storage = Mock(spec=AsyncS3MediaStorage)
+    media_storage.head_file.side_effect = head_file
+    return media_storage
+
+
+class TestFileInfoCache:
+    async def test_bounded_concurrency(self, media_storage):
+        keys = [f"{number}.jpeg" for number in range(10)]
+
+        file_infos = await FileInfoCache(max_size=100, ttl=60).head_files(media_storage, keys, concurrency=3)
+
+        assert [file_info.etag for file_info in file_infos.values()] == [f'"{key}"' for key in keys]
+        assert media_storage.max_in_flight == 3
+
+    async def test_caches_existing_files(self, media_storage):
+        cache = FileInfoCache(max_size=100, ttl=60)
+        await cache.head_files(media_storage, ["a.jpeg", "missing.jpeg", "a.jpeg"], concurrency=3)
+
+        file_infos = await cache.head_files(media_storage, ["a.jpeg", "missing.jpeg"], concurrency=3)
+
+        assert file_infos["missing.jpeg"] is None
+        assert [call.args[0] for call in media_storage.head_file.call_args_list] == [
+            "a.jpeg",
+            "missing.jpeg",
+            "missing.jpeg",
+        ]
+
+    async def test_entries_expire(self, media_storage):
+        cache = FileInfoCache(max_size=100, ttl=0)
+        await cache.head_files(media_storage, ["a.jpeg"], concurrency=1)
+
+        assert cache.get("a.jpeg") is None
+
+    def test_bounded_size(self):
+        cache = FileInfoCache(max_size=2, ttl=60)
+        for key in ("a.jpeg", "b.jpeg", "c.jpeg"):
+            cache.put(key, FileInfo(size=1, content_type=None, etag='"etag"'))
+
+        assert cache.get("a.jpeg") is None
+        assert cache.get("c.jpeg") is not None
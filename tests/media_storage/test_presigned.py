@@ -0,0 +1,59 @@
+from unittest.mock import Mock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from publication_admin.media_storage.presigned import PresignedURLCache
+from publication_admin.media_storage.s3 import S3MediaStorage
+
+
+@pytest.fixture
+def storage():
+    storage = Mock(spec_set=S3MediaStorage)
+    storage.generate_presigned_get.side_effect = (
+        lambda key, expires_in: f"https://s3/{key}?sig={storage.generate_presigned_get.call_count}"
+    )
+    return storage
+
+
+@pytest.fixture
+def now(mocker: MockerFixture):
+    return mocker.patch("publication_admin.media_storage.presigned.time.time", return_value=1000.0)
+
+
+class TestPresignedURLCache:
+    def test_reuses_signature(self, storage, now):
+        cache = PresignedURLCache(storage, expires_in=3600, renew_before=600)
+
+        assert cache.get("a.jpeg") == cache.get("a.jpeg")
+        storage.generate_presigned_get.assert_called_once_with("a.jpeg", 3600)
+
+    def test_renews_before_expiry(self, storage, now):
+        cache = PresignedURLCache(storage, expires_in=3600, renew_before=600)
+        cache.get("a.jpeg")
+
+        now.return_value += 2999
+        assert cache.get("a.jpeg") == "https://s3/a.jpeg?sig=1"
+        now.return_value += 1
+        assert cache.get("a.jpeg") == "https://s3/a.jpeg?sig=2"
+
+    def test_bounded(self, storage, now):
+        cache = PresignedURLCache(storage, expires_in=3600, renew_before=600, max_size=2)
+        cache.get("a.jpeg")
+        cache.get("b.jpeg")
+        cache.get("a.jpeg")
+
+        cache.get("c.jpeg")
+        cache.get("a.jpeg")
+        cache.get("b.jpeg")
+
+        assert [call.args[0] for call in storage.generate_presigned_get.call_args_list] == [
+            "a.jpeg",
+            "b.jpeg",
+            "c.jpeg",
+            "b.jpeg",
+        ]
+
+    def test_renew_before_expiry_required(self, storage):
+        with pytest.raises(ValueError):
+            PresignedURLCache(storage, expires_in=600, renew_before=600)
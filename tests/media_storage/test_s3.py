@@ -0,0 +1,189 @@
+import asyncio
+import io
+import threading
+from unittest.mock import Mock
+
+import pytest
+from prometheus_client import REGISTRY
+from pytest_mock import MockerFixture
+
+from publication_admin.media_storage.backends import get_media_storage
+from publication_admin.media_storage.base import FileInfo, MediaStorageError, UploadError
+from publication_admin.media_storage.s3 import AsyncS3MediaStorage, S3MediaStorage, create_s3_client, get_s3_client
+
+
+class TestAsyncS3MediaStorage:
+    async def test_upload_file_off_event_loop(self):
+        upload_threads = []
+        storage = Mock(spec_set=S3MediaStorage)
+        storage.upload_file.side_effect = lambda *args, **kwargs: upload_threads.append(threading.current_thread())
+        content = io.BytesIO(b"image data")
+
+        await AsyncS3MediaStorage(storage).upload_file("key.jpeg", content)
+
+        storage.upload_file.assert_called_once_with("key.jpeg", content, None)
+        assert upload_threads[0] is not threading.current_thread()
+
+    async def test_upload_error(self):
+        storage = Mock(spec_set=S3MediaStorage)
+        storage.upload_file.side_effect = UploadError("boom")
+
+        with pytest.raises(UploadError):
+            await AsyncS3MediaStorage(storage).upload_file("key.jpeg", io.BytesIO(b""))
+
+    async def test_latency_metric(self):
+        labels = {"operation": "head_file"}
+        before = REGISTRY.get_sample_value("s3_request_duration_seconds_count", labels) or 0
+        storage = Mock(spec_set=S3MediaStorage)
+        storage.head_file.__name__ = "head_file"
+
+        await AsyncS3MediaStorage(storage).head_file("key.jpeg")
+
+        assert REGISTRY.get_sample_value("s3_request_duration_seconds_count", labels) == before + 1
+
+
+def test_uploaded_bytes_metric(mocker: MockerFixture):
+    mocker.patch("publication_admin.media_storage.s3.settings.media_storage.media_storage_url", "http://localhost:9000")
+    before = REGISTRY.get_sample_value("s3_uploaded_bytes_total") or 0
+    client = create_s3_client()
+
+    for operation in ("PutObject", "UploadPart", "HeadObject"):
+        client.meta.events.emit(f"before-send.s3.{operation}", request=Mock(headers={"Content-Length": "100"}))
+
+    assert REGISTRY.get_sample_value("s3_uploaded_bytes_total") == before + 200
+
+
+class TestUploadStream:
+    async def chunks(self, *chunks: bytes):
+        for chunk in chunks:
+            yield chunk
+
+    async def test_small_stream_single_put(self):
+        storage = Mock(spec_set=S3MediaStorage)
+
+        size = await AsyncS3MediaStorage(storage).upload_stream(
+            "key.jpeg", self.chunks(b"ab", b"cd"), content_type="image/jpeg", part_size=10
+        )
+
+        assert size == 4
+        storage.create_multipart_upload.assert_not_called()
+        filename, content, content_type = storage.upload_file.call_args.args
+        assert (filename, content.read(), content_type) == ("key.jpeg", b"abcd", "image/jpeg")
+
+    async def test_multipart_upload(self):
+        storage = Mock(spec_set=S3MediaStorage)
+        storage.create_multipart_upload.return_value = "upload-id"
+        storage.upload_part.side_effect = lambda filename, upload_id, number, content: f"etag-{number}"
+
+        size = await AsyncS3MediaStorage(storage).upload_stream(
+            "key.jpeg", self.chunks(b"abc", b"defgh", b"ij"), part_size=4
+        )
+
+        assert size == 10
+        assert [call.args[2:] for call in storage.upload_part.call_args_list] == [
+            (1, b"abcd"),
+            (2, b"efgh"),
+            (3, b"ij"),
+        ]
+        storage.complete_multipart_upload.assert_called_once_with(
+            "key.jpeg", "upload-id", ["etag-1", "etag-2", "etag-3"]
+        )
+        storage.upload_file.assert_not_called()
+
+    async def test_abort_multipart_upload_on_stream_error(self):
+        storage = Mock(spec_set=S3MediaStorage)
+        storage.create_multipart_upload.return_value = "upload-id"
+
+        async def failing_chunks():
+            yield b"abcdef"
+            raise ValueError("invalid stream")
+
+        with pytest.raises(ValueError):
+            await AsyncS3MediaStorage(storage).upload_stream("key.jpeg", failing_chunks(), part_size=4)
+
+        storage.abort_multipart_upload.assert_called_once_with("key.jpeg", "upload-id")
+        storage.complete_multipart_upload.assert_not_called()
+
+
+class TestDeleteFiles:
+    def test_batches_keys(self):
+        client = Mock()
+        client.delete_objects.return_value = {}
+        keys = [f"key-{i}.jpeg" for i in range(2500)]
+
+        S3MediaStorage(client).delete_files(keys)
+
+        batches = [call.kwargs["Delete"]["Objects"] for call in client.delete_objects.call_args_list]
+        assert [len(batch) for batch in batches] == [1000, 1000, 500]
+        assert [item["Key"] for batch in batches for item in batch] == keys
+
+    def test_raises_on_failed_keys(self):
+        client = Mock()
+        client.delete_objects.return_value = {"Errors": [{"Key": "key.jpeg", "Code": "AccessDenied"}]}
+
+        with pytest.raises(MediaStorageError):
+            S3MediaStorage(client).delete_files(["key.jpeg"])
+
+
+class TestIterFiles:
+    files = {"a.jpeg": b"a" * 25, "b.jpeg": b"b" * 10, "c.jpeg": b"c" * 5}
+
+    @pytest.fixture
+    def opened(self) -> list[str]:
+        return []
+
+    @pytest.fixture
+    def storage(self, opened):
+        storage = Mock(spec_set=S3MediaStorage)
+
+        def open_file(filename):
+            if filename not in self.files:
+                return None
+            opened.append(filename)
+            content = self.files[filename]
+            return FileInfo(size=len(content), content_type="image/jpeg", etag='"etag"'), io.BytesIO(content)
+
+        storage.open_file.side_effect = open_file
+        return storage
+
+    async def read_all(self, files):
+        return {filename: b"".join([chunk async for chunk in contents]) async for filename, _, contents in files}
+
+    async def test_files_in_order(self, storage):
+        media_storage = AsyncS3MediaStorage(storage)
+
+        files = media_storage.iter_files(["c.jpeg", "missing.jpeg", "a.jpeg", "b.jpeg"], concurrency=2, chunks_ahead=2)
+
+        contents = await self.read_all(files)
+        assert list(contents) == ["c.jpeg", "a.jpeg", "b.jpeg"]
+        assert contents == {filename: self.files[filename] for filename in contents}
+
+    async def test_bounded_read_ahead(self, storage, opened):
+        media_storage = AsyncS3MediaStorage(storage)
+        files = media_storage.iter_files(list(self.files), concurrency=2, chunks_ahead=1, chunk_size=5)
+
+        filename, _, contents = await anext(files)
+        await asyncio.sleep(0.1)
+
+        assert filename == "a.jpeg"
+        assert opened == ["a.jpeg", "b.jpeg"]
+        await files.aclose()
+
+    async def test_read_error(self, storage):
+        storage.open_file.side_effect = MediaStorageError("boom")
+
+        with pytest.raises(MediaStorageError):
+            await self.read_all(AsyncS3MediaStorage(storage).iter_files(["a.jpeg"], concurrency=2, chunks_ahead=2))
+
+
+def test_media_storage_shares_s3_client(mocker: MockerFixture):
+    create_s3_client_mock = mocker.patch("publication_admin.media_storage.s3.create_s3_client")
+    get_s3_client.cache_clear()
+    get_media_storage.cache_clear()
+
+    assert get_media_storage() is get_media_storage()
+    assert AsyncS3MediaStorage().storage.client is get_media_storage().storage.client
+    create_s3_client_mock.assert_called_once()
+
+    get_s3_client.cache_clear()
+    get_media_storage.cache_clear()
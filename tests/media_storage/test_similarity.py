@@ -0,0 +1,74 @@
+import io
+from unittest.mock import AsyncMock, Mock
+
+import numpy as np
+import pytest
+from PIL import Image, ImageEnhance, ImageFilter
+from pytest_mock import MockerFixture
+
+from publication_admin.media_storage.s3 import AsyncS3MediaStorage
+from publication_admin.media_storage.similarity import (
+    PerceptualHash,
+    find_near_duplicates,
+    hamming_distances,
+    hash_images,
+    perceptual_hash,
+)
+
+
+def random_photo(seed: int) -> Image.Image:
+    pixels = (np.random.default_rng(seed).random((60, 80, 3)) * 255).astype("uint8")
+    return Image.fromarray(pixels).resize((800, 600), Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(3))
+
+
+def jpeg(image: Image.Image, quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("method", list(PerceptualHash))
+def test_perceptual_hash_tolerates_small_changes(method: PerceptualHash):
+    photo = random_photo(seed=0)
+    hashes = np.stack(
+        [
+            perceptual_hash(jpeg(photo), method),
+            perceptual_hash(jpeg(photo, quality=40), method),
+            perceptual_hash(jpeg(ImageEnhance.Brightness(photo).enhance(1.15)), method),
+            perceptual_hash(jpeg(photo.resize((400, 300))), method),
+            perceptual_hash(jpeg(random_photo(seed=1)), method),
+        ]
+    )
+
+    distances = hamming_distances(hashes)
+    assert hashes.shape == (5, 64)
+    assert distances[0, :4].max() <= 8
+    assert distances[:4, 4].min() > 16
+
+
+def test_hamming_distances():
+    hashes = np.array([[0, 0, 0, 0], [0, 1, 1, 0], [1, 1, 1, 1]], dtype=bool)
+    assert hamming_distances(hashes).tolist() == [[0, 2, 4], [2, 0, 2], [4, 2, 0]]
+
+
+def test_find_near_duplicates_keeps_first_image():
+    hashes = np.array([[0, 0, 0, 0], [0, 0, 0, 1], [1, 1, 1, 1], [0, 0, 0, 0], [1, 1, 1, 0]], dtype=bool)
+    assert find_near_duplicates(hashes, max_distance=1) == {1: 0, 3: 0, 4: 2}
+
+
+def test_find_near_duplicates_does_not_chain():
+    # The third image only looks like the dropped second one, so it is kept
+    hashes = np.array([[0, 0, 0, 0], [0, 0, 1, 1], [1, 1, 1, 1]], dtype=bool)
+    assert find_near_duplicates(hashes, max_distance=2) == {1: 0}
+
+
+async def test_hash_images(mocker: MockerFixture):
+    mocker.patch("publication_admin.media_storage.similarity.get_derivatives_executor").return_value = None
+    contents = {"a.jpeg": jpeg(random_photo(seed=0)), "b.jpeg": jpeg(random_photo(seed=1))}
+    media_storage = Mock(spec_set=AsyncS3MediaStorage)
+    media_storage.get_file = AsyncMock(side_effect=contents.get)
+
+    hashes = await hash_images(media_storage, ["a.jpeg", "b.jpeg", "a.jpeg"])
+
+    assert hashes.shape == (3, 64)
+    assert find_near_duplicates(hashes, max_distance=0) == {2: 0}